@@ -0,0 +1,7 @@
+"""
+Benchmarks for the narrative engine.
+
+    python -m benchmarks                       # full run, writes benchmark_results.json
+    python -m benchmarks --quick               # smaller workload for a fast check
+    python -m benchmarks --baseline old.json   # flag regressions against an earlier run
+"""
@@ -0,0 +1,208 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from datetime import datetime
+from knowledge_base import KnowledgeBase
+from kb_watcher import load_config_snapshot
+from reflex_core import detect_reflex
+from classification_engine import classify_actor_from_wheel
+from geometry_resolver import resolve_geometry_state
+from reflex_taxonomy import symbolic_reflex
+from narrative_engine import modulate_tone, generate_narrative, generate_narratives, normalize_record
+from log_sink import close_log_sink
+from benchmarks.workload import SyntheticWorkload
+
+# === Constants ===
+SCHEMA_VERSION = 1
+DEFAULT_OUTPUT = "benchmark_results.json"
+DEFAULT_THRESHOLD = 0.10   # flag a benchmark when its median is 10% slower than baseline
+
+# name → (function, SyntheticWorkload case builder)
+MICRO_BENCHMARKS = {
+    "detect_reflex": (detect_reflex, "detect_reflex_cases"),
+    "classify_actor_from_wheel": (classify_actor_from_wheel, "classification_cases"),
+    "resolve_geometry_state": (resolve_geometry_state, "geometry_cases"),
+    "symbolic_reflex": (symbolic_reflex, "taxonomy_cases"),
+    "modulate_tone": (modulate_tone, "tone_cases")
+}
+
+
+# === Timing ===
+def summarize(samples, unit):
+    samples = sorted(samples)
+    return {
+        "unit": unit,
+        "median": statistics.median(samples),
+        "min": samples[0],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max": samples[-1],
+        "samples": len(samples)
+    }
+
+def time_micro(fn, cases, rounds):
+    """Per-call cost in microseconds, averaged over all cases in each round."""
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        for args in cases:
+            fn(*args)
+        per_call.append((time.perf_counter_ns() - start) / len(cases) / 1000)
+    result = summarize(per_call, "us/call")
+    result["calls_per_sec"] = round(1e6 / result["median"]) if result["median"] else None
+    return result
+
+def time_end_to_end(records, config, kb):
+    """Latency of each generate_narrative call in milliseconds, plus overall throughput."""
+    latencies = []
+    start = time.perf_counter()
+    for record in records:
+        inputs, actor, user_id, background = normalize_record(record)
+        call_start = time.perf_counter_ns()
+        generate_narrative(inputs, actor, user_id, background, config, kb=kb)
+        latencies.append((time.perf_counter_ns() - call_start) / 1e6)
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies, "ms/call")
+    result["throughput_per_sec"] = round(len(records) / elapsed, 1)
+    return result
+
+def time_batch(records, config, kb, rounds):
+    per_record = []
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        generate_narratives(records, config, kb=kb)
+        per_record.append((time.perf_counter_ns() - start) / len(records) / 1e6)
+    result = summarize(per_record, "ms/record")
+    result["throughput_per_sec"] = round(1000 / result["median"], 1) if result["median"] else None
+    return result
+
+
+# === Runner ===
+def git_commit(root):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def benchmark_config(config):
+    """Copy of the runtime config with caching, artifact compiles and generative mode off, so every call does the full work."""
+    config = dict(config)
+    config["result_cache"] = {"enabled": False}
+    config["knowledge_base"] = dict(config.get("knowledge_base") or {}, auto_compile=False)
+    config["runtime"] = dict(config.get("runtime") or {}, use_generative_ai=False)
+    return config
+
+def run_benchmarks(root=".", seed=0, cases=2000, rounds=7, records=500, only=None):
+    config, _ = load_config_snapshot(os.path.join(root, "copilot_config.yaml"))
+    config = benchmark_config(config)
+    kb = KnowledgeBase.from_config(config, root=root).warm()
+    workload = SyntheticWorkload(kb, seed=seed, headers_path=os.path.join(root, "headers.csv"))
+
+    results = {}
+    # The engine prints a warning for every unmatched input and appends session logs to
+    # the working directory; keep both out of the measurements and out of the repo.
+    scratch = tempfile.mkdtemp(prefix="narrative-bench-")
+    previous_cwd = os.getcwd()
+    os.chdir(scratch)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, (fn, builder) in MICRO_BENCHMARKS.items():
+                if only and name not in only:
+                    continue
+                results[name] = time_micro(fn, getattr(workload, builder)(cases), rounds)
+
+            sample = workload.records(records)
+            if not only or "generate_narrative" in only:
+                results["generate_narrative"] = time_end_to_end(sample, config, kb)
+            if not only or "generate_narratives" in only:
+                results["generate_narratives"] = time_batch(sample, config, kb, max(1, rounds // 2))
+            close_log_sink()
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(root),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "kb_version": kb.version,
+        "parameters": {"seed": seed, "cases": cases, "rounds": rounds, "records": records},
+        "benchmarks": results
+    }
+
+
+# === Baseline Comparison ===
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Returns one row per shared benchmark: (name, baseline median, median, ratio, regressed)."""
+    rows = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or previous.get("unit") != current["unit"] or not previous.get("median"):
+            continue
+        ratio = current["median"] / previous["median"]
+        rows.append((name, previous["median"], current["median"], ratio, ratio > 1 + threshold))
+    return rows
+
+def print_results(results, comparison=None):
+    print(f"🌀 Narrative engine benchmarks (kb {results['kb_version']}, commit {results['git_commit']})")
+    for name, stats in results["benchmarks"].items():
+        rate = stats.get("calls_per_sec") or stats.get("throughput_per_sec")
+        print(f"  • {name:<28} median {stats['median']:>10.3f} {stats['unit']:<10} p95 {stats['p95']:>10.3f}  ({rate}/s)")
+    if comparison:
+        print("📊 Against baseline:")
+        for name, before, after, ratio, regressed in comparison:
+            marker = "⚠️ REGRESSION" if regressed else "ok"
+            print(f"  • {name:<28} {before:>10.3f} → {after:>10.3f}  ×{ratio:.2f}  {marker}")
+
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the narrative engine on a seeded synthetic workload.")
+    parser.add_argument("--root", default=".", help="Repository root holding the tables and copilot_config.yaml")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown before a benchmark is flagged")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cases", type=int, default=2000, help="Calls per round for micro-benchmarks")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--records", type=int, default=500, help="Records for the end-to-end benchmarks")
+    parser.add_argument("--only", nargs="*", help="Run only these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Small workload for a fast sanity check")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.cases, args.rounds, args.records = 200, 3, 50
+
+    root = os.path.abspath(args.root)
+    results = run_benchmarks(root, args.seed, args.cases, args.rounds, args.records, args.only)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            comparison = compare(results, json.load(f), args.threshold)
+        results["baseline"] = {
+            "path": args.baseline,
+            "threshold": args.threshold,
+            "regressions": [name for name, *_, regressed in comparison if regressed]
+        }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print_results(results, comparison)
+    print(f"✅ Results written to {args.output}")
+
+    return 1 if comparison and any(row[-1] for row in comparison) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
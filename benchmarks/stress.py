@@ -0,0 +1,221 @@
+import os
+import io
+import csv
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from datetime import datetime
+from knowledge_base import KnowledgeBase, DEFAULT_MODULES, DEFAULT_GRAMMAR_PATH, DEFAULT_TRANSMISSION_PROFILE_PATH
+from kb_watcher import load_config_snapshot
+from narrative_engine import generate_narrative, normalize_record
+from log_sink import close_log_sink
+from metrics import STAGE_SECONDS
+from benchmarks.run import MICRO_BENCHMARKS, benchmark_config, git_commit, time_micro
+from benchmarks.workload import SyntheticWorkload
+
+# === Constants ===
+DEFAULT_SCALES = (1, 10, 100, 1000)
+DEFAULT_OUTPUT = "stress_results.json"
+# Columns with at most this many distinct values (colours, actors, TRUE/FALSE) are
+# categorical and copied as-is; every other column gets a per-copy suffix so the
+# scaled table has genuinely new keys, phrases and triggers.
+CATEGORICAL_LIMIT = 6
+
+
+# === Table Scaling ===
+def scale_rows(header, rows, factor):
+    """Original rows first (so existing lookups still hit), then factor-1 mutated copies."""
+    categorical = set()
+    for i in range(len(header)):
+        values = {row[i] for row in rows if i < len(row)}
+        if len(values) <= CATEGORICAL_LIMIT:
+            categorical.add(i)
+
+    scaled = [list(row) for row in rows]
+    for copy in range(1, factor):
+        for row in rows:
+            scaled.append([
+                value if i in categorical or not value.strip() else f"{value} #{copy}"
+                for i, value in enumerate(row)
+            ])
+    return scaled
+
+def scale_csv(source, target, factor):
+    with open(source, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        shutil.copyfile(source, target)
+        return 0
+    scaled = scale_rows(rows[0], rows[1:], factor)
+    with open(target, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(rows[0])
+        writer.writerows(scaled)
+    return len(scaled)
+
+def build_scaled_root(root, target, factor, config):
+    """Writes a copy of the knowledge base under target with every table scaled by factor."""
+    modules = dict(DEFAULT_MODULES)
+    modules.update({k: v for k, v in (config.get("paths", {}).get("modules") or {}).items() if k in DEFAULT_MODULES})
+    total_rows = 0
+    for folder in modules.values():
+        source_dir = os.path.join(root, folder)
+        if not os.path.isdir(source_dir):
+            continue
+        target_dir = os.path.join(target, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        for filename in sorted(os.listdir(source_dir)):
+            if filename.endswith(".csv"):
+                total_rows += scale_csv(os.path.join(source_dir, filename), os.path.join(target_dir, filename), factor)
+
+    total_rows += scale_csv(os.path.join(root, DEFAULT_TRANSMISSION_PROFILE_PATH),
+                            os.path.join(target, DEFAULT_TRANSMISSION_PROFILE_PATH), factor)
+    for filename in (DEFAULT_GRAMMAR_PATH, "headers.csv"):
+        shutil.copyfile(os.path.join(root, filename), os.path.join(target, filename))
+    return total_rows
+
+
+# === Measurements ===
+def measure_startup(config, root):
+    """Load and warm times in ms, then peak/retained memory of a second traced load in MB."""
+    start = time.perf_counter()
+    kb = KnowledgeBase.from_config(config, root=root, use_artifact=False)
+    loaded = time.perf_counter()
+    kb.warm()
+    warmed = time.perf_counter()
+
+    tracemalloc.start()
+    traced = KnowledgeBase.from_config(config, root=root, use_artifact=False).warm()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    return kb, {
+        "load_ms": round((loaded - start) * 1000, 2),
+        "warm_ms": round((warmed - loaded) * 1000, 2),
+        "retained_mb": round(retained / 2**20, 2),
+        "peak_mb": round(peak / 2**20, 2)
+    }
+
+def measure_stages(records, config, kb):
+    """Mean ms per stage span and per generate_narrative call over records."""
+    before = STAGE_SECONDS.totals()
+    start = time.perf_counter()
+    for record in records:
+        inputs, actor, user_id, background = normalize_record(record)
+        generate_narrative(inputs, actor, user_id, background, config, kb=kb)
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for (stage,), (total, count) in STAGE_SECONDS.totals().items():
+        previous_total, previous_count = before.get((stage,), (0.0, 0))
+        if count > previous_count:
+            stages[stage] = round((total - previous_total) / (count - previous_count) * 1000, 4)
+    return {"generate_narrative_ms": round(elapsed / len(records) * 1000, 4), "stages_ms": stages}
+
+def run_stress(root=".", scales=DEFAULT_SCALES, seed=0, records=200, cases=500, rounds=3):
+    config, _ = load_config_snapshot(os.path.join(root, "copilot_config.yaml"))
+    config = benchmark_config(config)
+    results = []
+
+    scratch = tempfile.mkdtemp(prefix="narrative-stress-")
+    previous_cwd = os.getcwd()
+    try:
+        for factor in scales:
+            scaled_root = os.path.join(scratch, f"x{factor}")
+            os.makedirs(scaled_root)
+            total_rows = build_scaled_root(root, scaled_root, factor, config)
+            # Session logs from the run land in the scaled copy, not the repo.
+            os.chdir(scaled_root)
+            with contextlib.redirect_stdout(io.StringIO()):
+                kb, startup = measure_startup(config, scaled_root)
+                workload = SyntheticWorkload(kb, seed=seed)
+                micro = {name: time_micro(fn, getattr(workload, builder)(cases), rounds)["median"]
+                         for name, (fn, builder) in MICRO_BENCHMARKS.items()}
+                engine = measure_stages(workload.records(records), config, kb)
+                close_log_sink()
+            os.chdir(previous_cwd)
+            shutil.rmtree(scaled_root, ignore_errors=True)
+
+            result = {"scale": factor, "rows": total_rows, "startup": startup, "micro_us": micro}
+            result.update(engine)
+            results.append(result)
+            print_scale(result)
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(root),
+        "parameters": {"scales": list(scales), "seed": seed, "records": records, "cases": cases, "rounds": rounds},
+        "results": results,
+        "growth": growth(results)
+    }
+
+
+# === Reporting ===
+def growth(results):
+    """
+    Per metric, the slope of log(time) over log(rows) between the smallest and largest
+    scale: ~0 means constant, ~1 linear, ~2 quadratic in table size.
+    """
+    if len(results) < 2:
+        return {}
+    first, last = results[0], results[-1]
+    row_ratio = math.log(last["rows"] / first["rows"])
+    series = {"startup.load_ms": ("startup", "load_ms"), "startup.warm_ms": ("startup", "warm_ms"),
+              "generate_narrative_ms": (None, "generate_narrative_ms")}
+    series.update({f"micro_us.{name}": ("micro_us", name) for name in first["micro_us"]})
+    series.update({f"stages_ms.{name}": ("stages_ms", name) for name in first["stages_ms"]})
+
+    slopes = {}
+    for label, (group, name) in series.items():
+        before = (first.get(group) or {}).get(name) if group else first.get(name)
+        after = (last.get(group) or {}).get(name) if group else last.get(name)
+        if before and after:
+            slopes[label] = round(math.log(after / before) / row_ratio, 2)
+    return slopes
+
+def print_scale(result):
+    startup = result["startup"]
+    print(f"📈 ×{result['scale']:<5} {result['rows']:>8} rows | load {startup['load_ms']:>9.1f} ms, "
+          f"warm {startup['warm_ms']:>9.1f} ms, retained {startup['retained_mb']:>7.1f} MB, "
+          f"peak {startup['peak_mb']:>7.1f} MB | narrative {result['generate_narrative_ms']:.3f} ms")
+    for stage, ms in sorted(result["stages_ms"].items(), key=lambda item: -item[1]):
+        print(f"      {stage:<22} {ms:.4f} ms")
+
+def print_growth(slopes):
+    print("📊 Growth exponent vs table size (0 constant, 1 linear, 2 quadratic):")
+    for label, slope in sorted(slopes.items(), key=lambda item: -item[1]):
+        marker = "  ⚠️" if slope >= 0.5 else ""
+        print(f"  • {label:<40} {slope:>5.2f}{marker}")
+
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the engine against knowledge bases scaled 10×, 100×, 1000×.")
+    parser.add_argument("--root", default=".", help="Repository root holding the tables and copilot_config.yaml")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--records", type=int, default=200, help="generate_narrative calls per scale")
+    parser.add_argument("--cases", type=int, default=500, help="Calls per round for micro-benchmarks")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = run_stress(os.path.abspath(args.root), sorted(args.scales), args.seed, args.records, args.cases, args.rounds)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print_growth(results["growth"])
+    print(f"✅ Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import csv
+import random
+from knowledge_base import (
+    TRANSMISSION_MAP, WHEEL_CODEX, WHEEL_LAYERS, LINGUISTIC_REFRAME_MAP,
+    ARCHETYPE_CLASSIFICATION, REFLEX_TAXONOMY
+)
+
+# === Constants ===
+HEADERS_PATH = "headers.csv"
+VOICE_FIELDS = 4
+BACKGROUND_FIELDS = 5
+# Tokens that exist in no table, so every benchmark also exercises its miss path.
+UNKNOWN_TOKENS = ["grey", "static", "unsure", "somewhere", "whatever"]
+
+
+# === Header Fields ===
+def load_fields(headers_path=HEADERS_PATH):
+    """Returns {"voice_input": [labels], "background": [labels]} in field order."""
+    fields = {"voice_input": [], "background": []}
+    try:
+        with open(headers_path, encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                fields.setdefault(row["Input_file"].strip(), []).append(row["Label"].strip())
+    except OSError as e:
+        print(f"⚠️ Could not load {headers_path}: {e}")
+    fields["voice_input"] += [f"Voice Input {i + 1}" for i in range(len(fields["voice_input"]), VOICE_FIELDS)]
+    fields["background"] += [f"Background Input {i + 1}" for i in range(len(fields["background"]), BACKGROUND_FIELDS)]
+    return fields
+
+def label_fragments(label):
+    """Splits a header label into short phrases ("at home", "dinner", ...) usable as filler."""
+    for mark in "()?:":
+        label = label.replace(mark, ",")
+    parts = [part.replace("e.g.", "").replace("or ", "").strip() for part in label.split(",")]
+    return [part for part in parts if part]
+
+
+# === Vocabulary ===
+def column_values(kb, table, column):
+    values = []
+    for row in kb.rows(table):
+        value = (row.get(column) or "").strip()
+        if value and value.lower() != "none" and value not in values:
+            values.append(value)
+    return values
+
+
+# === Synthetic Workload ===
+class SyntheticWorkload:
+    """
+    Seeded generator of realistic engine inputs. Voice fields mix trigger phrases
+    from the codex, transmission and reframe tables with filler from headers.csv;
+    background fields carry wheel colours and the centre field an actor wheel state.
+    miss_rate is the share of values drawn from UNKNOWN_TOKENS instead.
+    """
+
+    def __init__(self, kb, seed=0, headers_path=HEADERS_PATH, miss_rate=0.2):
+        self.kb = kb
+        self.random = random.Random(seed)
+        self.miss_rate = miss_rate
+        self.fields = load_fields(headers_path)
+
+        self.phrases = (
+            column_values(kb, WHEEL_CODEX, "notes")
+            + column_values(kb, WHEEL_CODEX, "rupture_trigger")
+            + column_values(kb, TRANSMISSION_MAP, "reflex_type")
+            + [p.replace("…", "").replace("...", "").strip() for p in column_values(kb, LINGUISTIC_REFRAME_MAP, "phrase")]
+        )
+        self.colours = column_values(kb, WHEEL_CODEX, "color") + [
+            c for c in column_values(kb, WHEEL_LAYERS, "color") if c not in column_values(kb, WHEEL_CODEX, "color")
+        ]
+        self.wheel_states = column_values(kb, TRANSMISSION_MAP, "reflex_wheel_state") + [
+            state for state in kb.grammar if state not in column_values(kb, TRANSMISSION_MAP, "reflex_wheel_state")
+        ]
+        self.actors = column_values(kb, ARCHETYPE_CLASSIFICATION, "actor") + ["Male", "Female"]
+        self.actor_wheel_states = column_values(kb, ARCHETYPE_CLASSIFICATION, "actor_wheel_state")
+        self.reflex_types = column_values(kb, ARCHETYPE_CLASSIFICATION, "reflex_type")
+        self.mismatch_types = column_values(kb, REFLEX_TAXONOMY, "Mismatch_Type")
+        self.archetypes = column_values(kb, REFLEX_TAXONOMY, "Reflex_Archetype")
+        self.variants = column_values(kb, ARCHETYPE_CLASSIFICATION, "archetype_variant")
+
+    def pick(self, values):
+        if not values or self.random.random() < self.miss_rate:
+            return self.random.choice(UNKNOWN_TOKENS)
+        return self.random.choice(values)
+
+    def sentence(self, label):
+        filler = label_fragments(label) or [label]
+        words = [self.pick(self.phrases) for _ in range(self.random.randint(1, 3))]
+        words.insert(self.random.randint(0, len(words)), self.random.choice(filler))
+        return ", ".join(words)
+
+    # === Records ===
+    def record(self, index=0):
+        voice = [self.sentence(label) for label in self.fields["voice_input"][:VOICE_FIELDS]]
+        background = [self.pick(self.colours) for _ in range(BACKGROUND_FIELDS - 1)]
+        background.append(self.pick(self.actor_wheel_states))
+        return {
+            "inputs": voice + background,
+            "actor": self.pick(self.actors),
+            "user_id": f"user_{index % 50:03d}",
+            "background": ""
+        }
+
+    def records(self, count):
+        return [self.record(i) for i in range(count)]
+
+    # === Micro-Benchmark Cases ===
+    def detect_reflex_cases(self, count):
+        return [(self.pick(self.wheel_states), self.sentence(self.random.choice(self.fields["voice_input"])), self.kb)
+                for _ in range(count)]
+
+    def classification_cases(self, count):
+        return [(self.pick(self.actors), self.pick(self.actor_wheel_states), self.pick(self.reflex_types), self.kb)
+                for _ in range(count)]
+
+    def geometry_cases(self, count):
+        return [({domain: self.pick(self.colours) for domain in ("blue", "red", "yellow", "green", "centre")}, self.kb)
+                for _ in range(count)]
+
+    def taxonomy_cases(self, count):
+        return [(self.pick(self.mismatch_types), self.pick(self.archetypes), self.kb) for _ in range(count)]
+
+    def tone_cases(self, count):
+        alerts = ["stable", "polarity inversion", None]
+        return [(self.pick(self.wheel_states), self.kb.grammar, self.pick(self.variants), self.random.choice(alerts))
+                for _ in range(count)]
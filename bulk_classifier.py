@@ -0,0 +1,166 @@
+import sys
+import csv
+import time
+import argparse
+from classification_engine import UNCLASSIFIED, get_classification_lookup
+
+# === Optional Vectorized Backend ===
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+# === Columns ===
+INPUT_COLUMNS = ("actor", "actor_wheel_state", "reflex_type")
+OUTPUT_COLUMNS = ("class_code", "archetype_variant", "containment_required", "progressive")
+DEFAULT_CHUNK_ROWS = 100000
+
+
+# === Bulk Classifier ===
+class BulkClassifier:
+    """
+    classify_actor_from_wheel for whole columns at once. The classification table
+    is integer-encoded per key column. Input columns are factorized (np.unique for
+    numpy string arrays, one dict probe per value otherwise), normalized once per
+    distinct value, encoded with searchsorted and resolved against the table's
+    sorted combined keys with array operations.
+    Without numpy the same columns are resolved row by row through the lookup.
+    """
+
+    def __init__(self, kb):
+        self.lookup = get_classification_lookup(kb)
+        if not numpy_available:
+            return
+        # The lookup already holds the first row per normalized key, in table order.
+        keys = list(self.lookup)
+        results = [self.lookup[key] for key in keys] + [UNCLASSIFIED]
+        self.vocabularies = [np.unique(np.array([key[i] for key in keys] or [""], dtype=str)) for i in range(3)]
+        codes = [np.searchsorted(vocabulary, np.array([key[i] for key in keys], dtype=str))
+                 for i, vocabulary in enumerate(self.vocabularies)]
+        combined = self._combine(codes) if keys else np.zeros(0, dtype=np.int64)
+        order = np.argsort(combined, kind="stable")
+        self.table_keys = combined[order]
+        self.table_rows = order
+        # Row len(keys) is the UNCLASSIFIED fallback.
+        self.outputs = {column: np.array([result[column] for result in results],
+                                         dtype=bool if column in ("containment_required", "progressive") else object)
+                        for column in OUTPUT_COLUMNS}
+
+    def _combine(self, codes):
+        sizes = [len(vocabulary) for vocabulary in self.vocabularies]
+        return (codes[0].astype(np.int64) * sizes[1] + codes[1]) * sizes[2] + codes[2]
+
+    def _encode(self, values, i, normalize):
+        """Vocabulary codes of one input column; -1 where the value is not in the table."""
+        # Factorize first: each distinct raw value is normalized and looked up once.
+        if isinstance(values, np.ndarray) and values.dtype.kind == "U":
+            distinct, inverse = np.unique(values, return_inverse=True)
+            distinct, inverse = distinct.tolist(), inverse.reshape(-1)
+        else:
+            distinct = {}
+            inverse = np.fromiter((distinct.setdefault(value, len(distinct)) for value in values),
+                                  dtype=np.int64, count=len(values))
+        normalized = np.array([normalize(str(value)) for value in distinct] or [""], dtype=str)
+        vocabulary = self.vocabularies[i]
+        positions = np.searchsorted(vocabulary, normalized)
+        found = positions < len(vocabulary)
+        found[found] = vocabulary[positions[found]] == normalized[found]
+        codes = np.where(found, positions, -1)
+        return codes[inverse]
+
+    # === Classification ===
+    def classify(self, actor, actor_wheel_state, reflex_type):
+        """
+        Columnar classification: three equally long sequences in, {output column: array}
+        out (plain lists without numpy). Unmatched rows get the UNCLASSIFIED values.
+        """
+        if not numpy_available:
+            return self._classify_rows(actor, actor_wheel_state, reflex_type)
+        normalizers = (lambda v: v.strip().upper(), lambda v: v.strip().lower(), lambda v: v.strip().lower())
+        codes = [self._encode(values, i, normalize)
+                 for i, (values, normalize) in enumerate(zip((actor, actor_wheel_state, reflex_type), normalizers))]
+        known = (codes[0] >= 0) & (codes[1] >= 0) & (codes[2] >= 0)
+        combined = self._combine([np.maximum(code, 0) for code in codes])
+        positions = np.searchsorted(self.table_keys, combined)
+        positions = np.minimum(positions, max(len(self.table_keys) - 1, 0))
+        if len(self.table_keys):
+            known &= self.table_keys[positions] == combined
+            rows = np.where(known, self.table_rows[positions], len(self.table_rows))
+        else:
+            rows = np.full(len(combined), 0)
+        return {column: values[rows] for column, values in self.outputs.items()}
+
+    def _classify_rows(self, actor, actor_wheel_state, reflex_type):
+        outputs = {column: [] for column in OUTPUT_COLUMNS}
+        for key in zip(actor, actor_wheel_state, reflex_type):
+            result = self.lookup.get((key[0].strip().upper(), key[1].strip().lower(), key[2].strip().lower()), UNCLASSIFIED)
+            for column in OUTPUT_COLUMNS:
+                outputs[column].append(result[column])
+        return outputs
+
+    def classify_columns(self, columns):
+        """classify() for {"actor": ..., "actor_wheel_state": ..., "reflex_type": ...}, e.g. a DataFrame."""
+        return self.classify(*(columns[column] for column in INPUT_COLUMNS))
+
+
+# === CSV Files ===
+def classify_csv(classifier, source, output, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Streams a CSV with actor, actor_wheel_state and reflex_type columns (e.g. the
+    session log) into output with the four classification columns filled in,
+    chunk_rows rows at a time. Returns the number of rows written.
+    """
+    with open(source, encoding="utf-8-sig", newline="") as f_in, open(output, "w", encoding="utf-8", newline="") as f_out:
+        reader = csv.reader(f_in)
+        header = next(reader, None)
+        if header is None:
+            return 0
+        missing = [column for column in INPUT_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"{source} has no {', '.join(missing)} column")
+        header = header + [column for column in OUTPUT_COLUMNS if column not in header]
+        inputs = [header.index(column) for column in INPUT_COLUMNS]
+        outputs = [header.index(column) for column in OUTPUT_COLUMNS]
+        writer = csv.writer(f_out)
+        writer.writerow(header)
+        total = 0
+        while True:
+            rows = [row for _, row in zip(range(chunk_rows), reader)]
+            if not rows:
+                break
+            chunk = [row + [""] * (len(header) - len(row)) for row in rows if row]
+            result = classifier.classify(*([row[i] for row in chunk] for i in inputs))
+            for i, column in zip(outputs, OUTPUT_COLUMNS):
+                values = result[column]
+                values = values.tolist() if numpy_available else values
+                for row, value in zip(chunk, values):
+                    row[i] = value
+            writer.writerows(chunk)
+            total += len(chunk)
+    return total
+
+
+# === CLI ===
+def main(argv=None):
+    from knowledge_base import KnowledgeBase
+    from kb_watcher import load_config_snapshot
+
+    parser = argparse.ArgumentParser(description="Classify every (actor, actor_wheel_state, reflex_type) row of a CSV.")
+    parser.add_argument("source", help="CSV with actor, actor_wheel_state and reflex_type columns")
+    parser.add_argument("output", help="CSV to write, with the classification columns filled in")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--config", default="copilot_config.yaml")
+    parser.add_argument("--root", default=".")
+    args = parser.parse_args(argv)
+
+    config, _ = load_config_snapshot(args.config)
+    classifier = BulkClassifier(KnowledgeBase.from_config(config, root=args.root))
+    started = time.perf_counter()
+    total = classify_csv(classifier, args.source, args.output, args.chunk_rows)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Classified {total} rows into {args.output} in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
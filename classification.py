@@ -1,7 +1,8 @@
 import datetime
-import csv
 import json
 from classification_engine import classify_actor_from_wheel
+from knowledge_base import get_knowledge_base
+from log_sink import get_log_sink
 
 # === Configuration ===
 MODEL_CONFIG = {
@@ -17,8 +18,7 @@ CLASSIFICATION_CONFIG = {
     "fallback_label": "N/A",
     "user_tracking": True,
     "session_label_format": "%a %b %d, %Y (%H:%M)",
-    "label_prefix": "Generated on",
-    "classification_path": "classification/archetype_classification.csv"
+    "label_prefix": "Generated on"
 }
 
 STORYLINE_CONFIG = {
@@ -58,22 +58,20 @@ def write_classification_output(actor, actor_wheel_state, reflex_type, result):
         "TRUE" if result["progressive"] else "FALSE"
     ]
 
-    try:
-        with open(CLASSIFICATION_CONFIG["output_file"], "a", newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(row)
-    except Exception as e:
-        print(f"⚠️ Failed to write classification output: {e}")
+    get_log_sink().write_row(CLASSIFICATION_CONFIG["output_file"], row)
 
 # === Classification Wrapper ===
-def classify_and_embed(actor, actor_wheel_state, reflex_type):
+def classify_and_embed(actor, actor_wheel_state, reflex_type, kb=None):
     result = classify_actor_from_wheel(
         actor,
         actor_wheel_state,
         reflex_type,
-        CLASSIFICATION_CONFIG["classification_path"]
+        kb or get_knowledge_base()
     )
+    return embed_classification(actor, actor_wheel_state, reflex_type, result)
 
+def embed_classification(actor, actor_wheel_state, reflex_type, result):
+    """Logs an already computed classification and returns the fields embedded in the story."""
     if STORYLINE_CONFIG["include_classification"]:
         embed = {
             "class_code": result["class_code"],
@@ -88,8 +86,8 @@ def classify_and_embed(actor, actor_wheel_state, reflex_type):
     return embed
 
 # === Story Generator ===
-def generate_story(actor, actor_wheel_state, reflex_type, input_text):
-    classification_data = classify_and_embed(actor, actor_wheel_state, reflex_type)
+def generate_story(actor, actor_wheel_state, reflex_type, input_text, kb=None):
+    classification_data = classify_and_embed(actor, actor_wheel_state, reflex_type, kb)
 
     prompt = f"{MODEL_CONFIG['system_prompt']}\n\nInput: {input_text}\n\n"
     prompt += f"Classification: {classification_data['class_code']} ({classification_data['archetype_variant']})\n"
@@ -109,10 +107,6 @@ def generate_story(actor, actor_wheel_state, reflex_type, input_text):
             "classification": classification_data,
             "story": story_output
         }
-        try:
-            with open(LOGGING_CONFIG["log_file"], "a", encoding='utf-8') as log:
-                log.write(json.dumps(log_entry) + "\n")
-        except Exception as e:
-            print(f"⚠️ Logging failed: {e}")
+        get_log_sink().write_line(LOGGING_CONFIG["log_file"], json.dumps(log_entry))
 
     return story_output
@@ -1,75 +1,73 @@
-import csv
-import os
 from geometry_resolver import resolve_geometry_state
+from knowledge_base import register_warmer, ARCHETYPE_CLASSIFICATION
 
-# === CSV Loader ===
-def load_csv(path):
-    """
-    Loads a CSV file and returns a list of dictionaries.
-    """
-    try:
-        with open(path, newline='', encoding='utf-8') as f:
-            return list(csv.DictReader(f))
-    except Exception as e:
-        print(f"⚠️ Failed to load CSV: {e}")
-        return []
+UNCLASSIFIED = {
+    "class_code": "N/A",
+    "archetype_variant": "unknown",
+    "containment_required": False,
+    "progressive": False
+}
 
-# === Actor Classification ===
-def classify_actor_from_wheel(actor, actor_wheel_state, reflex_type, classification_path):
+# === Column Alias ===
+def row_wheel_state(row):
     """
-    Classifies actor using actor_wheel_state and reflex_type.
-    Returns: class_code, archetype_variant, containment_required, progressive
+    Returns the actor wheel state of a classification row.
+    Older tables name the column "wheel_state"; it takes precedence for backward compatibility.
     """
-    rows = load_csv(classification_path)
+    if "wheel_state" in row:
+        return row["wheel_state"]
+    return row.get("actor_wheel_state", "")
 
-    # Normalize column name for backward compatibility
-    for row in rows:
-        if "wheel_state" in row:
-            row["actor_wheel_state"] = row["wheel_state"]
+# === Lookup Table ===
+def classification_key(actor, actor_wheel_state, reflex_type):
+    return (actor.strip().upper(), actor_wheel_state.strip().lower(), reflex_type.strip().lower())
 
-    for row in rows:
-        if (
-            row.get("actor", "").strip().upper() == actor.strip().upper() and
-            row.get("actor_wheel_state", "").strip().lower() == actor_wheel_state.strip().lower() and
-            row.get("reflex_type", "").strip().lower() == reflex_type.strip().lower()
-        ):
-            return {
+def build_classification_lookup(kb):
+    """
+    Compiles the classification table into {(ACTOR, wheel_state, reflex_type): result}.
+    The first row wins for duplicate keys, as in a top-down scan.
+    """
+    lookup = {}
+    for row in kb.rows(ARCHETYPE_CLASSIFICATION):
+        key = classification_key(row.get("actor", ""), row_wheel_state(row), row.get("reflex_type", ""))
+        if key not in lookup:
+            lookup[key] = {
                 "class_code": row.get("class_code", "N/A").strip(),
                 "archetype_variant": row.get("archetype_variant", "unknown").strip(),
                 "containment_required": row.get("containment_required", "FALSE").strip().upper() == "TRUE",
                 "progressive": row.get("progressive", "FALSE").strip().upper() == "TRUE"
             }
+    return lookup
 
-    # Debug trace for unmatched classification
-    print(f"⚠️ No classification match for actor='{actor}', wheel_state='{actor_wheel_state}', reflex_type='{reflex_type}'")
+@register_warmer
+def get_classification_lookup(kb):
+    return kb.derive("classification_lookup", build_classification_lookup)
 
-    return {
-        "class_code": "N/A",
-        "archetype_variant": "unknown",
-        "containment_required": False,
-        "progressive": False
-    }
+# === Actor Classification ===
+def classify_actor_from_wheel(actor, actor_wheel_state, reflex_type, kb):
+    """
+    Classifies actor using actor_wheel_state and reflex_type.
+    Returns: class_code, archetype_variant, containment_required, progressive
+    """
+    result = get_classification_lookup(kb).get(classification_key(actor, actor_wheel_state, reflex_type))
+    return dict(result if result is not None else UNCLASSIFIED)
 
 # === Classification Preview ===
-def preview_classification(classification_path):
+def preview_classification(kb):
     """
     Prints a readable preview of archetype classification logic.
     Includes optional geometry overlay if wheel domains are present.
     """
-    rows = load_csv(classification_path)
+    rows = kb.rows(ARCHETYPE_CLASSIFICATION)
     if not rows:
         print("⚠️ No classification data found.")
         return
 
-    for row in rows:
-        if "wheel_state" in row:
-            row["actor_wheel_state"] = row["wheel_state"]
-
     print("🧠 Archetype Classification Preview:")
     for row in rows:
         actor = row.get("actor", "N/A")
         reflex = row.get("reflex_type", "N/A")
-        wheel = row.get("actor_wheel_state", "N/A")
+        wheel = row_wheel_state(row) or "N/A"
         code = row.get("class_code", "N/A")
         variant = row.get("archetype_variant", "unknown")
         containment = row.get("containment_required", "FALSE")
@@ -86,10 +84,7 @@ def preview_classification(classification_path):
                 "green": row.get("green", wheel),
                 "centre": row.get("centre", wheel)
             },
-            layers_path=os.path.join("geometry", "wheel_layers.csv"),
-            codex_path=os.path.join("geometry", "wheel_codex.csv"),
-            drift_path=os.path.join("geometry", "polarity_drift.csv"),
-            ml_instruction_path=os.path.join("engine_boot", "ml_instruction.csv")
+            kb=kb
         )
 
         print(f"     ↪ Geometry Alert: {geometry_overlay['geometry_alert']}")
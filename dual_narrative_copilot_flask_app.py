@@ -1,43 +1,247 @@
-from flask import Flask, request, jsonify
-from narrative_engine import generate_narrative
-import yaml
+import os
+import json
+import time
+from flask import Flask, Response, request, jsonify, stream_with_context, g
+from narrative_engine import generate_narrative, generate_narratives, generate_narrative_stream, normalize_record
+from kb_watcher import KnowledgeBaseWatcher
+from log_sink import get_log_sink, close_log_sink
+from serving import serve, serving_config, run_with_deadline, stream_with_deadline, RequestTimeout, tracker, process_memory
+from result_cache import get_result_cache, invalidate_result_cache
+from session_state import get_session_states
+from session_store import get_session_store
+from metrics import registry
 
 # === Initialize Flask App ===
 app = Flask(__name__)
 
-# === Load Configuration ===
-try:
-    with open("copilot_config.yaml", "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-except Exception as e:
-    print(f"⚠️ Failed to load config: {e}")
-    config = {}
+# === Load Configuration + Knowledge Base ===
+watcher = KnowledgeBaseWatcher("copilot_config.yaml", on_swap=invalidate_result_cache)
+hot_reload = watcher.current().config.get("hot_reload", {})
+if hot_reload.get("enabled", True):
+    watcher.interval = hot_reload.get("interval_seconds", watcher.interval)
+    watcher.start()
+
+# === Start Log Writer ===
+get_log_sink(watcher.current().config)
+
+# === Metrics ===
+REQUESTS = registry.counter("narrative_http_requests_total", "HTTP requests by endpoint and status.", ["endpoint", "status"])
+REQUEST_SECONDS = registry.histogram("narrative_http_request_seconds", "HTTP handler time by endpoint.", ["endpoint"])
+
+def result_cache_lookups():
+    cache = get_result_cache(watcher.current().config)
+    if cache is None:
+        return None
+    stats = cache.stats()
+    return [({"result": "hit"}, stats["hits"]), ({"result": "disk_hit"}, stats["disk_hits"]), ({"result": "miss"}, stats["misses"])]
+
+def result_cache_hit_ratio():
+    cache = get_result_cache(watcher.current().config)
+    return cache.stats()["hit_rate"] if cache is not None else None
+
+registry.callback("narrative_result_cache_lookups_total", "Result cache lookups by outcome.", result_cache_lookups, kind="counter")
+registry.callback("narrative_result_cache_hit_ratio", "Share of result cache lookups served from cache.", result_cache_hit_ratio)
+registry.callback("narrative_log_queue_depth", "Log records waiting for the background writer.", lambda: get_log_sink().queue_depth())
+registry.callback("narrative_http_requests_in_flight", "Requests accepted and not yet finished.", lambda: tracker.in_flight)
+registry.callback("narrative_http_requests_timed_out_total", "Requests that hit the request deadline.", lambda: tracker.timed_out, kind="counter")
+registry.callback("narrative_process_memory_megabytes", "Memory of this worker (rss, pss, shared, private).",
+                  lambda: [({"kind": kind.replace("_mb", "")}, value) for kind, value in process_memory().items()])
+registry.callback("narrative_uptime_seconds", "Seconds since this worker started.", lambda: round(time.time() - tracker.started, 1))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or "unknown"
+    REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    if "request_started" in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    return response
 
 # === Emotional OS Endpoint ===
 @app.route("/generate", methods=["POST"])
 def generate():
     try:
         data = request.get_json(force=True)
+        state = watcher.current()
 
-        voice_inputs = data.get("voice_inputs", [])
-        background_inputs = data.get("background_inputs", [])
-        actor = data.get("actor", "User")
-        user_id = data.get("user_id", "anonymous")
+        inputs, actor, user_id, background = normalize_record(data)
 
-        result = generate_narrative(
+        result = run_with_deadline(
+            generate_narrative,
+            serving_config(state.config),
+            inputs,
             actor,
             user_id,
-            " ".join(voice_inputs),
-            " ".join(background_inputs),
-            config
+            background,
+            state.config,
+            kb=state.kb
         )
 
-        return jsonify({"result": result})
+        return jsonify({"result": result, "kb_version": state.kb.version, "config_version": state.config_version})
 
+    except RequestTimeout as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": f"Internal error: {str(e)}"}), 500
 
+# === Streaming Endpoint ===
+# Server-sent events: one "section" event per narrative section as its stage
+# finishes (or one per LLM token in generative mode), then "done".
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route("/generate_stream", methods=["POST"])
+def generate_stream():
+    try:
+        data = request.get_json(force=True)
+    except Exception as e:
+        return jsonify({"error": f"Invalid request body: {e}"}), 400
+
+    state = watcher.current()
+    inputs, actor, user_id, background = normalize_record(data)
+
+    def events():
+        try:
+            sections = generate_narrative_stream(inputs, actor, user_id, background, state.config, kb=state.kb)
+            for section, text in stream_with_deadline(sections, serving_config(state.config)):
+                if section == "error":
+                    yield sse_event("error", {"error": text})
+                    return
+                yield sse_event("token" if section == "token" else "section", {"section": section, "text": text})
+        except RequestTimeout as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        except Exception as e:
+            yield sse_event("error", {"error": f"Internal error: {str(e)}"})
+            return
+        yield sse_event("done", {"kb_version": state.kb.version, "config_version": state.config_version})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# === Batch Endpoint ===
+# Accepts a JSON array of records, or NDJSON (one record per line). NDJSON
+# requests get NDJSON back so results can be streamed into the next job.
+def parse_batch_body():
+    body = request.get_data(as_text=True)
+    if request.mimetype in ("application/x-ndjson", "application/jsonl") or not body.lstrip().startswith("["):
+        return [json.loads(line) for line in body.splitlines() if line.strip()], True
+    return json.loads(body), False
+
+@app.route("/generate_batch", methods=["POST"])
+def generate_batch():
+    try:
+        records, ndjson = parse_batch_body()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid batch body: {e}"}), 400
+
+    try:
+        state = watcher.current()
+        # Batches are expected to run long; the per-request deadline does not apply.
+        results = generate_narratives(records, state.config, kb=state.kb)
+    except Exception as e:
+        return jsonify({"error": f"Internal error: {str(e)}"}), 500
+
+    if ndjson:
+        lines = (json.dumps({"index": i, "result": result, "kb_version": state.kb.version}) + "\n"
+                 for i, result in enumerate(results))
+        return Response(lines, mimetype="application/x-ndjson")
+    return jsonify({"results": results, "kb_version": state.kb.version, "config_version": state.config_version})
+
+# === Session Log Endpoints ===
+def session_filters():
+    return {name: request.args.get(name) for name in ("user_id", "actor", "class_code", "since", "until")}
+
+@app.route("/sessions", methods=["GET"])
+def sessions():
+    """Newest-first page of session rows; pass next_cursor back as ?before_id= for the next page."""
+    store = get_session_store(watcher.current().config)
+    if store is None:
+        return jsonify({"error": "session_store is disabled"}), 404
+    try:
+        limit = min(int(request.args.get("limit", store.page_size)), 1000)
+        before_id = request.args.get("before_id", type=int)
+        rows, cursor = store.query(limit=limit, before_id=before_id, **session_filters())
+    except ValueError as e:
+        return jsonify({"error": f"Bad query: {e}"}), 400
+    return jsonify({"rows": rows, "next_cursor": cursor})
+
+@app.route("/sessions/summary", methods=["GET"])
+def sessions_summary():
+    """Row count and per-actor class-code counts for the filters."""
+    store = get_session_store(watcher.current().config)
+    if store is None:
+        return jsonify({"error": "session_store is disabled"}), 404
+    filters = session_filters()
+    try:
+        return jsonify({
+            "count": store.count(**filters),
+            "class_codes": store.class_code_counts(**filters)
+        })
+    except ValueError as e:
+        return jsonify({"error": f"Bad query: {e}"}), 400
+
+# === Health Endpoints ===
+@app.route("/status", methods=["GET"])
+def status():
+    state = watcher.current()
+    options = serving_config(state.config)
+    cache = get_result_cache(state.config)
+    sessions = get_session_states(state.config)
+    return jsonify({
+        "status": "draining" if tracker.draining else "ok",
+        "url": request.url_root,
+        "mode": options["mode"],
+        "uptime_seconds": round(time.time() - tracker.started, 1),
+        "in_flight": tracker.in_flight,
+        "served": tracker.served,
+        "timed_out": tracker.timed_out,
+        "worker_pid": os.getpid(),
+        "worker_boot_ms": tracker.boot_ms,
+        "memory": process_memory(),
+        "result_cache": cache.stats() if cache is not None else None,
+        "session_state": sessions.stats() if sessions is not None else None,
+        "kb_version": state.kb.version,
+        "config_version": state.config_version
+    })
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    kb = watcher.current().kb
+    body = {
+        "ready": bool(kb.tables) and not tracker.draining,
+        "kb_version": kb.version,
+        "kb_tables": len(kb.tables),
+        "kb_loaded_at": kb.loaded_at
+    }
+    if tracker.draining:
+        body["reason"] = "shutting down"
+    elif not kb.tables:
+        body["reason"] = "knowledge base not loaded"
+    return jsonify(body), 200 if body["ready"] else 503
+
+# Per-process numbers: in processes mode each scrape reaches one worker.
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+# === Worker Startup ===
+def on_worker_start():
+    # Forked workers start their own log writer; build it from the live config.
+    get_log_sink(watcher.current().config)
+
+# === Shutdown ===
+def on_stopped():
+    watcher.stop()
+    close_log_sink()
+
 # === Startup Echo ===
 if __name__ == "__main__":
     print("🌀 Emotional OS (Flask) listening on /generate...")
-    app.run(host="0.0.0.0", port=5000)
+    serve(app, watcher.current().config, on_worker_start=on_worker_start, on_stopped=on_stopped, watcher=watcher)
@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
+import json
 import requests
 from io import StringIO
 from datetime import datetime
-import yaml
-import csv
+import hashlib
+import uuid
+from log_viewer import SessionLogTail
+from version_store import user_histories, SESSION_HISTORY_ROOT
 
 # === Optional AI Prompt Enrichment ===
 try:
@@ -32,6 +35,23 @@ try:
 except Exception as e:
     st.sidebar.error(f"Flask unreachable: {e}")
 
+# === Streaming Client ===
+STREAM_URL = FLASK_URL.replace("/generate", "/generate_stream")
+
+def stream_narrative(payload):
+    """Yields narrative text from /generate_stream as each server-sent event arrives."""
+    with requests.post(STREAM_URL, json=payload, stream=True) as response:
+        if response.status_code != 200:
+            yield f"⚠️ Error {response.status_code}: {response.text}"
+            return
+        event = None
+        for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:") and event != "done":
+                data = json.loads(line[len("data:"):])
+                yield f"\n⚠️ {data['error']}" if event == "error" else data["text"]
+
 # === Load Header Definitions ===
 @st.cache_data
 def load_headers():
@@ -47,44 +67,50 @@ def load_headers():
 
 headers_df = load_headers()
 
+# === User ID ===
+# Without an explicit id each browser session gets its own, so visitors never
+# share a saved history.
+if "session_user_id" not in st.session_state:
+    st.session_state["session_user_id"] = f"session_{uuid.uuid4().hex[:12]}"
+user_id = st.sidebar.text_input("🆔 User ID", value="", placeholder="user_001").strip()
+named_user = bool(user_id)
+user_id = user_id or st.session_state["session_user_id"]
+
 # === File Uploads ===
 st.sidebar.title("📁 Upload .txt Files")
 voice_file = st.sidebar.file_uploader("Upload voice_input.txt", type="txt")
 background_file = st.sidebar.file_uploader("Upload background.txt", type="txt")
 storyline_file = st.sidebar.file_uploader("Upload storyline.txt", type="txt")
 
-def cache_file(name, uploaded_file):
+# === Version History ===
+# Each input kind is an append-only per-user store; saving a version appends one
+# record and prefill reads only the selected one. An uploaded .txt is merged into
+# the user's history once (per distinct upload), never replacing what other
+# sessions of the same user are reading.
+@st.cache_resource
+def load_histories(user_id, named_user):
+    return user_histories(user_id) if named_user else user_histories(user_id, root=SESSION_HISTORY_ROOT)
+
+histories = load_histories(user_id, named_user)
+
+def import_upload(kind, uploaded_file):
     if uploaded_file:
-        text = uploaded_file.getvalue().decode("utf-8")
-        st.session_state[name + "_data"] = text
-        st.session_state[name + "_obj"] = uploaded_file
-    else:
-        st.session_state.setdefault(name + "_data", "")
-        st.session_state.setdefault(name + "_obj", None)
-
-cache_file("voice_file", voice_file)
-cache_file("background_file", background_file)
-cache_file("storyline_file", storyline_file)
-
-# === Transposed File Parser ===
-def parse_transposed_file(file_text):
-    if not file_text:
-        return {}, [], ""
-    reader = csv.reader(file_text.splitlines(), delimiter=",", quotechar='"')
-    rows = list(reader)
-    if not rows or len(rows) < 2:
-        return {}, [], ""
-    versions = rows[0]
-    blocks = {version: [] for version in versions}
-    for row in rows[1:]:
-        for i, value in enumerate(row):
-            if i < len(versions):
-                blocks[versions[i]].append(value.strip())
-    full_string = " ".join([" ".join(blocks[v]) for v in versions])
-    return blocks, versions, full_string
-
-voice_blocks, voice_versions, _ = parse_transposed_file(st.session_state["voice_file_data"])
-background_blocks, background_versions, _ = parse_transposed_file(st.session_state["background_file_data"])
+        data = uploaded_file.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        if st.session_state.get(kind + "_imported") != (user_id, digest):
+            histories[kind].import_transposed(data.decode("utf-8"), replace=False)
+            st.session_state[kind + "_imported"] = (user_id, digest)
+
+import_upload("voice_input", voice_file)
+import_upload("background", background_file)
+import_upload("storyline", storyline_file)
+
+def prefill_fields(kind, version, count):
+    fields = histories[kind].get(version) or []
+    return ([value.strip() for value in fields] + [""] * count)[:count]
+
+voice_versions = histories["voice_input"].versions()
+background_versions = histories["background"].versions()
 
 # === Prefill Mode Toggle ===
 prefill_mode = st.sidebar.radio("Prefill Source", ["Latest (Column 1)", "Select Version"])
@@ -94,7 +120,7 @@ prefill_enabled = selected_voice_version and selected_background_version
 
 # === Input Field Construction ===
 st.subheader("🗣️ Describe Argument That Happened")
-voice_prefill = voice_blocks.get(selected_voice_version, [""] * VOICE_FIELDS) if prefill_enabled else [""] * VOICE_FIELDS
+voice_prefill = prefill_fields("voice_input", selected_voice_version, VOICE_FIELDS) if prefill_enabled else [""] * VOICE_FIELDS
 voice_inputs = []
 for i in range(VOICE_FIELDS):
     label_row = headers_df[(headers_df["Input_file"] == "voice_input") & (headers_df["Field"] == f"input{i+1}")]
@@ -103,7 +129,7 @@ for i in range(VOICE_FIELDS):
     voice_inputs.append(value)
 
 st.subheader("🌄 Describe Your Background")
-background_prefill = background_blocks.get(selected_background_version, [""] * BACKGROUND_FIELDS) if prefill_enabled else [""] * BACKGROUND_FIELDS
+background_prefill = prefill_fields("background", selected_background_version, BACKGROUND_FIELDS) if prefill_enabled else [""] * BACKGROUND_FIELDS
 background_inputs = []
 for i in range(BACKGROUND_FIELDS):
     label_row = headers_df[(headers_df["Input_file"] == "background") & (headers_df["Field"] == f"input{i+1}")]
@@ -111,9 +137,8 @@ for i in range(BACKGROUND_FIELDS):
     value = st.text_input(label_text, value=background_prefill[i])
     background_inputs.append(value)
 
-# === Actor, User ID, and Prompt ===
+# === Actor and Prompt ===
 actor = st.sidebar.text_input("🎭 Actor Name", value="default_actor")
-user_id = st.sidebar.text_input("🆔 User ID", value="user_001")
 user_request = st.sidebar.text_input("💬 Storyline Interaction Prompt", value="") if ai_prompt_available else ""
 include_prompt = st.sidebar.checkbox("🔮 Enrich with AI Prompt", value=False) if ai_prompt_available else False
 
@@ -122,24 +147,24 @@ if st.button("✨ Generate Dual Narrative Storyline"):
     payload = {
         "inputs": voice_inputs,
         "background": " ".join(background_inputs),
+        "background_inputs": background_inputs,
         "actor": actor,
         "user_id": user_id
     }
 
+    st.subheader("📜 Generated Storyline")
+    story_box = st.empty()
+    result = ""
     try:
-        response = requests.post(FLASK_URL, json=payload)
-        if response.status_code == 200:
-            result = response.json().get("result", "[No response]")
-            if include_prompt and user_request:
-                enriched = enrich_with_prompt(result, actor, user_id, user_request)
-                result += "\n\n" + enriched
-        else:
-            result = f"⚠️ Error {response.status_code}: {response.text}"
+        for chunk in stream_narrative(payload):
+            result += chunk
+            story_box.text(result)
+        if include_prompt and user_request and result and "⚠️" not in result:
+            enriched = enrich_with_prompt(result, actor, user_id, user_request)
+            result += "\n\n" + enriched
     except Exception as e:
-        result = f"⚠️ Request failed: {e}"
-
-    st.subheader("📜 Generated Storyline")
-    st.text_area("Scroll through your story:", value=result, height=400)
+        result += f"\n⚠️ Request failed: {e}"
+    story_box.text_area("Scroll through your story:", value=result, height=400)
 
     if "Classification:" in result:
         classification_line = [line for line in result.splitlines() if "Classification:" in line]
@@ -147,41 +172,50 @@ if st.button("✨ Generate Dual Narrative Storyline"):
             st.success(f"🧠 Classification Preview → {classification_line[0].replace('Classification:', '').strip()}")
 
     timestamp = datetime.now().strftime("%a %b %d, %Y (%H:%M)")
-    st.session_state["new_voice_column"] = [timestamp] + voice_inputs
-    st.session_state["new_background_column"] = [timestamp] + background_inputs
-    st.session_state["new_storyline_column"] = [timestamp] + result.splitlines()
+    histories["voice_input"].append(timestamp, voice_inputs)
+    histories["background"].append(timestamp, background_inputs)
+    histories["storyline"].append(timestamp, result.splitlines())
     st.session_state["story_generated"] = True
 
 # === Download Buttons ===
-def prepend_column_to_transposed_file(file_text, new_column):
-    rows = [line.split(",") for line in file_text.splitlines()] if file_text else []
-    while len(rows) < len(new_column):
-        rows.append([])
-    for i, value in enumerate(new_column):
-        rows[i].insert(1, f'"{value}"')
-    return "\n".join([",".join(row) for row in rows])
-
 if st.session_state.get("story_generated"):
     st.download_button("⬇️ Save Updated Voice Input",
-        data=prepend_column_to_transposed_file(st.session_state["voice_file_data"], st.session_state["new_voice_column"]),
+        data=histories["voice_input"].to_transposed(),
         file_name="voice_input.txt", mime="text/plain")
 
     st.download_button("⬇️ Save Updated Background",
-        data=prepend_column_to_transposed_file(st.session_state["background_file_data"], st.session_state["new_background_column"]),
+        data=histories["background"].to_transposed(),
         file_name="background.txt", mime="text/plain")
 
     st.download_button("⬇️ Save New Storyline",
-        data=prepend_column_to_transposed_file(st.session_state["storyline_file_data"], st.session_state["new_storyline_column"]),
+        data=histories["storyline"].to_transposed(),
         file_name="storyline.txt", mime="text/plain")
 
 # === Session Log Viewer ===
+# One tail reader per log, shared across reruns: each rerun only parses rows appended since the last.
+@st.cache_resource
+def session_log_tail(path):
+    return SessionLogTail(path)
+
 if st.sidebar.checkbox("📂 View Session Log"):
     try:
-        log_df = pd.read_csv(CLASSIFICATION_LOG_PATH)
+        log_tail = session_log_tail(CLASSIFICATION_LOG_PATH)
+        new_rows = log_tail.refresh()
         st.subheader("📊 Session Log")
-        st.dataframe(log_df)
+        page = st.number_input("Page (1 = newest)", min_value=1, max_value=max(log_tail.page_count(), 1), value=1)
+        st.dataframe(pd.DataFrame(log_tail.records(page - 1), columns=log_tail.header))
+        st.caption(f"{log_tail.total_rows} rows · {new_rows} new since last refresh")
+        if log_tail.counts:
+            st.subheader("🧮 Class Codes per Actor")
+            st.dataframe(pd.DataFrame(log_tail.counts).fillna(0).astype(int))
     except Exception as e:
         st.error(f"⚠️ Failed to load session log: {e}")
 
 # === Reflex Manifest Preview ===
-if st.sidebar.checkbox("🧠 Preview Reflex Manifest
+if st.sidebar.checkbox("🧠 Preview Reflex Manifest"):
+    try:
+        manifest_df = pd.read_csv(TRANSMISSION_MAP_PATH)
+        st.subheader("🧠 Reflex Manifest")
+        st.dataframe(manifest_df)
+    except Exception as e:
+        st.error(f"⚠️ Failed to load reflex manifest: {e}")
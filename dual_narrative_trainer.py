@@ -1,19 +1,12 @@
-import os
 from geometry_resolver import resolve_geometry_state
 
 # === Trainer Injection Logic ===
-def inject_trainer_stage(actor, wheel_domains, reflex_type, containment_strategy):
+def inject_trainer_stage(actor, wheel_domains, reflex_type, containment_strategy, kb):
     """
     Determines if M3/F3 trainer stage should be injected based on symbolic collapse or blocked containment.
     Returns: stage_id, stage_name
     """
-    overlay = resolve_geometry_state(
-        wheel_domains=wheel_domains,
-        layers_path=os.path.join("geometry", "wheel_layers.csv"),
-        codex_path=os.path.join("geometry", "wheel_codex.csv"),
-        drift_path=os.path.join("geometry", "polarity_drift.csv"),
-        ml_instruction_path=os.path.join("engine_boot", "ml_instruction.csv")
-    )
+    overlay = resolve_geometry_state(wheel_domains=wheel_domains, kb=kb)
 
     geometry_alert = overlay.get("geometry_alert", "stable")
     suggested_action = overlay.get("suggested_action", "continue")
@@ -1,24 +1,21 @@
-import csv
-import os
-
-# === CSV Loader ===
-def load_csv(path):
-    try:
-        with open(path, newline='', encoding='utf-8') as f:
-            return list(csv.DictReader(f))
-    except Exception as e:
-        print(f"⚠️ Failed to load CSV: {e}")
-        return []
+from itertools import combinations
+from knowledge_base import register_warmer, WHEEL_LAYERS, WHEEL_CODEX, POLARITY_DRIFT, CONSTRAINT_MATRIX, ML_INSTRUCTION
 
-# === Geometry Resolver ===
-def resolve_geometry_state(wheel_domains, layers_path, codex_path, drift_path, ml_instruction_path):
-    constraint_path = os.path.join("emotional_geometry_layers", "emotional_constraint_matrix.csv")
+# Colour vocabularies up to this size get every subset materialised at load
+# time (2^n overlays); larger ones fall back to memoising subsets on first use.
+MAX_MATERIALIZED_COLOURS = 12
 
-    layers = load_csv(layers_path)
-    codex = load_csv(codex_path)
-    drift = load_csv(drift_path)
-    constraints = load_csv(constraint_path)
-    ml_rules = load_csv(ml_instruction_path)
+# === Overlay Evaluation ===
+def evaluate_overlay(colours, kb):
+    """
+    Computes the geometry overlay for a set of wheel-domain values.
+    The overlay only depends on which values occur, not on which domain holds them.
+    """
+    layers = kb.rows(WHEEL_LAYERS)
+    codex = kb.rows(WHEEL_CODEX)
+    drift = kb.rows(POLARITY_DRIFT)
+    constraints = kb.rows(CONSTRAINT_MATRIX)
+    ml_rules = kb.rows(ML_INSTRUCTION)
 
     overlay = {
         "geometry_alert": "stable",
@@ -33,7 +30,7 @@ def resolve_geometry_state(wheel_domains, layers_path, codex_path, drift_path, m
 
     # === Layer-based conflict detection
     for row in layers:
-        if row["color"].lower() in wheel_domains.values():
+        if row["color"].lower() in colours:
             if row.get("actor_impact"):
                 overlay["layer_conflict"].append(row["actor_impact"])
             if row.get("tension_axis"):
@@ -48,7 +45,7 @@ def resolve_geometry_state(wheel_domains, layers_path, codex_path, drift_path, m
 
     # === Drift detection
     for row in drift:
-        if row.get("color") in wheel_domains.values():
+        if row.get("color") in colours:
             overlay["tension_axis"].append(row.get("drift_axis"))
 
     # === Constraint matrix hits
@@ -56,14 +53,14 @@ def resolve_geometry_state(wheel_domains, layers_path, codex_path, drift_path, m
         axis = row.get("color_axis", "")
         if axis:
             c1, c2 = axis.split("-")
-            if c1 in wheel_domains.values() or c2 in wheel_domains.values():
+            if c1 in colours or c2 in colours:
                 overlay["constraint_matrix_hits"].append(row["description"])
                 overlay["geometry_alert"] = row["description"]
                 overlay["suggested_action"] = row["modulation_gate"]
 
     # === ML instruction triggers
     for rule in ml_rules:
-        if rule.get("trigger_color") in wheel_domains.values():
+        if rule.get("trigger_color") in colours:
             overlay["ml_flags"].append(rule.get("symbolic_flag"))
             if rule.get("suggested_action"):
                 overlay["suggested_action"] = rule["suggested_action"]
@@ -71,3 +68,52 @@ def resolve_geometry_state(wheel_domains, layers_path, codex_path, drift_path, m
                 overlay["geometry_alert"] = rule["geometry_alert"]
 
     return overlay
+
+# === Colour Vocabulary ===
+def colour_vocabulary(kb):
+    """Every value a wheel domain is compared against by evaluate_overlay."""
+    vocabulary = {row["color"].lower() for row in kb.rows(WHEEL_LAYERS)}
+    vocabulary.update(row.get("color") for row in kb.rows(POLARITY_DRIFT))
+    vocabulary.update(rule.get("trigger_color") for rule in kb.rows(ML_INSTRUCTION))
+    for row in kb.rows(CONSTRAINT_MATRIX):
+        axis = row.get("color_axis", "")
+        if axis:
+            vocabulary.update(axis.split("-"))
+    return frozenset(vocabulary)
+
+# === Overlay Table ===
+class GeometryOverlayTable:
+    """
+    Precomputed overlays keyed by the frozenset of known colours present in wheel_domains.
+    Holds no reference to the knowledge base, so it is stored in the compiled artifact.
+    """
+
+    def __init__(self, kb):
+        self.vocabulary = colour_vocabulary(kb)
+        self.overlays = {}
+        if len(self.vocabulary) <= MAX_MATERIALIZED_COLOURS:
+            colours = list(self.vocabulary)
+            for size in range(len(colours) + 1):
+                for subset in combinations(colours, size):
+                    key = frozenset(subset)
+                    self.overlays[key] = evaluate_overlay(key, kb)
+
+    def key(self, wheel_domains):
+        return frozenset(value for value in wheel_domains.values() if value in self.vocabulary)
+
+    def lookup(self, wheel_domains, kb):
+        key = self.key(wheel_domains)
+        overlay = self.overlays.get(key)
+        if overlay is None:
+            overlay = self.overlays.setdefault(key, evaluate_overlay(key, kb))
+        return overlay
+
+@register_warmer
+def get_geometry_table(kb):
+    return kb.derive("geometry_overlay_table", GeometryOverlayTable)
+
+# === Geometry Resolver ===
+def resolve_geometry_state(wheel_domains, kb):
+    overlay = get_geometry_table(kb).lookup(wheel_domains, kb)
+    # Callers update and extend the result, so hand out a copy of the shared entry.
+    return {key: list(value) if isinstance(value, list) else value for key, value in overlay.items()}
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import pickle
+import argparse
+import threading
+from knowledge_base import KnowledgeBase, _warmers, list_sources, DEFAULT_MODULES, DEFAULT_GRAMMAR_PATH, DEFAULT_TRANSMISSION_PROFILE_PATH
+from metrics import FILE_READS
+
+# === Defaults ===
+# Mirrors the knowledge_base section of copilot_config.yaml.
+DEFAULT_KB_CONFIG = {
+    "artifact": ".cache/knowledge_base.kbc",
+    "auto_compile": False
+}
+
+# Bumped whenever the artifact layout or the table parser changes, so an
+# artifact written by older code is recompiled instead of trusted.
+ARTIFACT_FORMAT = 1
+
+
+def kb_config(config):
+    options = dict(DEFAULT_KB_CONFIG)
+    options.update((config or {}).get("knowledge_base") or {})
+    return options
+
+def _modules(config):
+    modules = dict(DEFAULT_MODULES)
+    for name in DEFAULT_MODULES:
+        path = (config or {}).get("paths", {}).get("modules", {}).get(name)
+        if path:
+            modules[name] = path
+    return modules
+
+def _grammar_path(config):
+    return (config or {}).get("emotional_grammar", {}).get("path", DEFAULT_GRAMMAR_PATH)
+
+
+# === Artifact I/O ===
+# The artifact is a pickle: only ever load one this engine wrote itself from
+# trusted local sources, never one received from elsewhere.
+def read_artifact(path):
+    """Returns the artifact dict at path, or None if it is missing, unreadable or from another format."""
+    try:
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+        FILE_READS.inc(source="artifact")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Failed to read knowledge base artifact: {e}")
+        return None
+    if not isinstance(artifact, dict) or artifact.get("format") != ARTIFACT_FORMAT:
+        return None
+    return artifact
+
+def write_artifact(artifact, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write-then-rename so a worker starting mid-compile never reads half an artifact.
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+def _relative(root, path):
+    return os.path.relpath(path, root)
+
+def _warmer_files():
+    """Source files of the modules whose warmers build the stored derived state."""
+    files = set()
+    for warmer in _warmers:
+        module = sys.modules.get(getattr(warmer, "__module__", None))
+        if getattr(module, "__file__", None):
+            files.add(os.path.abspath(module.__file__))
+    return sorted(files)
+
+def _picklable(derived):
+    # Derived state is an optimisation; anything that cannot be stored is rebuilt by warm().
+    stored = {}
+    for key, value in derived.items():
+        try:
+            pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"⚠️ Derived {key!r} left out of the artifact (rebuilt at warm time): {e}")
+            continue
+        stored[key] = value
+    return stored
+
+
+# === Compiling ===
+def build_artifact(kb):
+    """
+    Snapshot of a warmed knowledge base: rows, grammar, indexes, derived lookup
+    tables and scanners, per-source hashes, and the stats of the rule modules
+    that built the derived state (editing one of them makes the artifact stale).
+    """
+    return {
+        "format": ARTIFACT_FORMAT,
+        "version": kb.version,
+        "modules": dict(kb.modules),
+        "grammar_path": kb.grammar_path,
+        "transmission_profile_path": kb.transmission_profile_path,
+        "sources": {name: _relative(kb.root, path) for name, path in kb.sources.items()},
+        "stats": {name: _stat(path) for name, path in kb.sources.items()},
+        "digests": dict(kb.digests),
+        "tables": kb.tables,
+        "grammar": kb.grammar,
+        "indexes": dict(kb._indexes),
+        "derived": _picklable(kb._derived),
+        "code": {path: _stat(path) for path in _warmer_files()},
+        "compiled_at": time.time()
+    }
+
+def compile_knowledge_base(config=None, root=".", output=None, reuse=None):
+    """
+    Parses the knowledge base (reusing every source whose hash is in reuse, see
+    KnowledgeBase.reusable), warms it and writes the artifact. Returns the knowledge base.
+    """
+    # The rule modules register the warmers that build the stored indexes.
+    import narrative_engine  # noqa: F401
+
+    output = output or os.path.join(root, kb_config(config)["artifact"])
+    kb = KnowledgeBase(root=root, modules=_modules(config), grammar_path=_grammar_path(config),
+                       reuse=reuse).warm()
+    write_artifact(build_artifact(kb), output)
+    return kb
+
+def is_fresh(artifact, root, modules, grammar_path):
+    """True when the artifact covers exactly the current sources and none changed on disk."""
+    if artifact is None:
+        return False
+    if (artifact["modules"] != modules or artifact["grammar_path"] != grammar_path
+            or artifact["transmission_profile_path"] != DEFAULT_TRANSMISSION_PROFILE_PATH):
+        return False
+    sources = {name: _relative(root, path) for name, path in list_sources(root, modules, grammar_path)}
+    if sources != artifact["sources"]:
+        return False
+    if any(_stat(path) != stat for path, stat in artifact["code"].items()):
+        return False
+    return all(_stat(os.path.join(root, path)) == artifact["stats"][name] for name, path in sources.items())
+
+
+# === Loading ===
+def load_compiled(config, root=".", modules=None, grammar_path=DEFAULT_GRAMMAR_PATH, reuse=None):
+    """
+    Returns a knowledge base restored from the configured artifact, or None when
+    there is no usable artifact. A stale artifact is recompiled first when
+    knowledge_base.auto_compile is on; otherwise the caller parses the sources.
+    """
+    options = kb_config(config)
+    if not options.get("artifact"):
+        return None
+    path = os.path.join(root, options["artifact"])
+    modules = dict(modules or DEFAULT_MODULES)
+
+    artifact = read_artifact(path)
+    if is_fresh(artifact, root, modules, grammar_path):
+        return KnowledgeBase.from_artifact(artifact, root)
+    if not options.get("auto_compile"):
+        return None
+    try:
+        if reuse is None and artifact is not None:
+            reuse = KnowledgeBase.from_artifact(artifact, root).reusable()
+        return compile_knowledge_base(config, root, path, reuse)
+    except Exception as e:
+        print(f"⚠️ Failed to compile knowledge base artifact: {e}")
+        return None
+
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the knowledge base into a binary artifact for fast startup.")
+    parser.add_argument("--config", default="copilot_config.yaml")
+    parser.add_argument("--root", default=".", help="Repository root holding the tables")
+    parser.add_argument("--output", help="Artifact path (default: knowledge_base.artifact from the config)")
+    parser.add_argument("--force", action="store_true", help="Re-parse every source even if its hash is unchanged")
+    args = parser.parse_args(argv)
+
+    from kb_watcher import load_config_snapshot
+    config, _ = load_config_snapshot(os.path.join(args.root, args.config))
+    output = args.output or os.path.join(args.root, kb_config(config)["artifact"])
+    artifact = None if args.force else read_artifact(output)
+    reuse = KnowledgeBase.from_artifact(artifact, args.root).reusable() if artifact else None
+
+    start = time.perf_counter()
+    kb = compile_knowledge_base(config, args.root, output, reuse)
+    compiled_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    KnowledgeBase.from_artifact(read_artifact(output), args.root)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    parsed = sorted(set(kb.sources) - kb.reused)
+    print(f"✅ Knowledge base {kb.version} compiled to {output} in {compiled_ms:.1f} ms "
+          f"({len(parsed)} parsed, {len(kb.reused)} unchanged)")
+    for name in parsed:
+        print(f"  • {name}")
+    print(f"⚡ Artifact loads in {load_ms:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import os
+import hashlib
+import threading
+from collections import namedtuple
+import yaml
+from knowledge_base import KnowledgeBase, set_knowledge_base
+from metrics import FILE_READS
+
+# === Runtime State ===
+# One immutable snapshot of config + knowledge base. Requests grab the current
+# snapshot once and keep using it, so a swap never changes state mid-request.
+RuntimeState = namedtuple("RuntimeState", ["config", "config_version", "kb"])
+
+
+# === Config Loader ===
+def load_config_snapshot(path):
+    """Returns (config, content hash) for the YAML config at path."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+        FILE_READS.inc(source="config")
+        config = yaml.safe_load(raw.decode("utf-8")) or {}
+    except Exception as e:
+        print(f"⚠️ Failed to load config: {e}")
+        return {}, None
+    return config, hashlib.sha256(raw).hexdigest()[:12]
+
+
+# === Knowledge Base Watcher ===
+class KnowledgeBaseWatcher:
+    """
+    Polls the config file and every knowledge-base source for changes.
+    On change it rebuilds config + knowledge base in a background thread and
+    swaps the new snapshot in atomically; the old one is dropped once no
+    request references it.
+    """
+
+    def __init__(self, config_path="copilot_config.yaml", root=".", interval=2.0, on_swap=None):
+        self.config_path = config_path
+        self.root = root
+        self.interval = interval
+        self.on_swap = on_swap
+        # Pre-fork serving turns this off: the parent polls and restarts the workers.
+        self.poll_in_children = True
+        self._stop = threading.Event()
+        self._thread = None
+        self._state = self._build(None)
+        self._fingerprint = self._stat_fingerprint(self._state)
+        set_knowledge_base(self._state.kb)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def current(self):
+        return self._state
+
+    # === Building ===
+    def _build(self, previous):
+        config, config_version = load_config_snapshot(self.config_path)
+        # Sources whose content hash is unchanged keep their parsed rows.
+        reuse = previous.kb.reusable() if previous else None
+        kb = KnowledgeBase.from_config(config, root=self.root, reuse=reuse).warm()
+        return RuntimeState(config, config_version, kb)
+
+    # === Change Detection ===
+    def _watched_paths(self, state):
+        paths = [self.config_path]
+        paths.extend(state.kb.sources.values())
+        # New tables dropped into a module folder must be noticed too.
+        for folder in state.kb.modules.values():
+            paths.append(os.path.join(self.root, folder))
+        return paths
+
+    def _stat_fingerprint(self, state):
+        fingerprint = []
+        for path in self._watched_paths(state):
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return fingerprint
+
+    def check(self):
+        """Reloads if any watched file changed. Returns True when a new snapshot was swapped in."""
+        old = self._state
+        fingerprint = self._stat_fingerprint(old)
+        if fingerprint == self._fingerprint:
+            return False
+
+        new = self._build(old)
+        self._fingerprint = self._stat_fingerprint(new)
+        # mtime changes without content changes (touch, re-save) keep the old snapshot.
+        if new.kb.version == old.kb.version and new.config_version == old.config_version:
+            return False
+
+        self._state = new
+        set_knowledge_base(new.kb)
+        print(f"🔄 Knowledge base reloaded: {old.kb.version} → {new.kb.version} (config {new.config_version})")
+        if self.on_swap:
+            self.on_swap(old, new)
+        return True
+
+    # === Background Thread ===
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="kb-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+            self._thread = None
+
+    def _after_fork(self):
+        # Threads do not survive fork(); resume polling in the child if it was running.
+        running = self._thread is not None
+        self._thread = None
+        self._stop = threading.Event()
+        if running and self.poll_in_children:
+            self.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️ Knowledge base reload failed: {e}")
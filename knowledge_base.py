@@ -0,0 +1,290 @@
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import threading
+from metrics import FILE_READS
+
+# === Module Folders ===
+# Mirrors paths.modules in copilot_config.yaml; used when no config is given.
+DEFAULT_MODULES = {
+    "geometry": "emotional_geometry_layers/",
+    "reflex": "narrative_reflex_intelligence/",
+    "engine_boot": "engine_boot",
+    "classification": "classification/",
+    "os_framework": "emotional_os_framework/"
+}
+
+DEFAULT_GRAMMAR_PATH = "emotional_grammar.json"
+DEFAULT_TRANSMISSION_PROFILE_PATH = "classification_transmission_map.csv"
+
+# === Table Names ===
+TRANSMISSION_MAP = "geometry/transmission_map"
+WHEEL_CODEX = "geometry/wheel_codex"
+WHEEL_LAYERS = "geometry/wheel_layers"
+POLARITY_DRIFT = "geometry/polarity_drift"
+LINGUISTIC_REFRAME_MAP = "geometry/linguistic_reframe_map"
+CONSTRAINT_MATRIX = "geometry/emotional_constraint_matrix"
+ML_INSTRUCTION = "engine_boot/ml_instruction"
+ARCHETYPE_CLASSIFICATION = "classification/archetype_classification"
+FEMALE_VOICE_WHEEL = "reflex/2_female_voice_wheel"
+MALE_EXPECTATION_MAPS = ("reflex/3_male_expectation_map_part1", "reflex/3_male_expectation_map_part2")
+CROSS_MAP_MATRIX = "reflex/5_cross_map_matrix"
+REFLEX_TAXONOMY = "reflex/7_reflex_taxonomy"
+REPAIR_PROTOCOL_MAP = "reflex/8_repair_protocol_map"
+TRANSMISSION_PROFILE = "transmission_profile"
+
+
+# === Warmers ===
+# Functions that compile derived state from a knowledge base. Registered by the
+# rule modules so a freshly loaded knowledge base can be fully built before use.
+_warmers = []
+
+def register_warmer(fn):
+    """Registers fn(kb) to be run by KnowledgeBase.warm(); usable as a decorator."""
+    _warmers.append(fn)
+    return fn
+
+
+# === Sources ===
+def list_sources(root, modules, grammar_path=DEFAULT_GRAMMAR_PATH,
+                 transmission_profile_path=DEFAULT_TRANSMISSION_PROFILE_PATH):
+    """[(table name, path)] for every source file in load order; the grammar is listed as "grammar"."""
+    sources = []
+    for name, folder in sorted(modules.items()):
+        directory = os.path.join(root, folder)
+        if not os.path.isdir(directory):
+            print(f"⚠️ Knowledge base folder missing: {directory}")
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".csv"):
+                sources.append((f"{name}/{os.path.splitext(filename)[0]}", os.path.join(directory, filename)))
+
+    profile_path = os.path.join(root, transmission_profile_path)
+    if os.path.exists(profile_path):
+        sources.append((TRANSMISSION_PROFILE, profile_path))
+    sources.append(("grammar", os.path.join(root, grammar_path)))
+    return sources
+
+
+# === Table Parsing ===
+def _unwrap(cell):
+    return cell[1:-1] if len(cell) >= 2 and cell[0] == cell[-1] == '"' else cell
+
+def parse_table(raw):
+    """
+    Parses CSV bytes into row dicts like csv.DictReader, tolerating the sheet-export
+    layout of some tables: BOM, banner and "Purpose:" rows above the header, trailing
+    unnamed columns, blank separator rows and cells wrapped in a second pair of quotes.
+    """
+    rows = list(csv.reader(io.StringIO(raw.decode("utf-8-sig"), newline="")))
+    # The header is the first row naming at least two columns; banners fill one cell.
+    start = next((i for i, row in enumerate(rows) if sum(1 for cell in row if cell.strip()) >= 2), None)
+    if start is None:
+        return []
+
+    header = rows[start]
+    quoted = all(_unwrap(cell) != cell for cell in header if cell.strip())
+    header = [(_unwrap(cell) if quoted else cell).strip() for cell in header]
+
+    table = []
+    for row in rows[start + 1:]:
+        if not any(cell.strip() for cell in row):
+            continue
+        if quoted:
+            row = [_unwrap(cell) for cell in row]
+        record = {name: (row[i] if i < len(row) else None) for i, name in enumerate(header) if name}
+        if len(row) > len(header):
+            record[None] = row[len(header):]
+        table.append(record)
+    return table
+
+
+# === Versioning ===
+def content_version(digests):
+    """Version id over the content hash of every source, so any edit changes it."""
+    digest = hashlib.sha256()
+    for name in sorted(digests):
+        digest.update(name.encode("utf-8") + b"\0" + digests[name].encode("ascii") + b"\n")
+    return digest.hexdigest()[:12]
+
+
+# === Key Normalization ===
+def normalize_key(value):
+    """Normalizes a lookup value the way the rule modules compare them."""
+    return (value or "").strip().lower()
+
+
+# === Knowledge Base ===
+class KnowledgeBase:
+    """
+    In-memory store for every CSV table the engine reads.
+    Tables are addressed as "<module>/<file stem>", e.g. "geometry/transmission_map".
+    reuse: {table name: (sha256, rows)} from a previous compile; sources whose
+    content hash still matches are not parsed again (see kb_compiler.py).
+    """
+
+    def __init__(self, root=".", modules=None, grammar_path=DEFAULT_GRAMMAR_PATH,
+                 transmission_profile_path=DEFAULT_TRANSMISSION_PROFILE_PATH, reuse=None):
+        self.root = root
+        self.modules = dict(modules or DEFAULT_MODULES)
+        self.grammar_path = grammar_path
+        self.transmission_profile_path = transmission_profile_path
+        self.tables = {}
+        self.sources = {}
+        self.digests = {}
+        self.reused = set()
+        self.grammar = {}
+        self.version = None
+        self.loaded_at = None
+        self._indexes = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+        self._load(reuse or {})
+
+    @classmethod
+    def from_config(cls, config, root=".", reuse=None, use_artifact=True):
+        """
+        Builds the knowledge base described by config. When a compiled artifact is
+        configured and still matches the sources, it is loaded instead of the CSVs.
+        """
+        config = config or {}
+        modules = dict(DEFAULT_MODULES)
+        for name in DEFAULT_MODULES:
+            path = config.get("paths", {}).get("modules", {}).get(name)
+            if path:
+                modules[name] = path
+        grammar_path = config.get("emotional_grammar", {}).get("path", DEFAULT_GRAMMAR_PATH)
+        if use_artifact:
+            # Imported here: kb_compiler builds on this module.
+            from kb_compiler import load_compiled
+            kb = load_compiled(config, root, modules, grammar_path, reuse)
+            if kb is not None:
+                return kb
+        return cls(root=root, modules=modules, grammar_path=grammar_path, reuse=reuse)
+
+    @classmethod
+    def from_artifact(cls, artifact, root="."):
+        """Restores a knowledge base from a compiled artifact without touching the sources."""
+        kb = cls.__new__(cls)
+        kb.root = root
+        kb.modules = dict(artifact["modules"])
+        kb.grammar_path = artifact["grammar_path"]
+        kb.transmission_profile_path = artifact["transmission_profile_path"]
+        kb.tables = artifact["tables"]
+        kb.sources = {name: os.path.join(root, path) for name, path in artifact["sources"].items()}
+        kb.digests = dict(artifact["digests"])
+        kb.reused = set(kb.sources)
+        kb.grammar = artifact["grammar"]
+        kb.version = artifact["version"]
+        kb.loaded_at = time.time()
+        kb._indexes = artifact["indexes"]
+        kb._derived = artifact["derived"]
+        kb._lock = threading.Lock()
+        return kb
+
+    # === Loading ===
+    def _load(self, reuse):
+        sources = list_sources(self.root, self.modules, self.grammar_path, self.transmission_profile_path)
+        for name, path in sources:
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+                FILE_READS.inc(source="knowledge_base")
+            except Exception as e:
+                print(f"⚠️ Failed to load {'grammar' if name == 'grammar' else 'CSV'}: {e}")
+                continue
+            sha = hashlib.sha256(raw).hexdigest()
+            try:
+                if name in reuse and reuse[name][0] == sha:
+                    parsed = reuse[name][1]
+                    self.reused.add(name)
+                elif name == "grammar":
+                    parsed = json.loads(raw.decode("utf-8"))
+                else:
+                    parsed = parse_table(raw)
+            except Exception as e:
+                print(f"⚠️ Failed to parse {path}: {e}")
+                continue
+            if name == "grammar":
+                self.grammar = parsed
+            else:
+                self.tables[name] = parsed
+            self.sources[name] = path
+            self.digests[name] = sha
+
+        self.version = content_version(self.digests)
+        self.loaded_at = time.time()
+
+    def reusable(self):
+        """{source name: (sha256, parsed content)} to pass as reuse= when rebuilding."""
+        reuse = {name: (self.digests[name], rows) for name, rows in self.tables.items() if name in self.digests}
+        if "grammar" in self.digests:
+            reuse["grammar"] = (self.digests["grammar"], self.grammar)
+        return reuse
+
+    # === Table Access ===
+    def rows(self, name):
+        """Returns the parsed rows of a table, or [] if it was not loaded."""
+        return self.tables.get(name, [])
+
+    def index(self, name, *columns):
+        """
+        Returns {normalized key tuple: [rows]} for the given columns.
+        Built on first use and reused for the lifetime of this knowledge base.
+        """
+        key = (name, columns)
+        index = self._indexes.get(key)
+        if index is None:
+            index = {}
+            for row in self.rows(name):
+                values = tuple(normalize_key(row.get(column)) for column in columns)
+                index.setdefault(values, []).append(row)
+            with self._lock:
+                index = self._indexes.setdefault(key, index)
+        return index
+
+    def lookup(self, name, *values, columns):
+        """Returns the first row whose normalized columns equal the given values, or None."""
+        matches = self.index(name, *columns).get(tuple(normalize_key(v) for v in values))
+        return matches[0] if matches else None
+
+    def warm(self):
+        """Builds all registered derived state up front so the first request pays no compile cost."""
+        for warmer in list(_warmers):
+            try:
+                warmer(self)
+            except Exception as e:
+                print(f"⚠️ Knowledge base warmup failed in {getattr(warmer, '__name__', warmer)}: {e}")
+        return self
+
+    def derive(self, key, factory):
+        """Memoizes state compiled from this knowledge base (lookup tables, scanners, ...)."""
+        if key not in self._derived:
+            value = factory(self)
+            with self._lock:
+                self._derived.setdefault(key, value)
+        return self._derived[key]
+
+
+# === Shared Instance ===
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_knowledge_base(config=None):
+    """Returns the process-wide knowledge base, loading it on first use."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = KnowledgeBase.from_config(config)
+    return _shared
+
+def set_knowledge_base(kb):
+    """Replaces the process-wide knowledge base."""
+    global _shared
+    with _shared_lock:
+        _shared = kb
+    return kb
@@ -0,0 +1,334 @@
+import os
+import queue
+import random
+import asyncio
+import threading
+from metrics import LLM_RETRIES, LLM_FAILURES
+
+# === Optional: Generative AI ===
+try:
+    import openai
+except ImportError:
+    openai = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# === Defaults ===
+# Mirrors the llm section of copilot_config.yaml.
+DEFAULT_LLM_CONFIG = {
+    "backend": "openai",            # openai | stub
+    "model": "gpt-4",
+    "temperature": 0.7,
+    "max_concurrency": 8,           # in-flight completions per process
+    "max_connections": 16,          # pooled keep-alive connections
+    "max_retries": 3,
+    "backoff_base_seconds": 0.5,
+    "backoff_max_seconds": 8.0,
+    "attempt_timeout_seconds": 30,  # one HTTP attempt
+    "deadline_seconds": 60,         # whole call, retries included
+    "stub_latency_seconds": 0.05,
+    "stub_failure_rate": 0.0
+}
+
+
+# === Errors ===
+class LLMError(Exception):
+    pass
+
+class TransientLLMError(LLMError):
+    """Failures worth retrying: timeouts, dropped connections, rate limits, 5xx."""
+    pass
+
+
+# === Backends ===
+class StubBackend:
+    """
+    Offline backend for load tests: sleeps for the configured latency and
+    returns a deterministic story built from the prompt.
+    """
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    async def complete(self, messages, model, temperature, max_tokens, timeout):
+        await asyncio.sleep(self.latency)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise TransientLLMError("stub backend injected failure")
+        prompt = messages[-1]["content"]
+        return (
+            f"[Stub story from {model}: {len(prompt)} prompt chars, max {max_tokens} tokens]\n"
+            f"Classification: N/A"
+        )
+
+    async def stream(self, messages, model, temperature, max_tokens, timeout):
+        text = await self.complete(messages, model, temperature, max_tokens, timeout)
+        for token in text.split(" "):
+            await asyncio.sleep(self.latency / 10)
+            yield token + " "
+
+    async def close(self):
+        pass
+
+
+class OpenAIBackend:
+    """Chat completions over one pooled keep-alive HTTP client per event loop."""
+
+    def __init__(self, api_key, max_connections=16):
+        if openai is None or not hasattr(openai, "AsyncOpenAI"):
+            raise LLMError("openai>=1.0 is required for the openai backend")
+        http_client = None
+        if httpx is not None:
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            http_client = httpx.AsyncClient(limits=limits)
+        # Retries are handled by LLMClient so they share its backoff and deadline.
+        self._client = openai.AsyncOpenAI(api_key=api_key, max_retries=0, http_client=http_client)
+
+    async def complete(self, messages, model, temperature, max_tokens, timeout):
+        try:
+            response = await self._client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+        except (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                openai.InternalServerError) as e:
+            raise TransientLLMError(str(e)) from e
+        except openai.OpenAIError as e:
+            raise LLMError(str(e)) from e
+        return response.choices[0].message.content
+
+    async def stream(self, messages, model, temperature, max_tokens, timeout):
+        try:
+            chunks = await self._client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                stream=True
+            )
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                openai.InternalServerError) as e:
+            raise TransientLLMError(str(e)) from e
+        except openai.OpenAIError as e:
+            raise LLMError(str(e)) from e
+
+    async def close(self):
+        await self._client.close()
+
+
+# === Client ===
+class LLMClient:
+    """
+    Async completion client with bounded concurrency, jittered exponential
+    retries on transient failures and a per-call deadline.
+    """
+
+    def __init__(self, backend, model="gpt-4", temperature=0.7, max_concurrency=8, max_retries=3,
+                 backoff_base_seconds=0.5, backoff_max_seconds=8.0, attempt_timeout_seconds=30,
+                 deadline_seconds=60):
+        self.backend = backend
+        self.model = model
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base_seconds
+        self.backoff_max = backoff_max_seconds
+        self.attempt_timeout = attempt_timeout_seconds
+        self.deadline = deadline_seconds
+        self.max_concurrency = max_concurrency
+        self.retries = 0
+        self.failures = 0
+        self._semaphore = None
+
+    def _backoff(self, attempt):
+        # Full jitter: spreads retries from concurrent callers instead of syncing them up.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def complete(self, messages, max_tokens=800, temperature=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            return await asyncio.wait_for(self._complete_with_retries(messages, max_tokens, temperature), self.deadline)
+        except asyncio.TimeoutError:
+            self.failures += 1
+            LLM_FAILURES.inc()
+            raise LLMError(f"LLM call exceeded {self.deadline}s deadline")
+
+    async def _complete_with_retries(self, messages, max_tokens, temperature):
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    return await asyncio.wait_for(
+                        self.backend.complete(
+                            messages,
+                            model=self.model,
+                            temperature=self.temperature if temperature is None else temperature,
+                            max_tokens=max_tokens,
+                            timeout=self.attempt_timeout
+                        ),
+                        self.attempt_timeout
+                    )
+            except (TransientLLMError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    LLM_FAILURES.inc()
+                    raise LLMError(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+                self.retries += 1
+                LLM_RETRIES.inc()
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+
+    def complete_sync(self, messages, max_tokens=800, temperature=None):
+        """Blocking wrapper for request threads; runs on the shared background event loop."""
+        future = asyncio.run_coroutine_threadsafe(self.complete(messages, max_tokens, temperature), _event_loop())
+        return future.result()
+
+    async def stream(self, messages, max_tokens=800, temperature=None):
+        """
+        Yields completion tokens as they arrive. Transient failures are retried only
+        until the first token has been yielded; after that they end the stream.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._semaphore:
+                    chunks = self.backend.stream(
+                        messages,
+                        model=self.model,
+                        temperature=self.temperature if temperature is None else temperature,
+                        max_tokens=max_tokens,
+                        timeout=self.attempt_timeout
+                    ).__aiter__()
+                    while True:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            self.failures += 1
+                            LLM_FAILURES.inc()
+                            raise LLMError(f"LLM call exceeded {self.deadline}s deadline")
+                        try:
+                            token = await asyncio.wait_for(chunks.__anext__(), min(self.attempt_timeout, remaining))
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield token
+            except (TransientLLMError, asyncio.TimeoutError) as e:
+                if started or attempt >= self.max_retries or loop.time() >= deadline:
+                    self.failures += 1
+                    LLM_FAILURES.inc()
+                    raise LLMError(f"LLM stream failed after {attempt + 1} attempts: {e}") from e
+                self.retries += 1
+                LLM_RETRIES.inc()
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+
+    def stream_sync(self, messages, max_tokens=800, temperature=None):
+        """Blocking iterator over stream(); closing it early cancels the upstream call."""
+        tokens = queue.Queue()
+
+        async def pump():
+            try:
+                async for token in self.stream(messages, max_tokens, temperature):
+                    tokens.put(token)
+            except Exception as e:
+                tokens.put(e)
+            finally:
+                tokens.put(_END_OF_STREAM)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), _event_loop())
+        try:
+            while True:
+                item = tokens.get()
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+
+_END_OF_STREAM = object()
+
+
+# === Background Event Loop ===
+_loop = None
+_loop_lock = threading.Lock()
+
+def _event_loop():
+    """One event loop thread per process, so pooled connections are reused across requests."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+# === Shared Client ===
+_clients = {}
+
+def llm_config(config):
+    options = dict(DEFAULT_LLM_CONFIG)
+    options.update((config or {}).get("llm", {}))
+    return options
+
+def build_llm_client(config):
+    options = llm_config(config)
+    if options["backend"] == "stub":
+        backend = StubBackend(options["stub_latency_seconds"], options["stub_failure_rate"])
+    elif options["backend"] == "openai":
+        api_key = (config or {}).get("openai_api_key") or os.environ.get("OPENAI_API_KEY", "your-api-key")
+        backend = OpenAIBackend(api_key, options["max_connections"])
+    else:
+        raise LLMError(f"Unknown LLM backend: {options['backend']}")
+    return LLMClient(
+        backend,
+        model=options["model"],
+        temperature=options["temperature"],
+        max_concurrency=options["max_concurrency"],
+        max_retries=options["max_retries"],
+        backoff_base_seconds=options["backoff_base_seconds"],
+        backoff_max_seconds=options["backoff_max_seconds"],
+        attempt_timeout_seconds=options["attempt_timeout_seconds"],
+        deadline_seconds=options["deadline_seconds"]
+    )
+
+def llm_available(config):
+    backend = llm_config(config)["backend"]
+    return backend == "stub" or (backend == "openai" and openai is not None)
+
+def get_llm_client(config):
+    """Returns the process-wide client for this llm config, building it on first use."""
+    key = repr(sorted(llm_config(config).items()))
+    client = _clients.get(key)
+    if client is None:
+        with _loop_lock:
+            client = _clients.setdefault(key, build_llm_client(config))
+    return client
+
+def _reset_after_fork():
+    # The loop thread and its pooled connections do not survive fork().
+    global _loop, _loop_lock
+    _loop = None
+    _loop_lock = threading.Lock()
+    _clients.clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,197 @@
+import io
+import os
+import csv
+import time
+import queue
+import atexit
+import threading
+from metrics import LOG_WRITES, LOG_DROPS
+
+# === Defaults ===
+# Mirrors the logging section of copilot_config.yaml.
+DEFAULT_SINK_CONFIG = {
+    "queue_size": 10000,
+    "batch_size": 500,
+    "flush_interval_seconds": 0.5,
+    "fsync": "never",
+    "put_timeout_seconds": 1.0
+}
+
+FSYNC_POLICIES = ("never", "batch")
+
+_STOP = object()
+
+
+# === Log Sink ===
+class LogSink:
+    """
+    Single background writer for all append-only logs (CSV rows and text lines).
+    Request threads only enqueue; the writer groups queued records per file and
+    appends each group with one write, so concurrent requests can no longer
+    interleave or tear rows.
+    """
+
+    def __init__(self, queue_size=10000, batch_size=500, flush_interval_seconds=0.5,
+                 fsync="never", put_timeout_seconds=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync} (expected one of {FSYNC_POLICIES})")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_seconds
+        self.fsync = fsync
+        self.put_timeout = put_timeout_seconds
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config):
+        options = dict(DEFAULT_SINK_CONFIG)
+        options.update({k: v for k, v in (config or {}).get("logging", {}).items() if k in DEFAULT_SINK_CONFIG})
+        return cls(**options)
+
+    # === Producers ===
+    def write_row(self, path, row, header=None):
+        """Queues a CSV row; header is written first if the file is empty when the row lands."""
+        self._put((path, "row", row, header))
+
+    def write_line(self, path, line):
+        """Queues one text line (without trailing newline)."""
+        self._put((path, "line", line, None))
+
+    def write_session(self, store, row):
+        """Queues a session row (dict) for a SessionStore; rows are inserted per batch in one transaction."""
+        self._put((store.path, "session", row, store))
+
+    def _put(self, record):
+        if self._closed:
+            print(f"⚠️ Log sink closed, dropping record for {record[0]}")
+            self.dropped += 1
+            LOG_DROPS.inc()
+            return
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            LOG_DROPS.inc()
+            print(f"⚠️ Log queue full, dropping record for {record[0]}")
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Blocks until everything queued so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Drains the queue, writes the last batch and stops the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    # === Writer ===
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            stop = first is _STOP
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(record)
+                stop = record is _STOP
+
+            records = [record for record in batch if record is not _STOP]
+            try:
+                self._write_batch(records)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, records):
+        by_path = {}
+        for record in records:
+            by_path.setdefault(record[0], []).append(record)
+
+        for path, items in by_path.items():
+            try:
+                if items[0][1] == "session":
+                    items[0][3].append_rows([payload for _, _, payload, _ in items])
+                    self._count_written(path, items)
+                    continue
+                with open(path, "ab", buffering=0) as f:
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    size = os.fstat(f.fileno()).st_size
+                    for _, kind, payload, header in items:
+                        if kind == "row":
+                            if header and size == 0 and buffer.tell() == 0:
+                                writer.writerow(header)
+                            writer.writerow(payload)
+                        else:
+                            buffer.write(payload + "\n")
+                    data = buffer.getvalue().encode("utf-8")
+                    view = memoryview(data)
+                    while view:
+                        view = view[f.write(view):]
+                    if self.fsync == "batch":
+                        os.fsync(f.fileno())
+                self._count_written(path, items)
+            except Exception as e:
+                self.dropped += len(items)
+                LOG_DROPS.inc(len(items))
+                print(f"⚠️ Failed to write log batch to {path}: {e}")
+
+    def _count_written(self, path, items):
+        self.written += len(items)
+        LOG_WRITES.inc(len(items), file=os.path.basename(path))
+
+
+# === Shared Instance ===
+_shared = None
+_shared_config = None
+_shared_lock = threading.Lock()
+
+def get_log_sink(config=None):
+    """
+    Returns the process-wide log sink, starting it on first use. Without a config
+    it is built from the config it was last started with.
+    """
+    global _shared, _shared_config
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared_config = config if config is not None else _shared_config
+                _shared = LogSink.from_config(_shared_config)
+                atexit.register(_shared.close)
+    return _shared
+
+def _forget_after_fork():
+    # The writer thread does not survive fork(); the child starts its own sink
+    # on first use, with the parent's config, and leaves records queued before
+    # the fork to the parent.
+    global _shared, _shared_lock
+    _shared = None
+    _shared_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_forget_after_fork)
+
+def close_log_sink():
+    """Drains and stops the process-wide log sink."""
+    global _shared
+    with _shared_lock:
+        sink, _shared = _shared, None
+    if sink is not None:
+        sink.close()
@@ -0,0 +1,156 @@
+import os
+import csv
+import mmap
+import threading
+from collections import deque
+from metrics import FILE_READS
+
+# === Defaults ===
+DEFAULT_WINDOW_ROWS = 5000
+DEFAULT_PAGE_SIZE = 100
+
+
+# === Session Log Tail ===
+class SessionLogTail:
+    """
+    Incremental reader for an append-only CSV log (classification_copilot_0210.csv).
+    Remembers the byte offset it has read up to and, on refresh(), parses only the
+    bytes appended since, through a read-only mmap. The newest window_rows rows stay
+    in memory; older pages are read back from the file through a sparse offset index.
+    Per-actor class-code counts are updated row by row as the log grows.
+    """
+
+    def __init__(self, path, window_rows=DEFAULT_WINDOW_ROWS, page_size=DEFAULT_PAGE_SIZE,
+                 group_column="actor", count_column="class_code"):
+        self.path = path
+        self.window_rows = window_rows
+        self.page_size = page_size
+        self.group_column = group_column
+        self.count_column = count_column
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.header = []
+        self.total_rows = 0
+        self.counts = {}
+        self.offset = 0
+        self._identity = None
+        self._window = deque(maxlen=self.window_rows)
+        # Byte offset of row 0, page_size, 2 * page_size, ... for reading old pages.
+        self._checkpoints = []
+
+    # === Reading ===
+    def refresh(self):
+        """Reads rows appended since the last call. Returns how many were added."""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                return 0
+            identity = (stat.st_dev, stat.st_ino)
+            # A replaced or truncated log starts over from the top.
+            if identity != self._identity or stat.st_size < self.offset:
+                self._reset()
+                self._identity = identity
+            if stat.st_size == self.offset:
+                return 0
+
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                FILE_READS.inc(source="log_viewer")
+                # Stop at the last complete line; a row still being written is picked up next time.
+                end = view.rfind(b"\n", self.offset, stat.st_size) + 1
+                if end <= self.offset:
+                    return 0
+                added = self._consume(view, self.offset, end)
+                self.offset = end
+            return added
+
+    def _lines(self, view, start, end, positions):
+        position = start
+        while position < end:
+            stop = view.find(b"\n", position, end)
+            stop = end if stop < 0 else stop + 1
+            positions.append(position)
+            yield view[position:stop].decode("utf-8-sig" if position == 0 else "utf-8", errors="replace")
+            position = stop
+
+    def _consume(self, view, start, end):
+        positions = []
+        reader = csv.reader(self._lines(view, start, end, positions))
+        group = count = None
+        added = 0
+        while True:
+            first_line = len(positions)
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            if not row:
+                continue
+            if not self.header:
+                self.header = row
+                continue
+            if group is None:
+                group = self._column(self.group_column)
+                count = self._column(self.count_column)
+
+            row_offset = positions[first_line]
+            if self.total_rows % self.page_size == 0:
+                self._checkpoints.append(row_offset)
+            self._window.append(row)
+            self.total_rows += 1
+            added += 1
+            if group is not None and count is not None:
+                actor = row[group] if group < len(row) else ""
+                code = row[count] if count < len(row) else ""
+                codes = self.counts.setdefault(actor, {})
+                codes[code] = codes.get(code, 0) + 1
+        return added
+
+    def _column(self, name):
+        return self.header.index(name) if name in self.header else None
+
+    # === Paging ===
+    def page_count(self):
+        return (self.total_rows + self.page_size - 1) // self.page_size
+
+    def page(self, number=0):
+        """Rows of page number (0 = newest), newest first."""
+        with self._lock:
+            newest = self.total_rows - number * self.page_size
+            oldest = max(newest - self.page_size, 0)
+            if newest <= 0:
+                return []
+            window_start = self.total_rows - len(self._window)
+            if oldest >= window_start:
+                rows = [self._window[i - window_start] for i in range(oldest, newest)]
+            else:
+                rows = self._read_rows(oldest, newest)
+        rows.reverse()
+        return rows
+
+    def records(self, number=0):
+        """page() as dicts keyed by the header, so rows of a different width still line up."""
+        return [dict(zip(self.header, row)) for row in self.page(number)]
+
+    def _read_rows(self, first, stop):
+        """Rows [first, stop) read back from the file, starting at the nearest checkpoint."""
+        checkpoint = first // self.page_size
+        skip = first - checkpoint * self.page_size
+        start = self._checkpoints[checkpoint]
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            FILE_READS.inc(source="log_viewer")
+            reader = csv.reader(self._lines(view, start, self.offset, []))
+            rows = []
+            for row in reader:
+                if not row:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                rows.append(row)
+                if len(rows) == stop - first:
+                    break
+        return rows
@@ -0,0 +1,181 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# === Defaults ===
+# Latency buckets in seconds: sub-millisecond rule stages up to slow LLM calls.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# === Metric Types ===
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values → [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def totals(self):
+        """{label values: (sum, count)} for every series observed so far."""
+        with self._lock:
+            return {key: (series[-2], series[-1]) for key, series in self._series.items()}
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        lines = []
+        for key, series in sorted(snapshot.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append((f"{self.name}_bucket", _labels(self.labelnames, key, f'le="{_number(bound)}"'), count))
+            lines.append((f"{self.name}_bucket", _labels(self.labelnames, key, 'le="+Inf"'), series[-1]))
+            lines.append((f"{self.name}_sum", _labels(self.labelnames, key), series[-2]))
+            lines.append((f"{self.name}_count", _labels(self.labelnames, key), series[-1]))
+        return lines
+
+
+class CallbackMetric:
+    """Value read at scrape time. fn returns a number or a list of (labels dict, number)."""
+
+    def __init__(self, name, help, fn, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"⚠️ Metric {self.name} failed: {e}")
+            return []
+        if value is None:
+            return []
+        if isinstance(value, (int, float)):
+            return [(self.name, "", value)]
+        return [(self.name, _labels(labels.keys(), labels.values()), number) for labels, number in value]
+
+
+# === Registry ===
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not isinstance(metric, CallbackMetric):
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, fn, kind="gauge"):
+        """Registers (or replaces) a metric computed at scrape time."""
+        return self._register(CallbackMetric(name, help, fn, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+
+# === Engine Metrics ===
+STAGE_SECONDS = registry.histogram(
+    "narrative_stage_seconds", "Time spent in each narrative engine stage.", ["stage"])
+NARRATIVE_SECONDS = registry.histogram(
+    "narrative_generate_seconds", "End-to-end generate_narrative time by path.", ["path"])
+FILE_READS = registry.counter(
+    "narrative_file_reads_total", "Files read by the engine.", ["source"])
+LOG_WRITES = registry.counter(
+    "narrative_log_records_written_total", "Log records appended by the log writer.", ["file"])
+LOG_DROPS = registry.counter(
+    "narrative_log_records_dropped_total", "Log records dropped (queue full, sink closed or write error).")
+SESSION_STAGES = registry.counter(
+    "narrative_session_stages_total", "Pipeline stages reused from the user's previous turn or computed.", ["stage", "outcome"])
+CRITICAL_PATH_STAGES = registry.counter(
+    "narrative_critical_path_total", "Requests whose stage-graph critical path ran through each stage.", ["stage"])
+LLM_RETRIES = registry.counter(
+    "narrative_llm_retries_total", "LLM attempts retried after a transient failure.")
+LLM_FAILURES = registry.counter(
+    "narrative_llm_failures_total", "LLM calls that failed after retries or hit their deadline.")
+
+def span(stage):
+    """Times one engine stage: with span("geometry_overlay"): ..."""
+    return STAGE_SECONDS.time(stage=stage)
@@ -1,18 +1,22 @@
-import os
 import yaml
 import json
 import csv
+import time
 from datetime import datetime
-from reflex_logic import process_reflex_bundle, get_containment_strategy
-from classification import classify_and_embed
+from reflex_logic import build_reflex_bundle, log_reflex_bundle, get_containment_strategy
+from classification import embed_classification, write_classification_output
+from classification_engine import classify_actor_from_wheel
 from geometry_resolver import resolve_geometry_state
 from dual_narrative_trainer import inject_trainer_stage, inject_recentering_stage
-
-# === Optional: Generative AI ===
-try:
-    import openai
-except ImportError:
-    openai = None
+from knowledge_base import get_knowledge_base, register_warmer, WHEEL_CODEX, TRANSMISSION_PROFILE
+from trigger_scanner import scan_triggers, matched_rows
+from log_sink import get_log_sink
+from llm_client import get_llm_client, llm_available
+from result_cache import get_result_cache
+from session_store import get_session_store
+from session_state import get_session_states, run_stage
+from pipeline import Stage, StageGraph, get_stage_pool
+from metrics import span, STAGE_SECONDS, NARRATIVE_SECONDS
 
 # === Loaders ===
 def load_config(path):
@@ -35,16 +39,18 @@ def write_text(path, content):
     with open(path, 'w', encoding='utf-8') as f:
         f.write(content)
 
-def load_transmission_profile(path="classification_transmission_map.csv"):
-    rows = load_csv(path)
-    return {row["code"]: row for row in rows}
+@register_warmer
+def load_transmission_profile(kb):
+    return kb.derive(TRANSMISSION_PROFILE, lambda kb: {row["code"]: row for row in kb.rows(TRANSMISSION_PROFILE)})
 
 # === Wheel State Detection ===
-def detect_wheel_state(voice_input, background, wheel_codex_path):
-    codex = load_csv(wheel_codex_path)
-    for row in codex:
-        if row.get("notes", "") in voice_input or row.get("rupture_trigger", "") in background:
-            return row.get("color", "neutral")
+def detect_wheel_state(voice_input, background, kb, matches=None):
+    if matches is None:
+        matches = scan_triggers(kb, voice_input, background)
+    # First codex row whose notes occur in the voice input or whose rupture trigger occurs in the background
+    hits = matched_rows(matches, WHEEL_CODEX)
+    if hits:
+        return kb.rows(WHEEL_CODEX)[hits[0]].get("color", "neutral")
     return "neutral"
 
 # === Tone Modulation ===
@@ -60,9 +66,7 @@ def modulate_tone(wheel_state, grammar, archetype_variant=None, geometry_alert=N
 # === Classification Logging ===
 def log_classification(user_id, actor, class_code, log_path):
     timestamp = datetime.now().strftime("%a %b %d %Y (%H:%M)")
-    with open(log_path, 'a', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([timestamp, user_id, actor, class_code])
+    get_log_sink().write_row(log_path, [timestamp, user_id, actor, class_code])
 
 # === Input Flattening ===
 def flatten_inputs(inputs):
@@ -90,134 +94,333 @@ def build_story(inputs, classification):
 """.strip()
 
 # === Main Narrative Engine ===
-def generate_narrative(inputs, actor, user_id, background="", config={}):
-    if len(inputs) != 9:
-        return "❌ Error: Expected 9 inputs."
-
-    use_generative = config.get("runtime", {}).get("use_generative_ai", False)
-    line_count = config.get("runtime", {}).get("story_line_count", 20)
-    voice_input = flatten_inputs(inputs[:4])
-    background_input = flatten_inputs(inputs[4:])
-
-    if use_generative and openai:
-        prompt = (
-            f"You are a storytelling assistant.\n\n"
-            f"Voice Input:\n{voice_input}\n\n"
-            f"Background:\n{background_input}\n\n"
-            f"Generate a dual narrative story in {line_count} lines.\n"
-            f"Return the story first, then the classification label on a new line prefixed with 'Classification:'"
-        )
-
-        openai.api_key = config.get("openai_api_key", "your-api-key")
-
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a storytelling assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=min(1500, line_count * 50)
-            )
-            output = response["choices"][0]["message"]["content"]
-            lines = output.splitlines()
-
-            if lines and "Classification:" in lines[-1]:
-                classification = lines[-1].replace("Classification:", "").strip()
-                narrative = "\n".join(lines[:-1])
-            else:
-                classification = config.get("defaults", {}).get("fallback_archetype", "none")
-                narrative = "\n".join(lines)
-
-        except Exception as e:
-            narrative = f"[Error] Failed to generate story: {e}"
-            classification = config.get("defaults", {}).get("fallback_archetype", "none")
-
-    else:
-        grammar = load_grammar(config["emotional_grammar"]["path"])
-        modules = config["paths"]["modules"]
-
-        reflex_wheel_state = detect_wheel_state(
-            voice_input,
-            background_input,
-            os.path.join(modules["geometry"], "wheel_codex.csv")
-        )
-
-        actor_wheel_state = inputs[8]
-
-        wheel_domains = {
-            "blue": inputs[4],
-            "red": inputs[5],
-            "yellow": inputs[6],
-            "green": inputs[7],
-            "centre": inputs[8]
-        }
-
-        reflex_bundle = process_reflex_bundle(
+def generative_messages(voice_input, background_input, line_count):
+    prompt = (
+        f"You are a storytelling assistant.\n\n"
+        f"Voice Input:\n{voice_input}\n\n"
+        f"Background:\n{background_input}\n\n"
+        f"Generate a dual narrative story in {line_count} lines.\n"
+        f"Return the story first, then the classification label on a new line prefixed with 'Classification:'"
+    )
+    return [
+        {"role": "system", "content": "You are a storytelling assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def split_classification(output, config):
+    """Returns (story, classification) from generated text ending in a 'Classification:' line."""
+    lines = output.splitlines()
+    if lines and "Classification:" in lines[-1]:
+        return "\n".join(lines[:-1]), lines[-1].replace("Classification:", "").strip()
+    return "\n".join(lines), config.get("defaults", {}).get("fallback_archetype", "none")
+
+# === Narrative Stage Graph ===
+# Each stage reads the request values and earlier outputs it names and, with
+# session_state enabled, reuses the user's previous-turn result when its inputs
+# are unchanged. Stage outputs may be shared with later turns: never mutate them.
+def _stage_wheel_state(kb, session, scan_cache, voice_input, background_input):
+    def wheel_state():
+        matches = scan_cache.get((voice_input, background_input)) if scan_cache is not None else None
+        if matches is None:
+            matches = scan_triggers(kb, voice_input, background_input)
+            if scan_cache is not None:
+                scan_cache[(voice_input, background_input)] = matches
+        return matches, detect_wheel_state(voice_input, background_input, kb, matches)
+    return run_stage(session, "wheel_state", (voice_input, background_input), wheel_state)
+
+def _stage_reflex_bundle(kb, session, actor, voice_input, wheel_domains, domains_key, actor_wheel_state,
+                         matches, reflex_wheel_state):
+    return run_stage(
+        session, "reflex_bundle", (actor, voice_input, domains_key, reflex_wheel_state),
+        lambda: build_reflex_bundle(
             actor=actor,
             actor_wheel_state=actor_wheel_state,
             reflex_wheel_state=reflex_wheel_state,
             voice_input=voice_input,
-            transmission_map_path=os.path.join(modules["geometry"], "transmission_map.csv"),
-            classification_path=os.path.join(modules["classification"], "archetype_classification.csv"),
-            taxonomy_path=os.path.join(modules["reflex"], "7_reflex_taxonomy.csv"),
+            kb=kb,
             wheel_domains=wheel_domains,
-            wheel_layers_path=os.path.join(modules["geometry"], "wheel_layers.csv"),
-            polarity_drift_path=os.path.join(modules["geometry"], "polarity_drift.csv")
+            matches=matches
         )
-
-        geometry_overlay = resolve_geometry_state(
+    )
+
+def _stage_session_log(config, actor, user_id, base_bundle):
+    log_reflex_bundle(base_bundle, actor, user_id=user_id, session_store=get_session_store(config))
+
+def _stage_geometry_overlay(kb, session, wheel_domains, domains_key):
+    return run_stage(session, "geometry_overlay", domains_key,
+                     lambda: resolve_geometry_state(wheel_domains=wheel_domains, kb=kb))
+
+def _stage_reflex_overlay(base_bundle, geometry_overlay):
+    return dict(base_bundle, **geometry_overlay)
+
+def _stage_classification(kb, session, actor, actor_wheel_state, base_bundle):
+    classification_key = (actor, actor_wheel_state, base_bundle["reflex_type"])
+    classification_result = run_stage(session, "classification", classification_key,
+                                      lambda: classify_actor_from_wheel(*classification_key, kb))
+    return classification_result, embed_classification(*classification_key, classification_result)
+
+def _stage_trainer_injection(kb, session, actor, wheel_domains, domains_key, reflex_bundle):
+    reflex_type = reflex_bundle.get("reflex_type", "neutral")
+    containment_strategy = reflex_bundle.get("containment_strategy", "default silence")
+    return run_stage(
+        session, "trainer_injection", (actor, domains_key, reflex_type, containment_strategy),
+        lambda: (inject_trainer_stage(actor, wheel_domains, reflex_type, containment_strategy, kb),
+                 inject_recentering_stage(actor, wheel_domains))
+    )
+
+def _stage_transmission_profile(kb, config, classification_data):
+    classification = classification_data.get("class_code", config.get("defaults", {}).get("fallback_archetype", "none"))
+    return load_transmission_profile(kb).get(classification, {})
+
+def _stage_tone(kb, reflex_wheel_state, classification_data, reflex_bundle):
+    return modulate_tone(reflex_wheel_state, kb.grammar,
+                         archetype_variant=classification_data.get("archetype_variant", "unknown"),
+                         geometry_alert=reflex_bundle.get("geometry_alert", None))
+
+def _stage_containment(kb, session, voice_input, wheel_domains, domains_key, matches, reflex_wheel_state):
+    return run_stage(
+        session, "containment", (reflex_wheel_state, voice_input, domains_key),
+        lambda: get_containment_strategy(
+            reflex_wheel_state,
+            voice_input,
+            kb,
             wheel_domains=wheel_domains,
-            layers_path=os.path.join(modules["geometry"], "wheel_layers.csv"),
-            codex_path=os.path.join(modules["geometry"], "wheel_codex.csv"),
-            drift_path=os.path.join(modules["geometry"], "polarity_drift.csv"),
-            ml_instruction_path=os.path.join(modules["engine_boot"], "ml_instruction.csv")
+            matches=matches
         )
-
-        reflex_bundle.update(geometry_overlay)
-
-        classification_data = classify_and_embed(
-            actor=actor,
-            actor_wheel_state=actor_wheel_state,
-            reflex_type=reflex_bundle["reflex_type"]
-        )
-
-        classification = classification_data.get("class_code", config.get("defaults", {}).get("fallback_archetype", "none"))
-        variant = classification_data.get("archetype_variant", "unknown")
-        geometry_alert = reflex_bundle.get("geometry_alert", None)
-        containment_strategy = reflex_bundle.get("containment_strategy", "default silence")
-        reflex_type = reflex_bundle.get("reflex_type", "neutral")
-
-        trainer_stage_id, trainer_stage_name = inject_trainer_stage(actor, wheel_domains, reflex_type, containment_strategy)
-        recentre_stage_id, recentre_stage_name = inject_recentering_stage(actor, wheel_domains)
-
-        transmission_map = load_transmission_profile()
-        transmission = transmission_map.get(classification, {})
-
-        narrative = modulate_tone(reflex_wheel_state, grammar, archetype_variant=variant, geometry_alert=geometry_alert)
-
-        narrative += (
-            f"\n\n[Transmission Profile]"
-            f"\nDirection: {transmission.get('direction', 'unspecified')}"
-            f"\nMode: {transmission.get('mode', 'unspecified')}"
-            f"\nDescription: {transmission.get('description', 'unspecified')}"
+    )
+
+NARRATIVE_GRAPH = StageGraph([
+    Stage("wheel_state", _stage_wheel_state,
+          ["kb", "session", "scan_cache", "voice_input", "background_input"], ["matches", "reflex_wheel_state"]),
+    Stage("reflex_bundle", _stage_reflex_bundle,
+          ["kb", "session", "actor", "voice_input", "wheel_domains", "domains_key", "actor_wheel_state",
+           "matches", "reflex_wheel_state"], ["base_bundle"]),
+    # Only queues log records, but a full log queue blocks the writer for up to its put timeout.
+    Stage("session_log", _stage_session_log, ["config", "actor", "user_id", "base_bundle"], offload=True),
+    Stage("geometry_overlay", _stage_geometry_overlay,
+          ["kb", "session", "wheel_domains", "domains_key"], ["geometry_overlay"]),
+    Stage("reflex_overlay", _stage_reflex_overlay, ["base_bundle", "geometry_overlay"], ["reflex_bundle"]),
+    Stage("classification", _stage_classification,
+          ["kb", "session", "actor", "actor_wheel_state", "base_bundle"],
+          ["classification_result", "classification_data"]),
+    Stage("trainer_injection", _stage_trainer_injection,
+          ["kb", "session", "actor", "wheel_domains", "domains_key", "reflex_bundle"], ["trainer_stages"]),
+    Stage("transmission_profile", _stage_transmission_profile,
+          ["kb", "config", "classification_data"], ["transmission"]),
+    Stage("tone", _stage_tone, ["kb", "reflex_wheel_state", "classification_data", "reflex_bundle"], ["tone"]),
+    Stage("containment", _stage_containment,
+          ["kb", "session", "voice_input", "wheel_domains", "domains_key", "matches", "reflex_wheel_state"],
+          ["containment"])
+])
+
+def narrative_run(inputs, actor, config, kb, scan_cache=None, user_id="anonymous"):
+    """Starts NARRATIVE_GRAPH for one request; stages run as their outputs are asked for."""
+    states = get_session_states(config)
+    return NARRATIVE_GRAPH.start({
+        "kb": kb,
+        "config": config,
+        "session": states.session(user_id, kb.version) if states is not None else None,
+        "scan_cache": scan_cache,
+        "actor": actor,
+        "user_id": user_id,
+        "voice_input": flatten_inputs(inputs[:4]),
+        "background_input": flatten_inputs(inputs[4:]),
+        "wheel_domains": {
+            "blue": inputs[4],
+            "red": inputs[5],
+            "yellow": inputs[6],
+            "green": inputs[7],
+            "centre": inputs[8]
+        },
+        "domains_key": tuple(inputs[4:9]),
+        "actor_wheel_state": inputs[8]
+    }, get_stage_pool(config))
+
+# === Log Records ===
+# Fields of the reflex bundle that log_reflex_bundle writes.
+LOGGED_BUNDLE_FIELDS = ("actor_wheel_state", "reflex_wheel_state", "reflex_type", "class_code",
+                        "archetype_variant", "containment_required", "progressive")
+
+def log_cached_narrative(log_record, actor, user_id, config):
+    """
+    Writes the session log, session store and classification rows a pipeline run
+    wrote (see narrative_sections' log_record) again, for the user now served
+    that run's narrative from the result cache.
+    """
+    if not log_record:
+        return
+    log_reflex_bundle(log_record["reflex_bundle"], actor, user_id=user_id, session_store=get_session_store(config))
+    write_classification_output(actor, log_record["actor_wheel_state"], log_record["reflex_type"],
+                                log_record["classification"])
+
+def narrative_sections(inputs, actor, config, kb, scan_cache=None, user_id="anonymous", log_record=None):
+    """
+    Runs the rule-based pipeline and yields (section, text) as each stage finishes:
+    tone, transmission_profile, containment_strategy and suggested_action.
+    The texts joined in order form the full narrative.
+    Stages run through NARRATIVE_GRAPH, so each runs once and offloaded ones
+    (the session log write) overlap the rest; see pipeline.py.
+    With session_state enabled, each stage whose inputs are unchanged since the
+    user's previous turn reuses that turn's result instead of running again.
+    log_record: optional dict, filled with what the run logged (see log_cached_narrative).
+    """
+    run = narrative_run(inputs, actor, config, kb, scan_cache, user_id)
+    yield "tone", run.get("tone")
+
+    transmission = run.get("transmission")
+    yield "transmission_profile", (
+        f"\n\n[Transmission Profile]"
+        f"\nDirection: {transmission.get('direction', 'unspecified')}"
+        f"\nMode: {transmission.get('mode', 'unspecified')}"
+        f"\nDescription: {transmission.get('description', 'unspecified')}"
+    )
+
+    yield "containment_strategy", f"\n\n[Containment Strategy]\n{run.get('containment')}"
+
+    reflex_bundle = run.get("reflex_bundle")
+    values = run.wait_all()
+    run.record_critical_path()
+    if log_record is not None:
+        log_record.update(
+            reflex_bundle={field: values["base_bundle"][field] for field in LOGGED_BUNDLE_FIELDS},
+            actor_wheel_state=values["actor_wheel_state"],
+            reflex_type=values["base_bundle"]["reflex_type"],
+            classification=values["classification_result"]
         )
+    if transmission.get("mode") == "tantra spectacle":
+        yield "suggested_action", "\n\n[Suggested Action]\nNo action suggested — spectacle path not supported."
+    elif "suggested_action" in reflex_bundle:
+        yield "suggested_action", f"\n\n[Suggested Action]\n{reflex_bundle['suggested_action']}"
+
+def prepare_narrative(inputs, actor, config, kb):
+    """
+    Returns (use_generative, kb, cache, cache_key, cached entry or None).
+    Cache entries are {"narrative": text, "log_record": dict or None}.
+    """
+    use_generative = config.get("runtime", {}).get("use_generative_ai", False) and llm_available(config)
+    if not use_generative:
+        kb = kb or get_knowledge_base(config)
+
+    cache = get_result_cache(config)
+    if cache is None:
+        return use_generative, kb, None, None, None
+    cache_key = cache.key(inputs, actor, config, None if use_generative else kb.version)
+    cached = cache.get(cache_key)
+    if not isinstance(cached, dict):
+        # Bare narratives from older disk entries carry nothing to log; recompute them.
+        cached = None
+    return use_generative, kb, cache, cache_key, cached
+
+def generate_narrative(inputs, actor, user_id, background="", config={}, kb=None, scan_cache=None):
+    """
+    Generates one dual narrative from the 9 input fields.
+    scan_cache: optional dict shared across calls to reuse trigger scans of identical inputs.
+    Finished narratives are served from the result cache when enabled; cache hits skip
+    the pipeline but still write the session log, session store and classification
+    rows for this user_id.
+    """
+    if len(inputs) != 9:
+        return "❌ Error: Expected 9 inputs."
 
-        containment = get_containment_strategy(
-            reflex_wheel_state,
-            voice_input,
-            os.path.join(modules["geometry"], "transmission_map.csv"),
-            wheel_domains=wheel_domains
-        )
+    started = time.perf_counter()
+    use_generative, kb, cache, cache_key, cached = prepare_narrative(inputs, actor, config, kb)
+    if cached is not None:
+        log_cached_narrative(cached["log_record"], actor, user_id, config)
+        NARRATIVE_SECONDS.observe(time.perf_counter() - started, path="cached")
+        return cached["narrative"]
 
-        narrative += f"\n\n[Containment Strategy]\n{containment}"
+    log_record = {}
+    if use_generative:
+        line_count = config.get("runtime", {}).get("story_line_count", 20)
+        try:
+            with span("llm_call"):
+                output = get_llm_client(config).complete_sync(
+                    generative_messages(flatten_inputs(inputs[:4]), flatten_inputs(inputs[4:]), line_count),
+                    max_tokens=min(1500, line_count * 50)
+                )
+            narrative, classification = split_classification(output, config)
+        except Exception as e:
+            narrative = f"[Error] Failed to generate story: {e}"
 
-        if transmission.get("mode") == "tantra spectacle":
-            narrative += "\n\n[Suggested Action]\nNo action suggested — spectacle path not supported."
-        elif "suggested_action" in reflex_bundle:
-            narrative += f"\n\n[Suggested Action]\n{reflex_bundle['suggested_action']}"
+    else:
+        narrative = "".join(text for _, text in narrative_sections(inputs, actor, config, kb, scan_cache, user_id,
+                                                                  log_record))
 
+    if cache is not None and not narrative.startswith("[Error]"):
+        cache.put(cache_key, {"narrative": narrative, "log_record": log_record or None})
+    NARRATIVE_SECONDS.observe(time.perf_counter() - started, path="generative" if use_generative else "rule")
     return narrative
 
+# === Streaming Narrative Engine ===
+def generate_narrative_stream(inputs, actor, user_id, background="", config={}, kb=None):
+    """
+    Streaming form of generate_narrative. Yields (event, text) pairs:
+    one per rule-based section as its stage finishes, "token" for each LLM token in
+    generative mode, "cached" for a whole narrative from the result cache, and "error".
+    """
+    if len(inputs) != 9:
+        yield "error", "❌ Error: Expected 9 inputs."
+        return
+
+    use_generative, kb, cache, cache_key, cached = prepare_narrative(inputs, actor, config, kb)
+    if cached is not None:
+        log_cached_narrative(cached["log_record"], actor, user_id, config)
+        yield "cached", cached["narrative"]
+        return
+
+    log_record = {}
+    if use_generative:
+        line_count = config.get("runtime", {}).get("story_line_count", 20)
+        output = ""
+        started = time.perf_counter()
+        try:
+            for token in get_llm_client(config).stream_sync(
+                generative_messages(flatten_inputs(inputs[:4]), flatten_inputs(inputs[4:]), line_count),
+                max_tokens=min(1500, line_count * 50)
+            ):
+                output += token
+                yield "token", token
+        except Exception as e:
+            yield "error", f"[Error] Failed to generate story: {e}"
+            return
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_stream")
+        narrative, classification = split_classification(output, config)
 
+    else:
+        narrative = ""
+        for section, text in narrative_sections(inputs, actor, config, kb, user_id=user_id, log_record=log_record):
+            narrative += text
+            yield section, text
+
+    if cache is not None:
+        cache.put(cache_key, {"narrative": narrative, "log_record": log_record or None})
+
+# === Batch Narrative Engine ===
+def normalize_record(record):
+    """
+    Accepts a 9-field list or a dict with "inputs" (or "voice_inputs" + "background_inputs"),
+    "actor", "user_id" and "background". Returns (inputs, actor, user_id, background).
+    """
+    if isinstance(record, (list, tuple)):
+        return list(record), "User", "anonymous", ""
+    inputs = record.get("inputs")
+    if inputs is None:
+        inputs = list(record.get("voice_inputs", [])) + list(record.get("background_inputs", []))
+    elif len(inputs) == 4 and record.get("background_inputs"):
+        inputs = list(inputs) + list(record["background_inputs"])
+    return inputs, record.get("actor", "User"), record.get("user_id", "anonymous"), record.get("background", "")
+
+def generate_narratives(batch, config={}, kb=None):
+    """
+    Generates narratives for many records in one call.
+    Table loading, trigger scans of repeated inputs and geometry overlays are shared across the batch.
+    Returns one narrative per record, in input order.
+    """
+    kb = kb or get_knowledge_base(config)
+    scan_cache = {}
+    narratives = []
+    for record in batch:
+        inputs, actor, user_id, background = normalize_record(record)
+        narratives.append(generate_narrative(inputs, actor, user_id, background, config, kb=kb, scan_cache=scan_cache))
+    return narratives
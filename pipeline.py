@@ -0,0 +1,301 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import STAGE_SECONDS, CRITICAL_PATH_STAGES
+
+# === Defaults ===
+# Mirrors the pipeline section of copilot_config.yaml.
+DEFAULT_PIPELINE_CONFIG = {
+    "enabled": True,
+    "max_workers": 4
+}
+
+
+# === Stages ===
+class Stage:
+    """
+    One pipeline step. fn is called with one keyword argument per name in inputs
+    and returns the value of its single output, a tuple for several outputs, or
+    nothing when it has none (side effects such as log writes).
+    offload: run it on the stage pool instead of the calling thread; meant for
+    steps that wait on I/O (log queues, remote calls) rather than compute.
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), offload=False):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.offload = offload
+
+    def __repr__(self):
+        return f"Stage({self.name}: {', '.join(self.inputs)} -> {', '.join(self.outputs)})"
+
+
+class StageGraph:
+    """
+    Stages wired by name: an input produced by another stage is a dependency,
+    any other input must be supplied when the graph is started. Validated once,
+    at construction: every output has exactly one producer and there are no cycles.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.producers = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"{output} is produced by both {self.producers[output].name} and {stage.name}")
+                self.producers[output] = stage
+        self.dependencies = {}
+        self.dependents = {stage.name: [] for stage in self.stages}
+        for stage in self.stages:
+            producers = (self.producers[name] for name in stage.inputs if name in self.producers)
+            self.dependencies[stage.name] = list({producer.name: producer for producer in producers}.values())
+            for dependency in self.dependencies[stage.name]:
+                self.dependents[dependency.name].append(stage)
+        self.dependency_counts = {name: len(dependencies) for name, dependencies in self.dependencies.items()}
+        self.order = self._topological_order()
+        self.position = {stage.name: i for i, stage in enumerate(self.order)}
+        self.external_inputs = sorted({name for stage in self.stages for name in stage.inputs} - set(self.producers))
+
+    def _topological_order(self):
+        # Kahn's algorithm; ties keep declaration order, which is the order a pool-less run uses.
+        remaining = dict(self.dependency_counts)
+        order = []
+        ready = [stage for stage in self.stages if not remaining[stage.name]]
+        while ready:
+            stage = ready.pop(0)
+            order.append(stage)
+            for dependent in self.dependents[stage.name]:
+                remaining[dependent.name] -= 1
+                if not remaining[dependent.name]:
+                    ready.append(dependent)
+            ready.sort(key=self.stages.index)
+        if len(order) != len(self.stages):
+            cyclic = [name for name, count in remaining.items() if count]
+            raise ValueError(f"Stage graph has a cycle through {', '.join(cyclic)}")
+        return order
+
+    def start(self, values, pool=None):
+        """Begins a run over the given external input values; see PipelineRun."""
+        missing = [name for name in self.external_inputs if name not in values]
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {', '.join(missing)}")
+        return PipelineRun(self, values, pool)
+
+
+# === Runs ===
+class PipelineRun:
+    """
+    One execution of a StageGraph. Nothing runs until a value is requested:
+    get(name) starts every stage whose inputs are available, offloaded stages on
+    the pool and the rest in the calling thread, until name is produced. Each
+    stage runs at most once, so outputs shared by several stages are computed once.
+    Without a pool every stage runs inline in topological order.
+    """
+
+    def __init__(self, graph, values, pool=None):
+        self.graph = graph
+        self.pool = pool
+        self.values = dict(values)
+        self.started_at = time.perf_counter()
+        self.timings = {}       # {stage: (start, end)} relative to started_at
+        self._waiting = dict(graph.dependency_counts)
+        self._ready = [stage for stage in graph.order if not self._waiting[stage.name]]
+        self._running = 0
+        self._finished = 0
+        self._error = None
+        self._cond = threading.Condition()
+
+    # === Execution ===
+    def _run(self, stage):
+        kwargs = {name: self.values[name] for name in stage.inputs}
+        start = time.perf_counter()
+        try:
+            result = stage.fn(**kwargs)
+        except BaseException as e:
+            with self._cond:
+                self._error = self._error or e
+                self._running -= 1
+                self._cond.notify_all()
+            return
+        end = time.perf_counter()
+        STAGE_SECONDS.observe(end - start, stage=stage.name)
+        if len(stage.outputs) == 1:
+            result = (result,)
+        with self._cond:
+            self.values.update(zip(stage.outputs, result or ()))
+            self.timings[stage.name] = (start - self.started_at, end - self.started_at)
+            self._running -= 1
+            self._finished += 1
+            for dependent in self.graph.dependents[stage.name]:
+                self._waiting[dependent.name] -= 1
+                if not self._waiting[dependent.name]:
+                    self._ready.append(dependent)
+            if len(self._ready) > 1:
+                self._ready.sort(key=lambda ready: self.graph.position[ready.name])
+            self._cond.notify_all()
+
+    def _wait_until(self, satisfied):
+        """
+        Starts ready stages until satisfied() holds: offloaded ones on the pool,
+        the first other one in this thread; waits when only pool stages are running.
+        """
+        while True:
+            inline = None
+            with self._cond:
+                while True:
+                    if self._error is not None:
+                        raise self._error
+                    if satisfied():
+                        return
+                    remaining = []
+                    for stage in self._ready:
+                        if stage.offload and self.pool is not None:
+                            self._running += 1
+                            self.pool.submit(self._run, stage)
+                        elif inline is None:
+                            inline = stage
+                        else:
+                            remaining.append(stage)
+                    self._ready = remaining
+                    if inline is not None:
+                        self._running += 1
+                        break
+                    if not self._running:
+                        raise RuntimeError("Pipeline stalled: no stage can run")
+                    self._cond.wait()
+            self._run(inline)
+
+    def get(self, name):
+        """The value of name, running whatever it still depends on."""
+        self._wait_until(lambda: name in self.values)
+        return self.values[name]
+
+    def wait_all(self):
+        """Runs the remaining stages (e.g. log writes nothing reads) and returns all values."""
+        self._wait_until(lambda: self._finished == len(self.graph.stages))
+        return self.values
+
+    # === Report ===
+    def critical_path(self):
+        """
+        (stage names, ms) of the dependency chain of finished stages with the largest
+        summed stage time: the part of the run concurrency cannot shorten.
+        """
+        path, previous = {}, {}
+        for stage in self.graph.order:
+            timing = self.timings.get(stage.name)
+            if timing is None:
+                continue
+            before = None
+            for dependency in self.graph.dependencies[stage.name]:
+                if dependency.name in path and (before is None or path[dependency.name] > path[before]):
+                    before = dependency.name
+            previous[stage.name] = before
+            path[stage.name] = (path[before] if before else 0.0) + timing[1] - timing[0]
+        if not path:
+            return [], 0.0
+        last = max(path, key=path.get)
+        names, name = [], last
+        while name is not None:
+            names.append(name)
+            name = previous[name]
+        return names[::-1], path[last] * 1000
+
+    def report(self):
+        """Wall and summed stage time, the critical path and per-stage times, all in ms."""
+        critical, critical_ms = self.critical_path()
+        ends = [end for _, end in self.timings.values()]
+        return {
+            "wall_ms": round(max(ends) * 1000, 3) if ends else 0.0,
+            "serial_ms": round(sum((end - start) * 1000 for start, end in self.timings.values()), 3),
+            "critical_path_ms": round(critical_ms, 3),
+            "critical_path": critical,
+            "stages": {name: round((end - start) * 1000, 3) for name, (start, end) in self.timings.items()}
+        }
+
+    def record_critical_path(self):
+        """Counts each stage on this run's critical path in narrative_critical_path_total."""
+        for name in self.critical_path()[0]:
+            CRITICAL_PATH_STAGES.inc(stage=name)
+
+
+# === Shared Stage Pool ===
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_stage_pool(config=None):
+    """Returns the process-wide stage pool, or None when pipeline.enabled is false (everything runs inline)."""
+    global _pool
+    options = dict(DEFAULT_PIPELINE_CONFIG)
+    options.update((config or {}).get("pipeline", {}))
+    if not options["enabled"] or options["max_workers"] < 1:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=options["max_workers"], thread_name_prefix="stage")
+    return _pool
+
+def _forget_pool_after_fork():
+    # Pool threads do not survive fork(); the child starts its own pool on first use.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+# === CLI ===
+def main(argv=None):
+    import io
+    import contextlib
+    from kb_watcher import load_config_snapshot
+    from knowledge_base import KnowledgeBase
+    from narrative_engine import NARRATIVE_GRAPH, narrative_run
+
+    parser = argparse.ArgumentParser(description="Show the narrative stage graph and the critical path of a run.")
+    parser.add_argument("inputs", nargs="*", help="The 9 input fields (defaults to a sample)")
+    parser.add_argument("--actor", default="Male")
+    parser.add_argument("--runs", type=int, default=200, help="Runs to average the stage times over")
+    parser.add_argument("--config", default="copilot_config.yaml")
+    args = parser.parse_args(argv)
+
+    inputs = args.inputs or ["Rooted presence, purpose before performance", "at home", "after dinner", "again",
+                             "blue", "red", "yellow", "green", "open"]
+    if len(inputs) != 9:
+        parser.error("expected 9 input fields")
+    config, _ = load_config_snapshot(args.config)
+    config = dict(config, session_state={"enabled": False})
+    kb = KnowledgeBase.from_config(config).warm()
+
+    print("🧩 Stages:")
+    for stage in NARRATIVE_GRAPH.order:
+        depends = ", ".join(d.name for d in NARRATIVE_GRAPH.dependencies[stage.name]) or "request"
+        print(f"  • {stage.name:<20} ← {depends}{'  (offloaded)' if stage.offload else ''}")
+
+    totals, critical, wall = {}, {}, 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.runs):
+            run = narrative_run(inputs, args.actor, config, kb)
+            run.wait_all()
+            report = run.report()
+            wall += report["wall_ms"]
+            for name, ms in report["stages"].items():
+                totals[name] = totals.get(name, 0.0) + ms
+            key = tuple(report["critical_path"])
+            critical[key] = critical.get(key, 0) + 1
+    path = max(critical, key=critical.get)
+    print(f"⏱️ Mean wall time {wall / args.runs:.3f} ms over {args.runs} runs")
+    for name, ms in sorted(totals.items(), key=lambda item: -item[1]):
+        print(f"  • {name:<20} {ms / args.runs:.3f} ms{'  ★' if name in path else ''}")
+    print(f"★ Critical path ({critical[path]}/{args.runs} runs): {' → '.join(path)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,36 @@
-import csv
-import os
 from classification_engine import classify_actor_from_wheel
 from geometry_resolver import resolve_geometry_state
-
-# === CSV Loader ===
-def load_csv(path):
-    try:
-        with open(path, newline='', encoding='utf-8') as f:
-            return list(csv.DictReader(f))
-    except Exception as e:
-        print(f"⚠️ Failed to load CSV: {e}")
-        return []
+from knowledge_base import TRANSMISSION_MAP
+from trigger_scanner import scan_triggers, matched_rows
+
+# === Transmission Row Matching ===
+def match_transmission_row(reflex_wheel_state, voice_input, kb, matches=None):
+    """
+    Returns the first transmission row whose trigger occurs in voice_input and
+    whose reflex_wheel_state matches, or None.
+    matches: precomputed scan_triggers() result for voice_input, if available.
+    """
+    if matches is None:
+        matches = scan_triggers(kb, voice_input)
+    wheel_state = reflex_wheel_state.strip().lower()
+    transmission_map = kb.rows(TRANSMISSION_MAP)
+    for i in matched_rows(matches, TRANSMISSION_MAP):
+        row = transmission_map[i]
+        if row.get("reflex_wheel_state", "").strip().lower() == wheel_state:
+            return row
+    return None
 
 # === Reflex Detection ===
-def detect_reflex(reflex_wheel_state, voice_input, transmission_map_path):
-    transmission_map = load_csv(transmission_map_path)
-    for row in transmission_map:
-        reflex_state = row.get("reflex_wheel_state", "").strip().lower()
-        trigger = row.get("trigger", "").strip().lower()
-        if trigger and trigger in voice_input.lower() and reflex_state == reflex_wheel_state.strip().lower():
-            return {
-                "reflex_type": row.get("reflex_type", "neutral"),
-                "archetype_entry": row.get("archetype_entry", "M1"),
-                "containment_strategy": row.get("containment_strategy", "No containment strategy found."),
-                "narrative_branch": row.get("narrative_branch", "default"),
-                "somatic_protocol": row.get("somatic_protocol", "none")
-            }
+def detect_reflex(reflex_wheel_state, voice_input, kb, matches=None):
+    row = match_transmission_row(reflex_wheel_state, voice_input, kb, matches)
+    if row is not None:
+        return {
+            "reflex_type": row.get("reflex_type", "neutral"),
+            "archetype_entry": row.get("archetype_entry", "M1"),
+            "containment_strategy": row.get("containment_strategy", "No containment strategy found."),
+            "narrative_branch": row.get("narrative_branch", "default"),
+            "somatic_protocol": row.get("somatic_protocol", "none")
+        }
 
     # Debug trace for unmatched reflex
     print(f"⚠️ No reflex match for reflex_wheel_state='{reflex_wheel_state}' and input='{voice_input}'")
@@ -39,33 +44,22 @@ def detect_reflex(reflex_wheel_state, voice_input, transmission_map_path):
     }
 
 # === Containment Strategy ===
-def apply_containment(reflex_wheel_state, voice_input, transmission_map_path):
-    transmission_map = load_csv(transmission_map_path)
-    for row in transmission_map:
-        reflex_state = row.get("reflex_wheel_state", "").strip().lower()
-        trigger = row.get("trigger", "").strip().lower()
-        if trigger and trigger in voice_input.lower() and reflex_state == reflex_wheel_state.strip().lower():
-            return row.get("containment_strategy", "No containment strategy found.")
+def apply_containment(reflex_wheel_state, voice_input, kb, matches=None):
+    row = match_transmission_row(reflex_wheel_state, voice_input, kb, matches)
+    if row is not None:
+        return row.get("containment_strategy", "No containment strategy found.")
     return "No containment strategy found."
 
 # === Actor Classification ===
-def classify_actor(actor, actor_wheel_state, reflex_type, classification_path):
-    return classify_actor_from_wheel(actor, actor_wheel_state, reflex_type, classification_path)
+def classify_actor(actor, actor_wheel_state, reflex_type, kb):
+    return classify_actor_from_wheel(actor, actor_wheel_state, reflex_type, kb)
 
 # === Reflex Bundle Constructor ===
-def process_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_input,
-                          transmission_map_path, classification_path, taxonomy_path,
-                          wheel_domains, wheel_layers_path, polarity_drift_path):
-    reflex = detect_reflex(reflex_wheel_state, voice_input, transmission_map_path)
-    classification = classify_actor(actor, actor_wheel_state, reflex["reflex_type"], classification_path)
-
-    geometry_overlay = resolve_geometry_state(
-        wheel_domains=wheel_domains,
-        layers_path=wheel_layers_path,
-        codex_path=os.path.join(os.path.dirname(wheel_layers_path), "wheel_codex.csv"),
-        drift_path=polarity_drift_path,
-        ml_instruction_path=os.path.join("engine_boot", "ml_instruction.csv")
-    )
+def process_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_input, kb, wheel_domains):
+    reflex = detect_reflex(reflex_wheel_state, voice_input, kb)
+    classification = classify_actor(actor, actor_wheel_state, reflex["reflex_type"], kb)
+
+    geometry_overlay = resolve_geometry_state(wheel_domains=wheel_domains, kb=kb)
 
     bundle = {
         "actor_wheel_state": actor_wheel_state,
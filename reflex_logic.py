@@ -2,27 +2,27 @@ from reflex_core import detect_reflex, apply_containment
 from classification_engine import classify_actor_from_wheel
 from reflex_manifest import get_reflex_manifest
 from reflex_taxonomy import symbolic_reflex
-import os
-import csv
+from trigger_scanner import scan_triggers
+from similarity_index import similar_entries
+from repair_index import rank_repair_protocols
+from knowledge_base import LINGUISTIC_REFRAME_MAP, TRANSMISSION_MAP
 import datetime
 import uuid
+from log_sink import get_log_sink
+
+SESSION_LOG_HEADER = [
+    "timestamp", "session_id", "actor", "actor_wheel_state", "reflex_wheel_state",
+    "reflex_type", "class_code", "archetype_variant",
+    "containment_required", "progressive"
+]
 
 # === Logging Hook ===
 def log_event(message, log_path="copilot_log.txt"):
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_path, "a", encoding="utf-8") as log_file:
-        log_file.write(f"{timestamp} - INFO - {message}\n")
-
-# === CSV Loader ===
-def load_csv(path):
-    with open(path, newline='', encoding='utf-8') as f:
-        return list(csv.DictReader(f))
+    get_log_sink().write_line(log_path, f"{timestamp} - INFO - {message}")
 
 # === Symbolic Geometry Enrichment ===
-def enrich_with_geometry(wheel_domains, wheel_layers_path, polarity_drift_path):
-    wheel_layers = load_csv(wheel_layers_path)
-    polarity_drift = load_csv(polarity_drift_path)
-
+def enrich_with_geometry(wheel_domains):
     centre = wheel_domains.get("centre", "").lower()
     red = wheel_domains.get("red", "").lower()
 
@@ -44,19 +44,27 @@ def enrich_with_geometry(wheel_domains, wheel_layers_path, polarity_drift_path):
     }
 
 # === Reflex Bundle Processor ===
-def process_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_input,
-                          transmission_map_path, classification_path, taxonomy_path,
+def process_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_input, kb,
                           wheel_domains=None,
-                          wheel_layers_path=None,
-                          polarity_drift_path=None,
-                          session_log_path="classification_copilot_0210.csv"):
-    reflex = detect_reflex(reflex_wheel_state, voice_input, transmission_map_path)
+                          session_log_path="classification_copilot_0210.csv",
+                          matches=None, user_id="anonymous", session_store=None):
+    bundle = build_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_input, kb,
+                                 wheel_domains=wheel_domains, matches=matches)
+    log_reflex_bundle(bundle, actor, session_log_path=session_log_path, user_id=user_id, session_store=session_store)
+    return bundle
+
+def build_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_input, kb,
+                        wheel_domains=None, matches=None):
+    """The reflex bundle without the session logging, so a bundle can be reused across turns."""
+    if matches is None:
+        matches = scan_triggers(kb, voice_input)
+    reflex = detect_reflex(reflex_wheel_state, voice_input, kb, matches)
 
     classification = classify_actor_from_wheel(
         actor,
         actor_wheel_state,
         reflex["reflex_type"],
-        classification_path
+        kb
     ) or {
         "class_code": "N/A",
         "archetype_variant": "Unknown",
@@ -71,7 +79,7 @@ def process_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_in
     symbolic = symbolic_reflex(
         mismatch_type=reflex["reflex_type"],
         archetype=reflex["archetype_entry"],
-        taxonomy_path=taxonomy_path
+        kb=kb
     ) or {
         "symbolic_theme": "Unmapped",
         "emotional_cost": "Unknown",
@@ -92,47 +100,56 @@ def process_reflex_bundle(actor, actor_wheel_state, reflex_wheel_state, voice_in
         "progressive": classification["progressive"],
         "symbolic_theme": symbolic["symbolic_theme"],
         "emotional_cost": symbolic["emotional_cost"],
-        "repair_path": symbolic["repair_path"]
+        "repair_path": symbolic["repair_path"],
+        "linguistic_reframes": [m.phrase for m in matches.get(LINGUISTIC_REFRAME_MAP, [])]
     }
 
+    # === Similarity Fallback ===
+    # No curated trigger occurs verbatim in the input: attach the closest voice-wheel,
+    # expectation-map and cross-map entries instead of leaving the input unmapped.
+    if not matches.get(TRANSMISSION_MAP):
+        bundle["similar_entries"] = similar_entries(kb, voice_input)
+
+    # === Repair Protocols ===
+    # Ranked from the precomputed taxonomy / cross-map / repair-map join: a few dict lookups.
+    bundle["repair_protocols"] = rank_repair_protocols(
+        kb,
+        reflex["reflex_type"],
+        reflex["archetype_entry"],
+        repair_path=symbolic["repair_path"],
+        similar_entries=bundle.get("similar_entries")
+    )
+
     # === Geometry Overlay ===
     if wheel_domains:
         bundle["wheel_domains"] = wheel_domains
-        if wheel_layers_path and polarity_drift_path:
-            geometry_overlay = enrich_with_geometry(
-                wheel_domains,
-                wheel_layers_path,
-                polarity_drift_path
-            )
-            bundle.update(geometry_overlay)
-
-    # === Session Logging ===
+        bundle.update(enrich_with_geometry(wheel_domains))
+
+    return bundle
+
+# === Session Logging ===
+def log_reflex_bundle(bundle, actor, session_log_path="classification_copilot_0210.csv",
+                      user_id="anonymous", session_store=None):
+    """Writes one session log row (and session store row) for a generated bundle."""
     timestamp = datetime.datetime.now().strftime("%a %b %d, %Y (%H:%M)")
     session_id = str(uuid.uuid4())[:8]
 
-    with open(session_log_path, "a", newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        if f.tell() == 0:
-            writer.writerow([
-                "timestamp", "session_id", "actor", "actor_wheel_state", "reflex_wheel_state",
-                "reflex_type", "class_code", "archetype_variant",
-                "containment_required", "progressive"
-            ])
-        writer.writerow([
-            timestamp, session_id, actor, actor_wheel_state, reflex_wheel_state,
-            reflex["reflex_type"], classification["class_code"],
-            classification["archetype_variant"],
-            classification["containment_required"],
-            classification["progressive"]
-        ])
-
-    log_event(f"Reflex bundle generated for actor: {actor}, classification: {classification['class_code']}")
+    session_row = [
+        timestamp, session_id, actor, bundle["actor_wheel_state"], bundle["reflex_wheel_state"],
+        bundle["reflex_type"], bundle["class_code"],
+        bundle["archetype_variant"],
+        bundle["containment_required"],
+        bundle["progressive"]
+    ]
+    get_log_sink().write_row(session_log_path, session_row, header=SESSION_LOG_HEADER)
+    if session_store is not None:
+        get_log_sink().write_session(session_store, dict(zip(SESSION_LOG_HEADER, session_row), user_id=user_id))
 
-    return bundle
+    log_event(f"Reflex bundle generated for actor: {actor}, classification: {bundle['class_code']}")
 
 # === Containment Strategy ===
-def get_containment_strategy(reflex_wheel_state, voice_input, transmission_map_path, wheel_domains=None):
-    strategy = apply_containment(reflex_wheel_state, voice_input, transmission_map_path)
+def get_containment_strategy(reflex_wheel_state, voice_input, kb, wheel_domains=None, matches=None):
+    strategy = apply_containment(reflex_wheel_state, voice_input, kb, matches)
 
     if wheel_domains:
         centre = wheel_domains.get("centre", "").lower()
@@ -142,6 +159,6 @@ def get_containment_strategy(reflex_wheel_state, voice_input, transmission_map_p
     return strategy
 
 # === Reflex Manifest Preview ===
-def preview_available_reflexes(transmission_map_path):
-    return get_reflex_manifest(transmission_map_path)
+def preview_available_reflexes(kb):
+    return get_reflex_manifest(kb)
 
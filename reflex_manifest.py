@@ -1,27 +1,17 @@
-import csv
-import os
 from geometry_resolver import resolve_geometry_state
-
-# === CSV Loader ===
-def load_csv(path):
-    try:
-        with open(path, newline='', encoding='utf-8') as f:
-            return list(csv.DictReader(f))
-    except Exception as e:
-        print(f"?? Failed to load CSV: {e}")
-        return []
+from knowledge_base import TRANSMISSION_MAP
 
 # === Manifest Builder ===
-def get_reflex_manifest(transmission_map_path):
+def get_reflex_manifest(kb):
     manifest = {}
-    rows = load_csv(transmission_map_path)
+    rows = kb.rows(TRANSMISSION_MAP)
 
-    # Normalize column name for backward compatibility
     for row in rows:
+        # Normalize column name for backward compatibility
         if "wheel_state" in row:
-            row["reflex_wheel_state"] = row["wheel_state"]
-
-        wheel = row.get("reflex_wheel_state", "neutral")
+            wheel = row["wheel_state"]
+        else:
+            wheel = row.get("reflex_wheel_state", "neutral")
         reflex = row.get("reflex_type", "unspecified")
 
         if wheel not in manifest:
@@ -31,7 +21,7 @@ def get_reflex_manifest(transmission_map_path):
     return manifest
 
 # === Manifest Preview with Geometry Overlay ===
-def preview_manifest(manifest, modules={}):
+def preview_manifest(manifest, kb):
     """
     Prints a readable preview of the reflex manifest with symbolic overlays.
     """
@@ -50,10 +40,7 @@ def preview_manifest(manifest, modules={}):
                 "green": wheel_state,
                 "centre": wheel_state
             },
-            layers_path=os.path.join(modules.get("geometry", ""), "wheel_layers.csv"),
-            codex_path=os.path.join(modules.get("geometry", ""), "wheel_codex.csv"),
-            drift_path=os.path.join(modules.get("geometry", ""), "polarity_drift.csv"),
-            ml_instruction_path=os.path.join(modules.get("engine_boot", ""), "ml_instruction.csv")
+            kb=kb
         )
 
         print(f"     ? Geometry Alert: {overlay['geometry_alert']}")
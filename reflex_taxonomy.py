@@ -1,34 +1,42 @@
-import csv
+from knowledge_base import register_warmer, REFLEX_TAXONOMY
 
-def load_csv(path):
-    """Loads a CSV file and returns a list of dictionaries."""
-    with open(path, newline='', encoding='utf-8') as f:
-        return list(csv.DictReader(f))
+TAXONOMY_COLUMNS = ["Mismatch_Type", "Reflex_Archetype", "Symbolic_Theme", "Emotional_Cost", "Repair_Path"]
 
-def symbolic_reflex(mismatch_type, archetype, taxonomy_path):
+UNMAPPED_REFLEX = {
+    "symbolic_theme": "unspecified rupture",
+    "emotional_cost": "ambiguous tension",
+    "repair_path": "presence and breath"
+}
+
+def build_taxonomy_lookup(kb):
+    """Compiles the taxonomy into {(mismatch_type, reflex_archetype): enrichment}; first row wins."""
+    lookup = {}
+    for row in kb.rows(REFLEX_TAXONOMY):
+        if not all(key in row for key in TAXONOMY_COLUMNS):
+            continue
+        key = (row["Mismatch_Type"].strip().lower(), row["Reflex_Archetype"].strip().lower())
+        if key not in lookup:
+            lookup[key] = {
+                "symbolic_theme": row["Symbolic_Theme"],
+                "emotional_cost": row["Emotional_Cost"],
+                "repair_path": row["Repair_Path"]
+            }
+    return lookup
+
+@register_warmer
+def get_taxonomy_lookup(kb):
+    return kb.derive("taxonomy_lookup", build_taxonomy_lookup)
+
+def symbolic_reflex(mismatch_type, archetype, kb):
     """
     Maps mismatch type and archetype to symbolic theme, emotional cost, and repair path.
     Returns a dictionary with narrative enrichment.
     """
     try:
-        taxonomy = load_csv(taxonomy_path)
-        for row in taxonomy:
-            if all(key in row for key in [
-                "Mismatch_Type", "Reflex_Archetype", "Symbolic_Theme",
-                "Emotional_Cost", "Repair_Path"
-            ]):
-                if row["Mismatch_Type"].strip().lower() == mismatch_type.strip().lower() and \
-                   row["Reflex_Archetype"].strip().lower() == archetype.strip().lower():
-                    return {
-                        "symbolic_theme": row["Symbolic_Theme"],
-                        "emotional_cost": row["Emotional_Cost"],
-                        "repair_path": row["Repair_Path"]
-                    }
+        result = get_taxonomy_lookup(kb).get((mismatch_type.strip().lower(), archetype.strip().lower()))
+        if result is not None:
+            return dict(result)
     except Exception as e:
         print(f"⚠️ Symbolic reflex mapping failed: {e}")
 
-    return {
-        "symbolic_theme": "unspecified rupture",
-        "emotional_cost": "ambiguous tension",
-        "repair_path": "presence and breath"
-    }
+    return dict(UNMAPPED_REFLEX)
@@ -0,0 +1,149 @@
+from itertools import product
+from knowledge_base import register_warmer, normalize_key, REFLEX_TAXONOMY, CROSS_MAP_MATRIX, REPAIR_PROTOCOL_MAP
+from similarity_index import get_similarity_index
+
+# === Protocol Fields ===
+# The columns of 8_repair_protocol_map.csv a protocol is looked up by, in key order.
+PROTOCOL_KEYS = ("Mismatch_Type", "Reflex_Archetype", "Wheel_Stage")
+DEFAULT_RANKED_PROTOCOLS = 3
+
+# Ranking weights for rank_repair_protocols; similarity matches add their score.
+WEIGHT_TAXONOMY_MISMATCH = 2.0
+WEIGHT_REPAIR_PATH = 2.0
+WEIGHT_REFLEX_ARCHETYPE = 1.0
+
+
+# === Join Index ===
+class RepairIndex:
+    """
+    The taxonomy, cross-map matrix and repair protocol map joined once per knowledge
+    base. Protocols are indexed under every combination of their Mismatch_Type,
+    Reflex_Archetype and Wheel_Stage (None standing for "any"), so each question is
+    a single dict lookup instead of a scan over the three tables.
+    """
+
+    def __init__(self, kb):
+        self.protocols = {}         # {protocol id: protocol}
+        self._by_keys = {}          # {(mismatch, archetype, stage) with None wildcards: [protocol id]}
+        self._by_repair_path = {}
+        self._cross_map = {}        # {protocol id: [cross-map row]}
+        self._cross_map_pairs = {}  # {(Voice_ID, Expectation_ID): [protocol id]}
+        self._taxonomy = {}         # {(mismatch, archetype) and (response pattern, archetype): taxonomy row}
+        self._similar = {}          # {reflex type: [(protocol id, score)]}, filled on first use
+
+        for row in kb.rows(REPAIR_PROTOCOL_MAP):
+            protocol_id = (row.get("Repair_Protocol_ID") or "").strip()
+            if not protocol_id or protocol_id in self.protocols:
+                continue
+            self.protocols[protocol_id] = {
+                "id": protocol_id,
+                "mismatch_type": (row.get("Mismatch_Type") or "").strip(),
+                "reflex_archetype": (row.get("Reflex_Archetype") or "").strip(),
+                "repair_path": (row.get("Repair_Path") or "").strip(),
+                "wheel_stage": (row.get("Wheel_Stage") or "").strip(),
+                "symbolic_theme": (row.get("Symbolic_Theme") or "").strip()
+            }
+            values = tuple(normalize_key(row.get(column)) for column in PROTOCOL_KEYS)
+            for mask in product((True, False), repeat=len(values)):
+                key = tuple(value if keep else None for value, keep in zip(values, mask))
+                self._by_keys.setdefault(key, []).append(protocol_id)
+            self._by_repair_path.setdefault(normalize_key(row.get("Repair_Path")), []).append(protocol_id)
+
+        for row in kb.rows(CROSS_MAP_MATRIX):
+            protocol_id = (row.get("Repair_Protocol_ID") or "").strip()
+            if not protocol_id:
+                continue
+            self._cross_map.setdefault(protocol_id, []).append(row)
+            pair = ((row.get("Voice_ID") or "").strip(), (row.get("Expectation_ID") or "").strip())
+            self._cross_map_pairs.setdefault(pair, []).append(protocol_id)
+
+        # The transmission map's reflex_type reads like the taxonomy's Response_Pattern,
+        # so taxonomy rows are reachable by either key; the first row wins per key.
+        for row in kb.rows(REFLEX_TAXONOMY):
+            archetype = normalize_key(row.get("Reflex_Archetype"))
+            for column in ("Mismatch_Type", "Response_Pattern"):
+                self._taxonomy.setdefault((normalize_key(row.get(column)), archetype), row)
+
+    # === Lookups ===
+    def protocols_for(self, mismatch_type=None, reflex_archetype=None, wheel_stage=None):
+        """Protocols matching every given field (None = any), in table order."""
+        key = tuple(None if value is None else normalize_key(value)
+                    for value in (mismatch_type, reflex_archetype, wheel_stage))
+        return [self.protocols[protocol_id] for protocol_id in self._by_keys.get(key, ())]
+
+    def protocols_for_repair_path(self, repair_path):
+        return [self.protocols[protocol_id] for protocol_id in self._by_repair_path.get(normalize_key(repair_path), ())]
+
+    def cross_map_rows(self, protocol_id):
+        """Every cross-map row pointing at protocol_id."""
+        return list(self._cross_map.get(protocol_id, ()))
+
+    def protocols_for_pair(self, voice_id, expectation_id):
+        return [self.protocols[protocol_id] for protocol_id in self._cross_map_pairs.get((voice_id, expectation_id), ())
+                if protocol_id in self.protocols]
+
+    def taxonomy(self, reflex_type, archetype):
+        """Taxonomy row for (Mismatch_Type or Response_Pattern, Reflex_Archetype), or None."""
+        return self._taxonomy.get((normalize_key(reflex_type), normalize_key(archetype)))
+
+    def similar_protocols(self, kb, reflex_type):
+        """
+        (protocol id, similarity score) for the cross-map entries closest to the
+        reflex type's text. Scored once per reflex type, then a dict lookup.
+        """
+        key = normalize_key(reflex_type)
+        found = self._similar.get(key)
+        if found is None:
+            found = []
+            for match in get_similarity_index(kb).top_k(reflex_type or "", kinds=("mismatch",))["mismatch"]:
+                voice_id, _, expectation_id = match.key.partition("/")
+                found.extend((protocol["id"], match.score) for protocol in self.protocols_for_pair(voice_id, expectation_id))
+            found = self._similar.setdefault(key, found)
+        return found
+
+
+# === Building ===
+def build_repair_index(kb):
+    return RepairIndex(kb)
+
+@register_warmer
+def get_repair_index(kb):
+    return kb.derive("repair_index", build_repair_index)
+
+
+# === Ranking ===
+def rank_repair_protocols(kb, reflex_type, archetype_entry, repair_path=None, similar_entries=None,
+                          limit=DEFAULT_RANKED_PROTOCOLS):
+    """
+    Ranks repair protocols for one reflex bundle. A protocol scores for sharing the
+    mismatch type of the taxonomy row the reflex resolves to, for sharing its repair
+    path, for naming the reflex as its archetype, and by similarity score for each
+    close cross-map entry (similar_entries, see similarity_index.py) that points at it.
+    The transmission map's reflex types and archetypes rarely appear verbatim in the
+    taxonomy or repair map, so when none of that matches, the cross-map entries
+    closest to the reflex type's text are used instead.
+    Returns up to limit protocol dicts with a "score", best first.
+    """
+    index = get_repair_index(kb)
+    scores = {}
+
+    def add(protocols, weight):
+        for protocol in protocols:
+            scores[protocol["id"]] = scores.get(protocol["id"], 0.0) + weight
+
+    taxonomy = index.taxonomy(reflex_type, archetype_entry)
+    if taxonomy is not None:
+        add(index.protocols_for(mismatch_type=taxonomy.get("Mismatch_Type")), WEIGHT_TAXONOMY_MISMATCH)
+        repair_path = repair_path or taxonomy.get("Repair_Path")
+    if repair_path:
+        add(index.protocols_for_repair_path(repair_path), WEIGHT_REPAIR_PATH)
+    add(index.protocols_for(reflex_archetype=reflex_type), WEIGHT_REFLEX_ARCHETYPE)
+    for match in (similar_entries or {}).get("mismatch", ()):
+        voice_id, _, expectation_id = match["key"].partition("/")
+        add(index.protocols_for_pair(voice_id, expectation_id), match["score"])
+    if not scores:
+        for protocol_id, score in index.similar_protocols(kb, reflex_type):
+            scores[protocol_id] = scores.get(protocol_id, 0.0) + score
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [dict(index.protocols[protocol_id], score=round(score, 4)) for protocol_id, score in ranked]
@@ -0,0 +1,274 @@
+import io
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from knowledge_base import KnowledgeBase
+from kb_watcher import load_config_snapshot
+from narrative_engine import generate_narrative
+from version_store import VersionStore, parse_transposed, format_transposed
+
+# === Constants ===
+VOICE_FIELDS = 4
+BACKGROUND_FIELDS = 5
+DEFAULT_CHUNK_SIZE = 32
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+
+# === History Discovery ===
+def read_history(directory, kind):
+    """[(version, fields)] newest first from <kind>.txt (transposed) or <kind>.jsonl (version store)."""
+    text_path = os.path.join(directory, f"{kind}.txt")
+    if os.path.exists(text_path):
+        with open(text_path, encoding="utf-8", newline="") as f:
+            return parse_transposed(f.read())
+    store_path = os.path.join(directory, f"{kind}.jsonl")
+    if os.path.exists(store_path):
+        return VersionStore(store_path).all()
+    return []
+
+def find_users(root):
+    """[(user_id, directory)]: root itself if it holds a history, else every subdirectory that does."""
+    def has_history(directory):
+        return any(os.path.exists(os.path.join(directory, f"voice_input{ext}")) for ext in (".txt", ".jsonl"))
+
+    if has_history(root):
+        return [(os.path.basename(os.path.abspath(root)), root)]
+    return [(name, os.path.join(root, name)) for name in sorted(os.listdir(root))
+            if os.path.isdir(os.path.join(root, name)) and has_history(os.path.join(root, name))]
+
+def pad(fields, count):
+    return ([value.strip() for value in fields] + [""] * count)[:count]
+
+def user_records(user_id, directory, actor):
+    """
+    One replay record per voice version, newest first. Each voice version is paired
+    with the background version of the same label, else the one in the same column.
+    """
+    voices = read_history(directory, "voice_input")
+    backgrounds = read_history(directory, "background")
+    by_label = dict(reversed(backgrounds))
+    for position, (version, voice_fields) in enumerate(voices):
+        background_fields = by_label.get(version)
+        if background_fields is None:
+            background_fields = backgrounds[position][1] if position < len(backgrounds) else []
+        background_fields = pad(background_fields, BACKGROUND_FIELDS)
+        yield {
+            "user_id": user_id,
+            "version": version,
+            "actor": actor,
+            "inputs": pad(voice_fields, VOICE_FIELDS) + background_fields,
+            "background": " ".join(background_fields)
+        }
+
+def count_versions(users):
+    total = 0
+    for _, directory in users:
+        total += len(read_history(directory, "voice_input"))
+    return total
+
+
+# === Worker ===
+# Set in the parent before the pool forks, so workers share the warmed knowledge
+# base copy-on-write; a spawned worker builds its own in _init_worker.
+_state = None
+
+def load_state(root, config_path, rule_only):
+    config, _ = load_config_snapshot(os.path.join(root, config_path))
+    config = dict(config)
+    # Replays must not be served from, or fill, the live caches and session store.
+    config["result_cache"] = {"enabled": False}
+    config["session_store"] = {"enabled": False}
+    if rule_only:
+        config["runtime"] = dict(config.get("runtime") or {}, use_generative_ai=False)
+    kb = KnowledgeBase.from_config(config, root=root).warm()
+    return config, kb
+
+def _init_worker(root, config_path, rule_only, scratch, quiet):
+    global _state
+    if _state is None:
+        _state = load_state(root, config_path, rule_only)
+    # Session logs written by replays land in a scratch directory that is discarded,
+    # so historical replays never show up in the live logs.
+    os.chdir(scratch)
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+
+def replay_chunk(records):
+    config, kb = _state
+    scan_cache = {}
+    results = []
+    for record in records:
+        narrative = generate_narrative(record["inputs"], record["actor"], record["user_id"],
+                                       record["background"], config, kb=kb, scan_cache=scan_cache)
+        results.append({"user_id": record["user_id"], "version": record["version"], "narrative": narrative})
+    return results
+
+
+# === Scheduling ===
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def replay(records, pool, workers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields results in input order while keeping at most two chunks per worker queued,
+    so neither the input nor the output is ever held in memory as a whole.
+    """
+    in_flight = workers * 2
+    pending = deque()
+    for chunk in chunked(records, chunk_size):
+        pending.append(pool.submit(replay_chunk, chunk))
+        if len(pending) >= in_flight:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+# === Output ===
+class NDJSONWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result):
+        self.stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.stream.flush()
+
+class StorylineWriter:
+    """Writes one transposed storyline.txt per user; only the current user's versions are buffered."""
+
+    def __init__(self, output, single_user):
+        self.output = output
+        self.single_user = single_user
+        self.user_id = None
+        self.versions = []
+
+    def write(self, result):
+        if result["user_id"] != self.user_id:
+            self.flush()
+            self.user_id = result["user_id"]
+        self.versions.append((result["version"], result["narrative"].splitlines()))
+
+    def flush(self):
+        if not self.versions:
+            return
+        if self.single_user:
+            path = self.output
+        else:
+            path = os.path.join(self.output, self.user_id, "storyline.txt")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(format_transposed(self.versions))
+        self.versions = []
+
+    def close(self):
+        self.flush()
+
+
+# === Progress ===
+class Progress:
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.reported = self.started
+
+    def advance(self, result):
+        self.done += 1
+        if result["narrative"].startswith(("[Error]", "❌")):
+            self.errors += 1
+        now = time.perf_counter()
+        if now - self.reported >= PROGRESS_INTERVAL_SECONDS:
+            self.reported = now
+            self.report(now)
+
+    def report(self, now=None, final=False):
+        elapsed = (now or time.perf_counter()) - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = (self.total - self.done) / rate if rate else 0.0
+        label = "✅ Replayed" if final else "⏳"
+        self.stream.write(f"{label} {self.done}/{self.total} versions | {rate:.1f}/s | "
+                          f"{elapsed:.1f}s elapsed" + ("" if final else f", ~{remaining:.0f}s left") +
+                          (f" | {self.errors} errors" if self.errors else "") + "\n")
+        self.stream.flush()
+
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay stored voice/background histories through the engine.")
+    parser.add_argument("source", help="A user's history directory (voice_input.txt + background.txt) or a directory of them")
+    parser.add_argument("--output", default="-", help="NDJSON file ('-' for stdout), or storyline.txt / output directory")
+    parser.add_argument("--format", choices=("ndjson", "storyline"), default="ndjson")
+    parser.add_argument("--actor", default="User")
+    parser.add_argument("--root", default=".", help="Repository root holding the tables and copilot_config.yaml")
+    parser.add_argument("--config", default="copilot_config.yaml")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--rule-only", action="store_true", help="Skip the generative branch even if the config enables it")
+    parser.add_argument("--verbose", action="store_true", help="Keep engine warnings from the workers")
+    args = parser.parse_args(argv)
+
+    global _state
+    root = os.path.abspath(args.root)
+    users = find_users(args.source)
+    if not users:
+        print(f"⚠️ No voice_input history found under {args.source}", file=sys.stderr)
+        return 1
+    progress = Progress(count_versions(users))
+
+    # Load and warm once here; forked workers inherit it.
+    with io.StringIO() as sink:
+        stdout, sys.stdout = sys.stdout, sink
+        try:
+            _state = load_state(root, args.config, args.rule_only)
+        finally:
+            sys.stdout = stdout
+    gc.collect()
+    gc.freeze()
+
+    if args.format == "storyline":
+        if args.output == "-":
+            parser.error("--format storyline needs --output (a file for one user, a directory for many)")
+        writer = StorylineWriter(args.output, single_user=len(users) == 1 and not os.path.isdir(args.output))
+    else:
+        stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        writer = NDJSONWriter(stream)
+
+    records = (record for user_id, directory in users for record in user_records(user_id, directory, args.actor))
+    scratch = tempfile.mkdtemp(prefix="narrative-replay-")
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    workers = max(1, args.workers)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(root, args.config, args.rule_only, scratch, not args.verbose)) as pool:
+            for result in replay(records, pool, workers, args.chunk_size):
+                writer.write(result)
+                progress.advance(result)
+    finally:
+        writer.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+    progress.report(final=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from metrics import FILE_READS
+
+# === Defaults ===
+# Mirrors the result_cache section of copilot_config.yaml.
+DEFAULT_CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 1024,
+    "ttl_seconds": 3600,
+    "disk_enabled": False,
+    "disk_path": ".cache/narratives"
+}
+
+# Config sections that change the narrative for the same inputs. Table and
+# grammar changes are covered by the knowledge-base version.
+KEY_CONFIG_SECTIONS = ("runtime", "defaults", "llm")
+
+
+# === Result Cache ===
+class ResultCache:
+    """
+    Two-tier cache for finished narratives: an in-process LRU with TTL in front
+    of an optional on-disk tier shared by every worker on the host.
+    Entries are keyed by a hash of the inputs, actor, relevant config and
+    knowledge-base version, so a table change can never serve a stale story.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_enabled=False,
+                 disk_path=".cache/narratives"):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.disk_path = disk_path if disk_enabled else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        options = dict(DEFAULT_CACHE_CONFIG)
+        options.update((config or {}).get("result_cache", {}))
+        options.pop("enabled")
+        return cls(**options)
+
+    # === Keys ===
+    @staticmethod
+    def key(inputs, actor, config, kb_version):
+        payload = {
+            "inputs": list(inputs),
+            "actor": actor,
+            "config": {section: (config or {}).get(section) for section in KEY_CONFIG_SECTIONS},
+            "kb_version": kb_version
+        }
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    # === Lookups ===
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry[1]
+
+    def put(self, key, value):
+        entry = (time.time(), value)
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # === Disk Tier ===
+    def _disk_file(self, key):
+        return os.path.join(self.disk_path, key[:2], key + ".json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_path:
+            return None
+        try:
+            with open(self._disk_file(key), encoding="utf-8") as f:
+                stored = json.load(f)
+            FILE_READS.inc(source="result_cache")
+        except (OSError, ValueError):
+            return None
+        if now - stored["stored_at"] > self.ttl:
+            return None
+        return stored["stored_at"], stored["value"]
+
+    def _write_disk(self, key, entry):
+        if not self.disk_path:
+            return
+        path = self._disk_file(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so other workers never read a half-written entry.
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": entry[0], "value": entry[1]}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"⚠️ Failed to write result cache entry: {e}")
+
+    # === Invalidation ===
+    def invalidate(self, disk=False):
+        """Drops every in-process entry; with disk=True the on-disk tier is cleared as well."""
+        with self._lock:
+            self._entries.clear()
+        if disk and self.disk_path and os.path.isdir(self.disk_path):
+            for folder, _, files in os.walk(self.disk_path):
+                for name in files:
+                    if name.endswith(".json"):
+                        try:
+                            os.remove(os.path.join(folder, name))
+                        except OSError:
+                            pass
+
+    # === Metrics ===
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+# === Shared Instance ===
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_result_cache(config=None):
+    """Returns the process-wide result cache, or None when result_cache.enabled is false."""
+    global _shared
+    if not (config or {}).get("result_cache", {}).get("enabled", DEFAULT_CACHE_CONFIG["enabled"]):
+        return None
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = ResultCache.from_config(config)
+    return _shared
+
+def invalidate_result_cache(old_state=None, new_state=None):
+    """Clears the shared cache. Signature matches KnowledgeBaseWatcher.on_swap."""
+    if _shared is not None:
+        _shared.invalidate()
+
+def _reset_lock_after_fork():
+    # A lock held by another thread at fork time would stay locked in the child.
+    global _shared_lock
+    _shared_lock = threading.Lock()
+    if _shared is not None:
+        _shared._lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
@@ -0,0 +1,301 @@
+import gc
+import os
+import time
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.serving import BaseWSGIServer
+
+# === Defaults ===
+# Mirrors the serving section of copilot_config.yaml.
+DEFAULT_SERVING_CONFIG = {
+    "mode": "threads",              # dev | threads | processes
+    "host": "0.0.0.0",
+    "port": 5000,
+    "threads": 16,                  # request threads per worker process
+    "processes": 1,                 # worker processes (mode: processes)
+    "request_timeout_seconds": 30,
+    "shutdown_grace_seconds": 20
+}
+
+def serving_config(config):
+    options = dict(DEFAULT_SERVING_CONFIG)
+    options.update((config or {}).get("serving", {}))
+    return options
+
+
+# === Request Tracking ===
+class RequestTracker:
+    """Counts in-flight requests and lets shutdown wait for them to finish."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.served = 0
+        self.timed_out = 0
+        self.draining = False
+        self.started = time.time()
+        self.boot_ms = None   # fork-to-serving time of a pre-forked worker
+        self._idle = threading.Condition()
+
+    def begin(self):
+        with self._idle:
+            self.in_flight += 1
+
+    def end(self):
+        with self._idle:
+            self.in_flight -= 1
+            self.served += 1
+            if self.in_flight == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout):
+        with self._idle:
+            return self._idle.wait_for(lambda: self.in_flight == 0, timeout=timeout)
+
+tracker = RequestTracker()
+
+
+# === Request Deadlines ===
+class RequestTimeout(Exception):
+    pass
+
+_deadline_pool = None
+_deadline_lock = threading.Lock()
+
+def run_with_deadline(fn, options, *args, **kwargs):
+    """
+    Runs fn on the shared engine pool and waits at most options["request_timeout_seconds"].
+    The pool has one worker per request thread (options["threads"]), so a request
+    never spends its deadline queued behind the others.
+    Raises RequestTimeout when the deadline passes; the work itself cannot be
+    interrupted and finishes in the background, but the client is released.
+    """
+    global _deadline_pool
+    timeout = options["request_timeout_seconds"]
+    if not timeout:
+        return fn(*args, **kwargs)
+    if _deadline_pool is None:
+        with _deadline_lock:
+            if _deadline_pool is None:
+                _deadline_pool = ThreadPoolExecutor(max_workers=max(1, options["threads"]), thread_name_prefix="engine")
+    future = _deadline_pool.submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        tracker.timed_out += 1
+        raise RequestTimeout(f"Request exceeded {timeout}s deadline")
+
+def stream_with_deadline(items, options):
+    """
+    Passes items through, raising RequestTimeout once more than
+    options["request_timeout_seconds"] have passed since the first was requested.
+    Checked between items: one slow item is only cut off after it arrives.
+    """
+    timeout = options["request_timeout_seconds"]
+    started = time.perf_counter()
+    for item in items:
+        if timeout and time.perf_counter() - started > timeout:
+            tracker.timed_out += 1
+            raise RequestTimeout(f"Request exceeded {timeout}s deadline")
+        yield item
+
+def _reset_after_fork():
+    global _deadline_pool
+    _deadline_pool = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# === Pooled Server ===
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server that handles connections on a fixed-size thread pool."""
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        # Counted from accept, so queued connections also hold off shutdown.
+        tracker.begin()
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            tracker.end()
+
+
+# === Graceful Shutdown ===
+def _serve_forever(server, options, on_stopped):
+    """
+    Serves until SIGTERM/SIGINT, then stops accepting, waits up to
+    shutdown_grace_seconds for in-flight requests and runs on_stopped.
+    """
+    def _handle_signal(signum, frame):
+        if not tracker.draining:
+            tracker.draining = True
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+    server.serve_forever()
+
+    if not tracker.wait_idle(options["shutdown_grace_seconds"]):
+        print(f"⚠️ Shutdown grace period elapsed with {tracker.in_flight} request(s) in flight")
+    server.pool.shutdown(wait=False)
+    server.server_close()
+    if on_stopped:
+        on_stopped()
+
+
+# === Entry Point ===
+def serve(app, config, on_worker_start=None, on_stopped=None, watcher=None):
+    """
+    Runs the app according to the serving config.
+    on_worker_start: called in each worker process before it serves (restart background threads).
+    on_stopped: called after in-flight requests drained (flush logs etc.).
+    watcher: KnowledgeBaseWatcher; in processes mode it polls in the parent only and a
+    reload triggers a rolling worker restart.
+    """
+    options = serving_config(config)
+    host, port = options["host"], options["port"]
+
+    if options["mode"] == "dev":
+        app.run(host=host, port=port)
+        return
+
+    if options["mode"] == "threads":
+        server = PooledWSGIServer(host, port, app, options["threads"])
+        print(f"🌀 Serving on {host}:{port} with {options['threads']} threads")
+        _serve_forever(server, options, on_stopped)
+        return
+
+    if options["mode"] == "processes":
+        _serve_processes(app, options, on_worker_start, on_stopped, watcher)
+        return
+
+    raise ValueError(f"Unknown serving mode: {options['mode']}")
+
+def _serve_processes(app, options, on_worker_start, on_stopped, watcher=None):
+    """
+    Pre-fork mode: the parent holds the loaded, warmed knowledge base and forks
+    workers that share it copy-on-write. gc.freeze() moves everything loaded so far
+    out of the collector's reach, so collections in a worker never touch (and
+    copy) the shared pages. With a watcher, only the parent polls for changes;
+    a reload restarts the workers one at a time so they fork from the new state.
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((options["host"], options["port"]))
+    listener.listen(128)
+    listener.set_inheritable(True)
+
+    reloaded = threading.Event()
+    if watcher is not None:
+        watcher.poll_in_children = False
+        previous_on_swap = watcher.on_swap
+
+        def _on_swap(old, new):
+            if previous_on_swap:
+                previous_on_swap(old, new)
+            reloaded.set()
+        watcher.on_swap = _on_swap
+
+    def spawn():
+        gc.collect()
+        gc.freeze()
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                if on_worker_start:
+                    on_worker_start()
+                server = PooledWSGIServer(options["host"], options["port"], app, options["threads"], fd=listener.fileno())
+                tracker.boot_ms = round((time.perf_counter() - forked_at) * 1000, 2)
+                _serve_forever(server, options, on_stopped)
+            except Exception as e:
+                print(f"⚠️ Worker {os.getpid()} crashed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    workers = {spawn() for _ in range(options["processes"])}
+    print(f"🌀 Serving on {options['host']}:{options['port']} with {len(workers)} processes × {options['threads']} threads")
+
+    stopping = threading.Event()
+
+    def _handle_signal(signum, frame):
+        stopping.set()
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+
+    retiring = set()
+    while workers:
+        if reloaded.is_set() and not stopping.is_set() and not retiring:
+            reloaded.clear()
+            print(f"🔄 Restarting {len(workers)} worker(s) on the reloaded knowledge base")
+            retiring = set(workers)
+        # Rolling restart: one replacement at a time, so capacity never drops by more than one worker.
+        if retiring and not stopping.is_set() and len(workers) <= options["processes"]:
+            pid = retiring.pop()
+            workers.add(spawn())
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        workers.discard(pid)
+        retiring.discard(pid)
+        # A retired worker's replacement is already running; anything else is a crash.
+        if not stopping.is_set() and len(workers) < options["processes"]:
+            print(f"⚠️ Worker {pid} exited (status {status}); restarting")
+            workers.add(spawn())
+
+    listener.close()
+
+
+# === Memory Reporting ===
+def process_memory():
+    """
+    RSS of this process in MB, split into pages shared with other processes and
+    private ones (Linux /proc/self/smaps_rollup); just the peak RSS elsewhere.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            # The first line is the address-range header, then "Name:   123 kB" lines.
+            fields = dict(line.split(":", 1) for line in f.readlines()[1:] if ":" in line)
+    except OSError:
+        import resource
+        return {"max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+    def mb(*names):
+        return round(sum(int(fields[name].split()[0]) for name in names if name in fields) / 1024, 1)
+
+    return {
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "shared_mb": mb("Shared_Clean", "Shared_Dirty"),
+        "private_mb": mb("Private_Clean", "Private_Dirty")
+    }
@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from metrics import SESSION_STAGES
+
+# === Defaults ===
+# Mirrors the session_state section of copilot_config.yaml.
+DEFAULT_SESSION_STATE_CONFIG = {
+    "enabled": True,
+    "max_sessions": 1024,
+    "ttl_seconds": 1800
+}
+
+# Requests without a user id share this one; they are not memoized.
+ANONYMOUS_USER = "anonymous"
+
+
+# === User Session ===
+class UserSession:
+    """
+    Inputs and output of every pipeline stage from one user's previous turn.
+    A stage whose inputs equal last turn's returns the remembered output instead
+    of running again. Outputs are shared between turns, so callers must not mutate them.
+    """
+
+    def __init__(self, kb_version):
+        self.kb_version = kb_version
+        self.touched = time.time()
+        self._stages = {}   # {stage: (inputs, output)}
+        self._lock = threading.Lock()
+
+    def stage(self, name, inputs, compute):
+        """compute()'s result for inputs, reusing last turn's when the inputs are unchanged."""
+        with self._lock:
+            entry = self._stages.get(name)
+        if entry is not None and entry[0] == inputs:
+            SESSION_STAGES.inc(stage=name, outcome="reused")
+            return entry[1]
+        output = compute()
+        with self._lock:
+            self._stages[name] = (inputs, output)
+        SESSION_STAGES.inc(stage=name, outcome="computed")
+        return output
+
+
+# === Session States ===
+class SessionStates:
+    """
+    Per-user UserSession objects in an LRU of at most max_sessions. A session idle
+    longer than ttl_seconds, or built against another knowledge-base version, starts empty.
+    """
+
+    def __init__(self, max_sessions=1024, ttl_seconds=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        options = dict(DEFAULT_SESSION_STATE_CONFIG)
+        options.update((config or {}).get("session_state", {}))
+        options.pop("enabled")
+        return cls(**options)
+
+    def session(self, user_id, kb_version):
+        """The user's session, or None for anonymous requests."""
+        if not user_id or user_id == ANONYMOUS_USER:
+            return None
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None or session.kb_version != kb_version or now - session.touched > self.ttl:
+                session = self._sessions[user_id] = UserSession(kb_version)
+            session.touched = now
+            self._sessions.move_to_end(user_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def forget(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "evictions": self.evictions}
+
+
+# === Stage Helper ===
+def run_stage(session, name, inputs, compute):
+    """session.stage(), or just compute() when there is no session."""
+    if session is None:
+        return compute()
+    return session.stage(name, inputs, compute)
+
+
+# === Shared Instance ===
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_session_states(config=None):
+    """Returns the process-wide session states, or None when session_state.enabled is false."""
+    global _shared
+    if not (config or {}).get("session_state", {}).get("enabled", DEFAULT_SESSION_STATE_CONFIG["enabled"]):
+        return None
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = SessionStates.from_config(config)
+    return _shared
+
+def _reset_lock_after_fork():
+    # A lock held by another thread at fork time would stay locked in the child.
+    global _shared_lock
+    _shared_lock = threading.Lock()
+    if _shared is not None:
+        _shared._lock = threading.Lock()
+        for session in _shared._sessions.values():
+            session._lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
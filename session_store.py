@@ -0,0 +1,369 @@
+import os
+import csv
+import sys
+import time
+import sqlite3
+import functools
+import argparse
+import threading
+from datetime import datetime
+from metrics import FILE_READS
+
+# === Defaults ===
+# Mirrors the session_store section of copilot_config.yaml.
+DEFAULT_SESSION_STORE_CONFIG = {
+    "enabled": False,
+    "path": ".cache/sessions.db",
+    "page_size": 100,
+    "busy_timeout_seconds": 5.0
+}
+
+# Column layout of the session log CSV (classification_copilot_0210.csv); kept
+# in step with reflex_logic.SESSION_LOG_HEADER so exports open in the old viewers.
+CSV_COLUMNS = [
+    "timestamp", "session_id", "actor", "actor_wheel_state", "reflex_wheel_state",
+    "reflex_type", "class_code", "archetype_variant",
+    "containment_required", "progressive"
+]
+
+# Older logs (classification.csv) name the actor's wheel state "wheel_state".
+COLUMN_ALIASES = {"wheel_state": "actor_wheel_state", "user": "user_id"}
+
+# Rows classification.write_classification_output appends to classification.csv.
+# That file's header also names a session_id column its rows never carry, so
+# such rows are read by position.
+CLASSIFICATION_LOG_COLUMNS = [
+    "timestamp", "actor", "actor_wheel_state", "reflex_type", "class_code",
+    "archetype_variant", "containment_required", "progressive"
+]
+
+# Timestamp layouts the engine has written over time.
+TIMESTAMP_FORMATS = ("%a %b %d, %Y (%H:%M)", "%a %b %d %Y (%H:%M)")
+
+FILTERS = ("user_id", "actor", "class_code")
+
+# SQLite appends the rowid to every index, so the single-column indexes below
+# already hand back a user's/actor's/class code's rows in insertion (id) order:
+# filtered newest-first pages need no sort.
+# class_code_counts keeps running totals per user/actor/class code for the summaries.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    ts REAL,
+    timestamp TEXT,
+    session_id TEXT,
+    user_id TEXT,
+    actor TEXT,
+    actor_wheel_state TEXT,
+    reflex_wheel_state TEXT,
+    reflex_type TEXT,
+    class_code TEXT,
+    archetype_variant TEXT,
+    containment_required TEXT,
+    progressive TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_ts ON sessions (ts);
+CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id);
+CREATE INDEX IF NOT EXISTS sessions_actor ON sessions (actor);
+CREATE INDEX IF NOT EXISTS sessions_class ON sessions (class_code);
+CREATE TABLE IF NOT EXISTS class_code_counts (
+    user_id TEXT,
+    actor TEXT,
+    class_code TEXT,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, actor, class_code)
+);
+"""
+
+ROW_COLUMNS = ["ts", "timestamp", "session_id", "user_id"] + CSV_COLUMNS[2:]
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_timestamp(value):
+    """Epoch seconds for a logged timestamp ("Generated on ..." prefixes allowed), or None."""
+    text = (value or "").strip()
+    if text.startswith("Generated on "):
+        text = text[len("Generated on "):]
+    for layout in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, layout).timestamp()
+        except ValueError:
+            continue
+    return None
+
+def _epoch(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+# === Session Store ===
+class SessionStore:
+    """
+    Embedded SQLite store (WAL mode) for session rows, indexed by user, timestamp,
+    actor and class code. Rows are appended by the log writer thread; any thread
+    can query, each through its own connection.
+    """
+
+    def __init__(self, path=".cache/sessions.db", page_size=100, busy_timeout_seconds=5.0):
+        self.path = path
+        self.page_size = page_size
+        self.busy_timeout = busy_timeout_seconds
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    @classmethod
+    def from_config(cls, config):
+        options = dict(DEFAULT_SESSION_STORE_CONFIG)
+        options.update((config or {}).get("session_store") or {})
+        options.pop("enabled")
+        return cls(**options)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # === Writes ===
+    def append_rows(self, rows):
+        """Inserts session rows (dicts with the CSV columns plus user_id) in one transaction."""
+        values = []
+        counts = {}
+        for row in rows:
+            record = [_text(row.get(column)) for column in ROW_COLUMNS]
+            record[0] = row.get("ts") or parse_timestamp(record[1])
+            values.append(record)
+            # user_id, actor, class_code
+            key = (record[3], record[4], record[8])
+            counts[key] = counts.get(key, 0) + 1
+        if not values:
+            return 0
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                f"INSERT INTO sessions ({', '.join(ROW_COLUMNS)}) VALUES ({', '.join('?' * len(ROW_COLUMNS))})",
+                values)
+            connection.executemany(
+                "INSERT INTO class_code_counts VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, actor, class_code) DO UPDATE SET count = count + excluded.count",
+                [key + (number,) for key, number in counts.items()])
+        return len(values)
+
+    # === Queries ===
+    def _where(self, filters, since=None, until=None):
+        clauses, params = [], []
+        for column in FILTERS:
+            value = filters.get(column)
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(_epoch(since))
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(_epoch(until))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, user_id=None, actor=None, class_code=None, since=None, until=None,
+              limit=None, before_id=None):
+        """
+        Newest-first page of rows matching the filters. Pass the returned cursor as
+        before_id to fetch the next page; (rows, None) means there are no more.
+        Keyset paging keeps deep pages as cheap as the first one.
+        """
+        limit = limit or self.page_size
+        where, params = self._where({"user_id": user_id, "actor": actor, "class_code": class_code}, since, until)
+        if before_id is not None:
+            where += (" AND " if where else " WHERE ") + "id < ?"
+            params.append(before_id)
+        cursor = self._connection().execute(
+            f"SELECT * FROM sessions{where} ORDER BY id DESC LIMIT ?", params + [limit + 1])
+        rows = [dict(row) for row in cursor]
+        FILE_READS.inc(source="session_store")
+        if len(rows) > limit:
+            return rows[:limit], rows[limit - 1]["id"]
+        return rows, None
+
+    def count(self, user_id=None, actor=None, class_code=None, since=None, until=None):
+        where, params = self._where({"user_id": user_id, "actor": actor, "class_code": class_code}, since, until)
+        return self._connection().execute(f"SELECT COUNT(*) FROM sessions{where}", params).fetchone()[0]
+
+    def class_code_counts(self, user_id=None, actor=None, class_code=None, since=None, until=None):
+        """
+        {actor: {class_code: count}} over the matching rows. Without a time range the
+        counts come from the running totals kept on insert instead of a table scan.
+        """
+        if since is None and until is None:
+            where, params = self._where({"user_id": user_id, "actor": actor, "class_code": class_code})
+            sql = f"SELECT actor, class_code, SUM(count) FROM class_code_counts{where} GROUP BY actor, class_code"
+        else:
+            where, params = self._where({"user_id": user_id, "actor": actor, "class_code": class_code}, since, until)
+            sql = f"SELECT actor, class_code, COUNT(*) FROM sessions{where} GROUP BY actor, class_code"
+        counts = {}
+        cursor = self._connection().execute(sql, params)
+        for actor, class_code, number in cursor:
+            counts.setdefault(actor, {})[class_code] = number
+        return counts
+
+    # === Import / Export ===
+    def import_csv(self, path, user_id="anonymous", batch_size=10000):
+        """
+        Appends every row of a session or classification log CSV. Returns the row count.
+        Rows whose field count matches neither the header nor the classification log
+        layout are skipped and reported.
+        """
+        imported = 0
+        skipped = []
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return 0
+            columns = [COLUMN_ALIASES.get(name.strip(), name.strip()) for name in header]
+            classification_log = set(CLASSIFICATION_LOG_COLUMNS) <= set(columns)
+            batch = []
+            for values in reader:
+                if not any(value.strip() for value in values):
+                    continue
+                if len(values) == len(columns):
+                    row = dict(zip(columns, values))
+                elif classification_log and len(values) == len(CLASSIFICATION_LOG_COLUMNS):
+                    row = dict(zip(CLASSIFICATION_LOG_COLUMNS, values))
+                else:
+                    skipped.append(reader.line_num)
+                    continue
+                row.setdefault("user_id", user_id)
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    imported += self.append_rows(batch)
+                    batch = []
+            imported += self.append_rows(batch)
+        FILE_READS.inc(source="session_store")
+        if skipped:
+            print(f"⚠️ Skipped {len(skipped)} row(s) of {path} matching neither its header nor the "
+                  f"classification log layout (first at line {skipped[0]})")
+        return imported
+
+    def export_csv(self, path, user_id=None, actor=None, class_code=None, since=None, until=None):
+        """Writes the matching rows, oldest first, in the session log CSV layout."""
+        where, params = self._where({"user_id": user_id, "actor": actor, "class_code": class_code}, since, until)
+        cursor = self._connection().execute(
+            f"SELECT {', '.join(CSV_COLUMNS)} FROM sessions{where} ORDER BY id", params)
+        exported = 0
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            for row in cursor:
+                writer.writerow(row)
+                exported += 1
+        return exported
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def _text(value):
+    # str() like csv.writer, so exported rows read exactly as the CSV log would.
+    return None if value is None else str(value)
+
+
+# === Shared Instance ===
+_shared = {}
+_shared_lock = threading.Lock()
+
+def get_session_store(config=None):
+    """Returns the process-wide store for the configured path, or None when session_store.enabled is false."""
+    options = dict(DEFAULT_SESSION_STORE_CONFIG)
+    options.update((config or {}).get("session_store") or {})
+    if not options["enabled"]:
+        return None
+    store = _shared.get(options["path"])
+    if store is None:
+        with _shared_lock:
+            store = _shared.get(options["path"])
+            if store is None:
+                store = _shared[options["path"]] = SessionStore.from_config(config)
+    return store
+
+def _forget_after_fork():
+    # SQLite connections must not cross fork(); the child opens its own.
+    global _shared, _shared_lock
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_forget_after_fork)
+
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import, export and query the SQLite session store.")
+    parser.add_argument("--db", help="Store path (default: session_store.path from the config)")
+    parser.add_argument("--config", default="copilot_config.yaml")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Append existing session log CSVs")
+    importer.add_argument("files", nargs="+")
+    importer.add_argument("--user-id", default="anonymous", help="user_id for rows that carry none")
+
+    exporter = commands.add_parser("export", help="Write rows back to the session log CSV layout")
+    exporter.add_argument("output")
+
+    query = commands.add_parser("query", help="Print the newest matching rows")
+    query.add_argument("--limit", type=int, default=20)
+
+    for command in (exporter, query):
+        command.add_argument("--user-id")
+        command.add_argument("--actor")
+        command.add_argument("--class-code")
+        command.add_argument("--since", help="ISO date/time")
+        command.add_argument("--until", help="ISO date/time")
+    args = parser.parse_args(argv)
+
+    from kb_watcher import load_config_snapshot
+    config, _ = load_config_snapshot(args.config)
+    options = dict(DEFAULT_SESSION_STORE_CONFIG)
+    options.update(config.get("session_store") or {})
+    options.pop("enabled")
+    if args.db:
+        options["path"] = args.db
+    store = SessionStore(**options)
+
+    if args.command == "import":
+        for path in args.files:
+            start = time.perf_counter()
+            imported = store.import_csv(path, user_id=args.user_id)
+            print(f"✅ Imported {imported} rows from {path} in {time.perf_counter() - start:.1f} s")
+        return 0
+
+    filters = {"user_id": args.user_id, "actor": args.actor, "class_code": args.class_code,
+               "since": args.since, "until": args.until}
+    if args.command == "export":
+        exported = store.export_csv(args.output, **filters)
+        print(f"✅ Exported {exported} rows to {args.output}")
+        return 0
+
+    rows, _ = store.query(limit=args.limit, **filters)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["id", "user_id"] + CSV_COLUMNS)
+    for row in rows:
+        writer.writerow([row["id"], row["user_id"]] + [row[column] for column in CSV_COLUMNS])
+    print(f"📊 {len(rows)} of {store.count(**filters)} matching rows")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
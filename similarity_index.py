@@ -0,0 +1,226 @@
+import re
+import sys
+import math
+import time
+import heapq
+import argparse
+from collections import Counter, namedtuple
+from knowledge_base import register_warmer, FEMALE_VOICE_WHEEL, MALE_EXPECTATION_MAPS, CROSS_MAP_MATRIX
+
+# === Optional Vectorized Backend ===
+try:
+    import numpy as np
+    from scipy import sparse
+    vectorized_available = True
+except ImportError:
+    vectorized_available = False
+
+# === Indexed Entries ===
+# (kind, tables, key columns, label column, text columns). Mismatch keys join
+# Voice_ID and Expectation_ID as "F001/M002".
+ENTRY_SOURCES = [
+    ("voice", (FEMALE_VOICE_WHEEL,), ("Voice_ID",), "Emotion",
+     ("Emotion", "Suppressed_Need", "Relational_Context", "Emotional_Reflex_Trigger",
+      "Micro-Contexts", "Voice Variants", "Somatic Expression")),
+    ("expectation", MALE_EXPECTATION_MAPS, ("Expectation_ID",), "Behavior_Expected",
+     ("Behavior_Expected", "Emotional_Reward", "Relational_Assumption", "Trigger",
+      "Micro-Contexts", "Voice Variants", "Somatic Expression")),
+    ("mismatch", (CROSS_MAP_MATRIX,), ("Voice_ID", "Expectation_ID"), "Mismatch_Type",
+     ("Mismatch_Type", "Reflex_Triggered", "Narrative_Tension", "Reflex_Complexity"))
+]
+
+KINDS = tuple(source[0] for source in ENTRY_SOURCES)
+NGRAM_SIZES = (3, 4)
+DEFAULT_TOP_K = 3
+
+SimilarityMatch = namedtuple("SimilarityMatch", ["kind", "key", "label", "score"])
+
+_WORD = re.compile(r"\w+")
+
+
+# === Character N-Grams ===
+def ngrams(text):
+    """Character n-grams of each lowercased word, padded with spaces so word edges count."""
+    for word in _WORD.findall((text or "").lower()):
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                yield padded[i:i + n]
+
+
+# === Similarity Index ===
+class SimilarityIndex:
+    """
+    TF-IDF over character n-grams of every voice-wheel, expectation-map and
+    cross-map entry, rows L2-normalized so a dot product is the cosine similarity.
+    With numpy/scipy the entries are one sparse matrix and a query (or a batch of
+    them) is scored against every entry in a single sparse product; without them
+    scores are accumulated from per-n-gram postings.
+    """
+
+    def __init__(self, spans, keys, labels, documents):
+        self.spans = spans          # {kind: (first entry, stop)}
+        self.keys = keys
+        self.labels = labels
+        self.vocabulary = {}
+        document_frequency = Counter()
+        for counts in documents:
+            for gram in counts:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+            document_frequency.update(counts.keys())
+        total = len(documents)
+        self.idf = [0.0] * len(self.vocabulary)
+        for gram, column in self.vocabulary.items():
+            self.idf[column] = math.log((1 + total) / (1 + document_frequency[gram])) + 1
+
+        rows = [self._normalize({self.vocabulary[gram]: n for gram, n in counts.items()}) for counts in documents]
+        if vectorized_available:
+            # Stored transposed (n-grams x entries) so queries @ matrix gives queries x entries.
+            self._matrix = self._sparse(rows).T.tocsr()
+            self._postings = None
+        else:
+            self._matrix = None
+            self._postings = {}
+            for entry, weights in enumerate(rows):
+                for column, weight in weights.items():
+                    self._postings.setdefault(column, []).append((entry, weight))
+
+    def __len__(self):
+        return len(self.keys)
+
+    # === Weighting ===
+    def _normalize(self, counts):
+        """{column: count} -> L2-normalized sublinear TF-IDF weights."""
+        weights = {column: (1 + math.log(n)) * self.idf[column] for column, n in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {column: w / norm for column, w in weights.items()} if norm else {}
+
+    def vectorize(self, text):
+        """Query weights over the known n-grams; n-grams no entry contains are ignored."""
+        counts = Counter(self.vocabulary.get(gram) for gram in ngrams(text))
+        counts.pop(None, None)
+        return self._normalize(counts)
+
+    def _sparse(self, rows):
+        indptr, indices, data = [0], [], []
+        for weights in rows:
+            indices.extend(weights.keys())
+            data.extend(weights.values())
+            indptr.append(len(indices))
+        return sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), indptr),
+                                 shape=(len(rows), len(self.vocabulary)))
+
+    # === Scoring ===
+    def top_k(self, text, k=DEFAULT_TOP_K, kinds=KINDS):
+        """{kind: [SimilarityMatch, ...]} best first; entries sharing no n-gram with text are left out."""
+        return self.top_k_batch([text], k, kinds)[0]
+
+    def top_k_batch(self, texts, k=DEFAULT_TOP_K, kinds=KINDS):
+        """top_k for every text, scored together."""
+        queries = [self.vectorize(text) for text in texts]
+        if self._matrix is not None:
+            return self._top_k_vectorized(queries, k, kinds)
+        return [self._top_k_postings(query, k, kinds) for query in queries]
+
+    def _top_k_vectorized(self, queries, k, kinds):
+        scores = (self._sparse(queries) @ self._matrix).toarray()
+        results = [{} for _ in queries]
+        for kind in kinds:
+            start, stop = self.spans.get(kind, (0, 0))
+            count = min(k, stop - start)
+            if count <= 0:
+                for result in results:
+                    result[kind] = []
+                continue
+            block = scores[:, start:stop]
+            top = np.argpartition(-block, count - 1, axis=1)[:, :count]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            # Best score first, ties by table order.
+            order = np.lexsort((top, -top_scores), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for result, entries, entry_scores in zip(results, top.tolist(), top_scores.tolist()):
+                result[kind] = [self._match(kind, start + entry, score)
+                                for entry, score in zip(entries, entry_scores) if score > 0]
+        return results
+
+    def _top_k_postings(self, query, k, kinds):
+        scores = {}
+        for column, weight in query.items():
+            for entry, entry_weight in self._postings.get(column, ()):
+                scores[entry] = scores.get(entry, 0.0) + weight * entry_weight
+        result = {}
+        for kind in kinds:
+            start, stop = self.spans.get(kind, (0, 0))
+            candidates = ((score, entry) for entry, score in scores.items() if start <= entry < stop)
+            best = heapq.nsmallest(k, candidates, key=lambda pair: (-pair[0], pair[1]))
+            result[kind] = [self._match(kind, entry, score) for score, entry in best if score > 0]
+        return result
+
+    def _match(self, kind, entry, score):
+        return SimilarityMatch(kind, self.keys[entry], self.labels[entry], round(float(score), 4))
+
+
+# === Building ===
+def build_similarity_index(kb):
+    spans, keys, labels, documents = {}, [], [], []
+    for kind, tables, key_columns, label_column, text_columns in ENTRY_SOURCES:
+        start = len(keys)
+        for table in tables:
+            for row in kb.rows(table):
+                key = "/".join((row.get(column) or "").strip() for column in key_columns)
+                if not key.strip("/"):
+                    continue
+                keys.append(key)
+                labels.append((row.get(label_column) or "").strip())
+                documents.append(Counter(ngrams(" ".join(row.get(column) or "" for column in text_columns))))
+        spans[kind] = (start, len(keys))
+    return SimilarityIndex(spans, keys, labels, documents)
+
+@register_warmer
+def get_similarity_index(kb):
+    return kb.derive("similarity_index", build_similarity_index)
+
+def similar_entries(kb, voice_input, k=DEFAULT_TOP_K):
+    """Closest voice-wheel, expectation-map and cross-map entries for voice_input, as plain dicts."""
+    matches = get_similarity_index(kb).top_k(voice_input, k)
+    return {kind: [match._asdict() for match in found] for kind, found in matches.items()}
+
+
+# === CLI ===
+def main(argv=None):
+    from knowledge_base import KnowledgeBase
+    from kb_watcher import load_config_snapshot
+
+    parser = argparse.ArgumentParser(description="Show the voice-wheel, expectation and cross-map entries closest to a text.")
+    parser.add_argument("text", nargs="?", help="Voice input to score")
+    parser.add_argument("--file", help="Score every line of this file as one batch instead")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--config", default="copilot_config.yaml")
+    parser.add_argument("--root", default=".")
+    args = parser.parse_args(argv)
+    if not args.text and not args.file:
+        parser.error("give a text or --file")
+
+    config, _ = load_config_snapshot(args.config)
+    index = get_similarity_index(KnowledgeBase.from_config(config, root=args.root))
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = [args.text]
+
+    started = time.perf_counter()
+    results = index.top_k_batch(texts, args.top_k)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for text, result in zip(texts, results):
+        print(f"🔎 {text}")
+        for kind in KINDS:
+            for match in result[kind]:
+                print(f"  {kind:<12} {match.key:<10} {match.score:.3f}  {match.label}")
+    backend = "sparse matrix" if vectorized_available else "postings"
+    print(f"✅ Scored {len(texts)} inputs against {len(index)} entries in {elapsed_ms:.2f} ms ({backend})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+from collections import deque, namedtuple
+from knowledge_base import register_warmer, TRANSMISSION_MAP, WHEEL_CODEX, LINGUISTIC_REFRAME_MAP
+
+# === Pattern Records ===
+# target: which text the pattern is matched against ("voice" or "background").
+# case_sensitive: codex notes are matched verbatim, transmission triggers and
+# reframe phrases case-insensitively, mirroring the original substring checks.
+Trigger = namedtuple("Trigger", ["source", "field", "row", "phrase", "target", "case_sensitive"])
+TriggerMatch = namedtuple("TriggerMatch", ["source", "field", "row", "phrase", "start"])
+
+# (table, column, target, case_sensitive)
+TRIGGER_FIELDS = [
+    (TRANSMISSION_MAP, "trigger", "voice", False),
+    (WHEEL_CODEX, "notes", "voice", True),
+    (WHEEL_CODEX, "rupture_trigger", "background", True),
+    (LINGUISTIC_REFRAME_MAP, "phrase", "voice", False)
+]
+
+
+# === Aho-Corasick Automaton ===
+class TriggerScanner:
+    """
+    Multi-pattern matcher over lowercased text.
+    One scan walks the text once and reports every pattern occurrence, so the
+    cost depends on text length and number of matches, not on pattern count.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self.always = []
+
+    def add(self, trigger):
+        phrase = trigger.phrase.lower()
+        if not phrase:
+            # An empty pattern is a substring of every text.
+            self.always.append(trigger)
+            return
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][ch] = nxt
+            node = nxt
+        self._out[node].append((len(phrase), trigger))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                state = self._fail[node]
+                while state and ch not in self._goto[state]:
+                    state = self._fail[state]
+                self._fail[child] = self._goto[state].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        return self
+
+    def scan(self, text, target):
+        """Yields (start, trigger) for every pattern of the given target found in text."""
+        for trigger in self.always:
+            if trigger.target == target:
+                yield 0, trigger
+
+        lowered = text.lower()
+        # str.lower() can change length for a few code points, so offsets in lowered
+        # no longer line up with text. Case-sensitive patterns the automaton hits are
+        # then located in text itself, once per real occurrence.
+        aligned = len(lowered) == len(text)
+        unaligned_hits = []
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(lowered):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, trigger in out[node]:
+                if trigger.target != target:
+                    continue
+                start = i - length + 1
+                if trigger.case_sensitive:
+                    if not aligned:
+                        if trigger not in unaligned_hits:
+                            unaligned_hits.append(trigger)
+                        continue
+                    if text[start:i + 1] != trigger.phrase:
+                        continue
+                yield start, trigger
+
+        for trigger in unaligned_hits:
+            start = text.find(trigger.phrase)
+            while start != -1:
+                yield start, trigger
+                start = text.find(trigger.phrase, start + 1)
+
+
+# === Builder ===
+def _clean_phrase(table, phrase):
+    if table == LINGUISTIC_REFRAME_MAP:
+        # Reframe phrases are templates like "…so that we can…".
+        return phrase.replace("…", " ").replace("...", " ").strip()
+    return phrase
+
+def build_trigger_scanner(kb):
+    scanner = TriggerScanner()
+    for table, field, target, case_sensitive in TRIGGER_FIELDS:
+        for i, row in enumerate(kb.rows(table)):
+            phrase = _clean_phrase(table, row.get(field) or "")
+            if not case_sensitive:
+                phrase = phrase.strip()
+                if not phrase:
+                    continue
+            scanner.add(Trigger(table, field, i, phrase, target, case_sensitive))
+    return scanner.build()
+
+@register_warmer
+def get_trigger_scanner(kb):
+    return kb.derive("trigger_scanner", build_trigger_scanner)
+
+
+# === Scanning ===
+def scan_triggers(kb, voice_input, background=""):
+    """
+    Finds every trigger, codex note and reframe phrase in the inputs.
+    Returns: {table name: [TriggerMatch, ...]} for tables with at least one match.
+    """
+    scanner = get_trigger_scanner(kb)
+    matches = {}
+    for target, text in (("voice", voice_input or ""), ("background", background or "")):
+        for start, trigger in scanner.scan(text, target):
+            matches.setdefault(trigger.source, []).append(
+                TriggerMatch(trigger.source, trigger.field, trigger.row, trigger.phrase, start)
+            )
+    return matches
+
+def matched_rows(matches, table, field=None):
+    """Returns the sorted row indexes of a table that had at least one match."""
+    return sorted({m.row for m in matches.get(table, []) if field is None or m.field == field})
@@ -0,0 +1,281 @@
+import io
+import os
+import sys
+import argparse
+import csv
+import json
+import threading
+from metrics import FILE_READS
+
+# === Defaults ===
+DEFAULT_HISTORY_ROOT = ".cache/history"
+HISTORY_KINDS = ("voice_input", "background", "storyline")
+
+
+# === Transposed Format ===
+# The downloadable .txt layout: row 0 holds one version label per column (newest
+# first), row i holds field i of every version. Cells are CSV-quoted as needed,
+# so commas and quotes inside a field survive the round trip. Every column is as
+# deep as the longest version, so a shorter version comes back padded with "".
+def parse_transposed(text):
+    """
+    [(version, fields)] newest first. Fields are kept verbatim, including the empty
+    cells format_transposed pads short versions with; short rows end a column early.
+    """
+    if not text:
+        return []
+    rows = list(csv.reader(io.StringIO(text, newline=""), delimiter=",", quotechar='"'))
+    if len(rows) < 2:
+        return []
+    versions = []
+    for column, version in enumerate(rows[0]):
+        versions.append((version, [row[column] for row in rows[1:] if column < len(row)]))
+    return versions
+
+def format_transposed(versions):
+    """
+    Transposed text for [(version, fields)], columns newest first. Shorter versions
+    are padded with empty cells, which parse_transposed returns as "" fields.
+    """
+    if not versions:
+        return ""
+    depth = max(len(fields) for _, fields in versions)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([version for version, _ in versions])
+    for i in range(depth):
+        writer.writerow([fields[i] if i < len(fields) else "" for _, fields in versions])
+    return buffer.getvalue()
+
+
+# === Version Store ===
+class VersionStore:
+    """
+    Append-only history of one input kind: one JSON record per version in
+    <path>, plus <path>.idx with one "offset<TAB>length<TAB>label" line per record.
+    Saving a version appends one record; reading one version seeks straight to it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self._entries = []        # (offset, length, version), oldest first
+        self._index_size = None
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # === Index ===
+    def _refresh(self):
+        """Reloads the offset index if another writer changed it, repairing a torn tail."""
+        try:
+            index_size = os.path.getsize(self.index_path)
+        except OSError:
+            index_size = 0
+        if index_size == self._index_size:
+            return
+        entries = []
+        if index_size:
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t", 2)
+                    if len(parts) == 3 and line.endswith("\n"):
+                        entries.append((int(parts[0]), int(parts[1]), json.loads(parts[2])))
+            FILE_READS.inc(source="version_store")
+        self._entries = entries
+        self._index_size = index_size
+        self._recover()
+
+    def _recover(self):
+        # A crash can leave index entries past the end of the records, or records
+        # that never made it into the index; drop the former and index the latter.
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        while self._entries and sum(self._entries[-1][:2]) > size:
+            self._entries.pop()
+        end = sum(self._entries[-1][:2]) if self._entries else 0
+        if end >= size:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(end)
+            offset = end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    version = json.loads(line)["version"]
+                except (ValueError, KeyError):
+                    break
+                self._entries.append((offset, len(line), version))
+                offset += len(line)
+        self._write_index()
+
+    def _write_index(self):
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for offset, length, version in self._entries:
+                f.write(f"{offset}\t{length}\t{json.dumps(version, ensure_ascii=False)}\n")
+        os.replace(temp_path, self.index_path)
+        self._index_size = os.path.getsize(self.index_path)
+
+    # === Writes ===
+    def append(self, version, fields):
+        """Stores one version. Only the new record and its index line are written."""
+        record = json.dumps({"version": version, "fields": list(fields)}, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            self._refresh()
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(record)
+            entry = (offset, len(record), version)
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(f"{offset}\t{len(record)}\t{json.dumps(version, ensure_ascii=False)}\n")
+            self._entries.append(entry)
+            self._index_size = os.path.getsize(self.index_path)
+        return len(self._entries)
+
+    def replace(self, versions):
+        """Rewrites the whole history from [(version, fields)] newest first, e.g. an uploaded file."""
+        with self._lock:
+            entries = []
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                for version, fields in reversed(versions):
+                    record = json.dumps({"version": version, "fields": list(fields)}, ensure_ascii=False).encode("utf-8") + b"\n"
+                    entries.append((f.tell(), len(record), version))
+                    f.write(record)
+            os.replace(temp_path, self.path)
+            self._entries = entries
+            self._write_index()
+
+    def merge(self, versions):
+        """
+        Appends, oldest first, each of [(version, fields)] (newest first) not already
+        stored with the same label and fields (trailing empty fields aside, as a
+        downloaded file pads them). Existing records are never rewritten, so readers
+        of the history keep everything they saw. Returns the count appended.
+        """
+        def key(version, fields):
+            fields = list(fields)
+            while fields and fields[-1] == "":
+                fields.pop()
+            return version, tuple(fields)
+
+        stored = {key(version, fields) for version, fields in self.all()}
+        added = 0
+        for version, fields in reversed(versions):
+            if key(version, fields) not in stored:
+                self.append(version, fields)
+                stored.add(key(version, fields))
+                added += 1
+        return added
+
+    # === Reads ===
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._entries)
+
+    def versions(self):
+        """Version labels, newest first. Reads only the index."""
+        with self._lock:
+            self._refresh()
+            return [version for _, _, version in reversed(self._entries)]
+
+    def _read(self, entry):
+        offset, length, _ = entry
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = json.loads(f.read(length))
+        FILE_READS.inc(source="version_store")
+        return record["version"], record["fields"]
+
+    def latest(self):
+        """(version, fields) of the newest record, or None."""
+        with self._lock:
+            self._refresh()
+            entry = self._entries[-1] if self._entries else None
+        return self._read(entry) if entry else None
+
+    def get(self, version):
+        """Fields of the newest record labelled version, or None."""
+        with self._lock:
+            self._refresh()
+            entry = next((entry for entry in reversed(self._entries) if entry[2] == version), None)
+        return self._read(entry)[1] if entry else None
+
+    def all(self):
+        """[(version, fields)] newest first."""
+        with self._lock:
+            self._refresh()
+            entries = list(self._entries)
+        if not entries:
+            return []
+        with open(self.path, "rb") as f:
+            data = f.read(sum(entries[-1][:2]))
+        FILE_READS.inc(source="version_store")
+        versions = []
+        for offset, length, _ in reversed(entries):
+            record = json.loads(data[offset:offset + length])
+            versions.append((record["version"], record["fields"]))
+        return versions
+
+    # === Converters ===
+    def import_transposed(self, text, replace=True):
+        """
+        Loads the versions of a transposed .txt file: replacing the history, or with
+        replace=False merging them into it (see merge). Returns the count imported.
+        """
+        versions = parse_transposed(text)
+        if not replace:
+            return self.merge(versions)
+        self.replace(versions)
+        return len(versions)
+
+    def to_transposed(self):
+        """The whole history in the downloadable transposed .txt layout."""
+        return format_transposed(self.all())
+
+
+# === Per-User Histories ===
+# Histories of app sessions that never set a user id, apart from named users'.
+SESSION_HISTORY_ROOT = os.path.join(DEFAULT_HISTORY_ROOT, "sessions")
+
+def history_path(user_id, kind, root=DEFAULT_HISTORY_ROOT):
+    safe_user = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(user_id)) or "anonymous"
+    if not safe_user.strip("."):
+        # "." and ".." would resolve to the history root or above it.
+        safe_user = "_" + safe_user
+    return os.path.join(root, safe_user, f"{kind}.jsonl")
+
+def user_histories(user_id, root=DEFAULT_HISTORY_ROOT):
+    """{kind: VersionStore} for voice_input, background and storyline of one user."""
+    return {kind: VersionStore(history_path(user_id, kind, root)) for kind in HISTORY_KINDS}
+
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a user's history to and from the transposed .txt format.")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("file", help="Transposed .txt file to read (import) or write (export)")
+    parser.add_argument("--user-id", default="user_001")
+    parser.add_argument("--kind", choices=HISTORY_KINDS, required=True)
+    parser.add_argument("--root", default=DEFAULT_HISTORY_ROOT)
+    args = parser.parse_args(argv)
+
+    store = VersionStore(history_path(args.user_id, args.kind, args.root))
+    if args.command == "import":
+        with open(args.file, encoding="utf-8", newline="") as f:
+            count = store.import_transposed(f.read())
+        print(f"✅ Imported {count} versions into {store.path}")
+    else:
+        with open(args.file, "w", encoding="utf-8", newline="") as f:
+            f.write(store.to_transposed())
+        print(f"✅ Exported {len(store)} versions to {args.file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())